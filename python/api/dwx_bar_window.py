@@ -0,0 +1,135 @@
+
+from array import array
+
+
+"""Rolling bar window
+
+Keeps the last size closed bars of one SYMBOL_TIMEFRAME in preallocated
+arrays (ring buffer) and the forming bar separately.
+
+Bars are dictionaries with time, open, high, low, close and tick_volume,
+as in dwx_client.bar_data. Index -1 is the last closed bar.
+
+"""
+
+
+class dwx_bar_window():
+
+    FIELDS = ('open', 'high', 'low', 'close', 'tick_volume')
+
+    def __init__(self, size):
+
+        self.size = size
+        self._columns = {field: array('d', [0.0]) * size for field in self.FIELDS}
+        self._times = [None] * size
+        # index of the oldest bar.
+        self._start = 0
+        self._count = 0
+        # current bar, if forming bars are published (publishFormingBars).
+        self.forming = None
+
+    def __len__(self):
+
+        return self._count
+
+    def _index(self, i):
+
+        if i < 0:
+            i += self._count
+        if i < 0 or i >= self._count:
+            raise IndexError('bar window index out of range')
+        return (self._start + i) % self.size
+
+    def __getitem__(self, i):
+
+        index = self._index(i)
+        bar = {field: self._columns[field][index] for field in self.FIELDS}
+        bar['time'] = self._times[index]
+        return bar
+
+    @property
+    def last_time(self):
+
+        return self._times[self._index(-1)] if self._count > 0 else None
+
+    """Returns the values of one field from the oldest to the newest bar.
+    """
+
+    def column(self, field):
+
+        if field == 'time':
+            return [self._times[self._index(i)] for i in range(self._count)]
+        column = self._columns[field]
+        return [column[self._index(i)] for i in range(self._count)]
+
+    def _set(self, index, time, bar):
+
+        for field in self.FIELDS:
+            self._columns[field][index] = bar[field]
+        self._times[index] = time
+
+    def append(self, time, bar):
+
+        if self._count < self.size:
+            index = (self._start + self._count) % self.size
+            self._count += 1
+        else:
+            # overwrite the oldest bar.
+            index = self._start
+            self._start = (self._start + 1) % self.size
+        self._set(index, time, bar)
+
+    """Fills the window from historic data (time -> bar). The last bar is
+    kept as forming bar, since it is usually not closed yet.
+    """
+
+    def seed(self, data):
+
+        times = sorted(data)
+        if len(times) == 0:
+            return
+        self._start = 0
+        self._count = 0
+        for time in times[-self.size - 1:-1]:
+            self.append(time, data[time])
+        self.forming = dict(data[times[-1]], time=times[-1])
+
+    """Adds a closed bar ("closed": true or no flag) or a forming bar
+    ("closed": false).
+
+    Returns:
+        list: Bars that were closed by this update.
+        bool: True if the forming bar changed.
+    """
+
+    def update(self, bar):
+
+        time = bar['time']
+        closed = []
+
+        # a newer bar means that the forming bar was closed, even if
+        # its closed bar was missed (or the last seeded bar was already closed).
+        if self.forming is not None and self.forming['time'] < time:
+            if self.last_time is None or self.forming['time'] > self.last_time:
+                self.append(self.forming['time'], self.forming)
+                closed.append(self[-1])
+            self.forming = None
+
+        if self.last_time is not None and time < self.last_time:
+            return closed, False
+
+        if bar.get('closed', True):
+            if time == self.last_time:
+                # more accurate values than the ones from the forming bar.
+                self._set(self._index(-1), time, bar)
+            else:
+                self.append(time, bar)
+                closed.append(self[-1])
+            if self.forming is not None and self.forming['time'] == time:
+                self.forming = None
+            return closed, False
+
+        if time == self.last_time:
+            return closed, False
+        self.forming = dict(bar)
+        return closed, True
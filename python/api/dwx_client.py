@@ -1,12 +1,73 @@
 
 import os
+import re
 import json
-from time import sleep
-from threading import Thread, Lock
-from os.path import join, exists
+from time import sleep, monotonic, time
+from queue import Queue
+from itertools import count
+from collections import deque, namedtuple
+from types import MappingProxyType
+from threading import Thread, Lock, Condition
+from concurrent.futures import Future, wait, FIRST_COMPLETED, CancelledError
+from os.path import exists
 from traceback import print_exc
 from datetime import datetime, timezone, timedelta
 
+from api.dwx_deal_store import dwx_deal_store
+from api.dwx_market_snapshot import dwx_market_snapshot
+from api.dwx_indicators import dwx_indicators
+from api.dwx_bar_window import dwx_bar_window
+from api.dwx_transport import dwx_file_transport
+from api.dwx_clock import dwx_clock
+from api.dwx_order_overlay import dwx_order_overlay
+
+
+"""Polling policy class
+
+Defines how often one channel (orders, messages, market_data, bar_data 
+or historic_data) is checked. The interval starts at min_interval and is 
+multiplied by backoff_factor every time the file did not change, up to 
+max_interval. As soon as a change is detected it drops back to min_interval. 
+
+If burst is True, the channel is polled every burst_interval seconds 
+(0 means busy-spinning) for burst_spin_seconds after a command was sent. 
+
+"""
+
+
+class poll_policy():
+
+    def __init__(self, min_interval=0.005, max_interval=None,
+                 backoff_factor=2.0, burst=False, burst_interval=0.0):
+
+        self.min_interval = min_interval
+        self.max_interval = min_interval if max_interval is None else max_interval
+        self.backoff_factor = backoff_factor
+        self.burst = burst
+        self.burst_interval = burst_interval
+
+    """Returns the interval to use after a poll. 
+    """
+
+    def next_interval(self, interval, changed):
+
+        if changed:
+            return self.min_interval
+        return min(interval * self.backoff_factor, self.max_interval)
+
+
+"""Snapshots
+
+Published by the client with one assignment, so that the values belong 
+to the same update. version is the version of the channel (see 
+dwx_client.versions). The data must not be modified. 
+
+"""
+
+orders_snapshot = namedtuple('orders_snapshot', ['version', 'account_info', 'open_orders'])
+tick_snapshot = namedtuple('tick_snapshot', ['version', 'symbol', 'values'])
+bar_snapshot = namedtuple('bar_snapshot', ['version', 'symbol', 'time_frame', 'bar'])
+
 
 """Client class
 
@@ -17,46 +78,83 @@ This class includes all of the functions needed for communication with MT4/MT5.
 
 class dwx_client():
 
+    POLL_CHANNELS = ['orders', 'messages', 'market_data',
+                     'bar_data', 'historic_data']
+    # polled instead of all POLL_CHANNELS if doorbell is True. 
+    DOORBELL_CHANNEL = 'doorbell'
+    # seconds between two checks of the stale_seconds watchdog.
+    STALE_CHECK_INTERVAL = 0.1
+    # max. sequence numbers per RESEND_MESSAGES command, so that the command files stay small.
+    MAX_RESEND_MESSAGES = 100
+
+    # commands that reduce risk are written to the high priority files, 
+    # which the mql server reads before all other command files. 
+    HIGH_PRIORITY_COMMANDS = ['CLOSE_ORDER', 'CLOSE_ALL_ORDERS',
+                              'CLOSE_ORDERS_BY_SYMBOL', 'CLOSE_ORDERS_BY_MAGIC',
+                              'MODIFY_ORDER', 'RESET_COMMAND_IDS']
+    # commands that are never delayed or rejected by the rate_limiter, 
+    # also if a limit is configured for them. MODIFY_ORDER is limited, 
+    # it could otherwise be sent on every tick. 
+    RATE_LIMIT_EXEMPT_COMMANDS = ['CLOSE_ORDER', 'CLOSE_ALL_ORDERS',
+                                  'CLOSE_ORDERS_BY_SYMBOL', 'CLOSE_ORDERS_BY_MAGIC',
+                                  'RESET_COMMAND_IDS']
+
     def __init__(self, event_handler=None, metatrader_dir_path='',
                  sleep_delay=0.005,             # 5 ms for time.sleep()
                  # retry to send the commend for 10 seconds if not successful.
                  max_retry_command_seconds=10,
                  # to load orders from file on initialization.
                  load_orders_from_file=True,
-                 verbose=True
+                 verbose=True,
+                 # dict of channel name -> poll_policy (or (min, max) tuple).
+                 # channels that are not given poll every sleep_delay seconds.
+                 poll_policies=None,
+                 # poll burst channels faster for X seconds after a command.
+                 burst_spin_seconds=0,
+                 # if False, nothing is started until connect() is called.
+                 auto_connect=True,
+                 # queue commands and drop the ones that are superseded before they are sent.
+                 coalesce_commands=False,
+                 # with coalesce_commands, max. number of command files not yet read by mql.
+                 max_commands_in_flight=4,
+                 # dwx_rate_limiter that is checked before a command is sent, except for the closes.
+                 rate_limiter=None,
+                 # dwx_transport, files in metatrader_dir_path if None.
+                 transport=None,
+                 # poll only the doorbell file (doorbell=true on the mql side) in one thread.
+                 doorbell=False,
+                 # seconds without new tick after which a symbol is stale (see check_stale_symbols()), 
+                 # or dict of symbol -> seconds. None to disable the watchdog. 
+                 stale_seconds=None,
+                 # window of the clock offset estimation, see dwx_clock.
+                 clock_window_seconds=60,
+                 # seconds after which a pending order command is dropped from effective_orders.
+                 pending_order_timeout=5,
+                 # dwx_risk_aggregator that is updated with every orders update and tick.
+                 risk_aggregator=None
                  ):
 
         self.event_handler = event_handler
         self.sleep_delay = sleep_delay
+        self.burst_spin_seconds = burst_spin_seconds
+        self.coalesce_commands = coalesce_commands
+        self.max_commands_in_flight = max_commands_in_flight
+        self.rate_limiter = rate_limiter
+        self.risk_aggregator = risk_aggregator
+        self.doorbell = doorbell
+        self.stale_seconds = stale_seconds
         self.max_retry_command_seconds = max_retry_command_seconds
         self.load_orders_from_file = load_orders_from_file
         self.verbose = verbose
         self.command_id = 0
+        self.metatrader_dir_path = metatrader_dir_path
 
-        if not exists(metatrader_dir_path):
-            print('ERROR: metatrader_dir_path does not exist!')
-            exit()
-
-        self.path_orders = join(metatrader_dir_path,
-                                'DWX', 'DWX_Orders.txt')
-        self.path_messages = join(metatrader_dir_path,
-                                  'DWX', 'DWX_Messages.txt')
-        self.path_market_data = join(metatrader_dir_path,
-                                     'DWX', 'DWX_Market_Data.txt')
-        self.path_bar_data = join(metatrader_dir_path,
-                                  'DWX', 'DWX_Bar_Data.txt')
-        self.path_historic_data = join(metatrader_dir_path,
-                                       'DWX', 'DWX_Historic_Data.txt')
-        self.path_historic_trades = join(metatrader_dir_path,
-                                         'DWX', 'DWX_Historic_Trades.txt')
-        self.path_orders_stored = join(metatrader_dir_path,
-                                       'DWX', 'DWX_Orders_Stored.txt')
-        self.path_messages_stored = join(metatrader_dir_path,
-                                         'DWX', 'DWX_Messages_Stored.txt')
-        self.path_commands_prefix = join(metatrader_dir_path,
-                                         'DWX', 'DWX_Commands_')
-
-        self.num_command_files = 50
+        if transport is None:
+            if auto_connect and not exists(metatrader_dir_path):
+                raise FileNotFoundError(
+                    f'metatrader_dir_path does not exist: {metatrader_dir_path}')
+            transport = dwx_file_transport(metatrader_dir_path)
+        self.transport = transport
 
         self._last_messages_millis = 0
         self._last_open_orders_str = ""
@@ -68,24 +166,207 @@ class dwx_client():
 
         self.open_orders = {}
         self.account_info = {}
-        self.market_data = {}
+        # order commands that are not visible in open_orders yet, see effective_orders.
+        self.order_overlay = dwx_order_overlay(pending_order_timeout)
+        self.orders_snapshot = orders_snapshot(0, MappingProxyType({}), MappingProxyType({}))
+        self.market_data = dwx_market_snapshot()
         self.bar_data = {}
         self.historic_data = {}
         self.historic_trades = {}
+        # local deal store, loaded on the first sync_historic_trades() call.
+        self.deal_store = None
+
+        # offset between server time and local time, from the time_msc of ticks and orders.
+        self.clock = dwx_clock(clock_window_seconds)
+        # age in seconds of the last update when it was dispatched to the event handler, 
+        # per symbol, per SYMBOL_TIMEFRAME (closed bars) and of the orders. 
+        self.tick_ages = {}
+        self.bar_ages = {}
+        self.orders_age = None
+        # symbols for which on_stale() was called and no new tick arrived since.
+        self._stale_symbols = set()
 
         self._last_bar_data = {}
-        self._last_market_data = {}
+
+        # channel -> version, increased every time the data of the channel changed. 
+        self.versions = {channel: 0 for channel in self.POLL_CHANNELS}
+        # channel -> symbol (or SYMBOL_TIMEFRAME) -> version of its last change.
+        self._key_versions = {channel: {} for channel in self.POLL_CHANNELS}
+        # notified after every new version, see wait_for().
+        self._state_condition = Condition()
+
+        # streaming indicators per SYMBOL_TIMEFRAME, see dwx_indicators.
+        self.indicators = dwx_indicators()
+        # SYMBOL_TIMEFRAME -> dwx_bar_window with the last closed bars.
+        self.bar_windows = {}
+
+        # symbol (or (symbol, time_frame)) -> number of add_symbols() calls 
+        # without remove_symbols(), the keys are the current subscription.
+        self._symbol_refs = {}
+        self._bar_data_refs = {}
+        self._subscription_lock = Lock()
+
+        # symbol_tf (or request ID) -> next chunk index of chunked historic data requests.
+        self._pending_historic_chunks = {}
+        # symbol_tf -> chunk indices received of the current response, in any order.
+        self._received_historic_chunks = {}
+        self._historic_chunk_queue = Queue()
+
+        # request ID -> state of requests that return a Future.
+        self._historic_requests = {}
+        self._requests_lock = Lock()
+        self._request_id_prefix = f'{os.getpid()}x{int(monotonic() * 1000) % 100000}x'
+        self._request_numbers = count(1)
+
+        # sequence numbers of the files (sequenceNumbers=true or delta mode on the mql side).
+        self._last_seq = {}
+        self._last_snapshot_request = {}
+        # number of updates that were overwritten before they could be read.
+        self.missed_updates = {}
+        # number of updates missed in the last gap.
+        self.last_gap = {}
+
+        # sequence numbers of single messages.
+        self._last_message_seq = None
+        self._missing_message_seqs = set()
+        self.missed_messages = 0
+        self.recovered_messages = 0
+
+        # the doorbell also covers orders and messages, so it gets their burst.
+        burst_channels = ['orders', 'messages', self.DOORBELL_CHANNEL]
+        watched_channels = self.POLL_CHANNELS + [self.DOORBELL_CHANNEL]
+        self.poll_policies = {}
+        for channel in watched_channels:
+            self.poll_policies[channel] = poll_policy(
+                sleep_delay, burst=channel in burst_channels)
+        for channel, policy in (poll_policies or {}).items():
+            if channel not in self.poll_policies:
+                raise ValueError(f'Unknown poll channel: {channel}')
+            if isinstance(policy, (tuple, list)):
+                policy = poll_policy(*policy, burst=channel in burst_channels)
+            self.poll_policies[channel] = policy
+
+        # effective polls per second, updated about once per second.
+        self.poll_rates = {channel: 0.0 for channel in watched_channels}
+        self._poll_counts = {channel: 0 for channel in watched_channels}
+        self._poll_rate_start = {channel: monotonic() for channel in watched_channels}
+        # channel -> last counter of the doorbell file.
+        self._doorbell_counters = {}
+        self._burst_until = 0
 
         self.ACTIVE = True
         self.START = False
 
-        self.lock = Lock()
+        # one lock per priority, so that close/modify commands do not wait 
+        # for normal commands. command IDs are shared by both priorities.
+        self._priority_locks = {'high': Lock(), 'normal': Lock()}
+        self._command_id_lock = Lock()
+
+        # commands waiting to be sent if coalesce_commands is True.
+        self._pending_commands = []
+        self._pending_commands_condition = Condition()
+        # command -> number of commands that were dropped because they were superseded.
+        self.coalesced_commands = {}
 
         self.load_messages()
 
         if self.load_orders_from_file:
             self.load_orders()
 
+        self._threads_started = False
+
+        if not auto_connect:
+            return
+
+        self._start_threads()
+
+        self.reset_command_ids()
+
+        # no need to wait.
+        if self.event_handler is None:
+            self.start()
+
+    """START can be used to check if the client has been initialized.  
+    """
+
+    def start(self):
+        self._start_threads()
+        self.START = True
+
+    """Connects to the mql server. 
+
+    Can be used instead of the automatic connection on initialization 
+    (auto_connect=False). It resets the command IDs and returns as soon 
+    as the mql server acknowledged the reset. The watcher threads are 
+    only started after that. 
+
+    Kwargs:
+        timeout (float): Seconds to wait for the acknowledgement. 
+        start_threads (bool): If False, no threads are started and the 
+            poll functions have to be called by the caller (used by 
+            dwx_terminal_manager). 
+
+    Raises:
+        FileNotFoundError: If metatrader_dir_path or its DWX folder 
+            does not exist. 
+        TimeoutError: If the mql server did not respond (or connect to 
+            a dwx_socket_transport) in time. 
+    """
+
+    def connect(self, timeout=5, start_threads=True):
+
+        self.transport.open(timeout)
+
+        if not self.reset_command_ids(timeout):
+            raise TimeoutError(
+                f'No response from the mql server within {timeout} seconds.')
+
+        if not start_threads:
+            return
+
+        self._start_threads()
+
+        # no need to wait.
+        if self.event_handler is None:
+            self.start()
+
+    """Starts the threads that check the files. 
+    
+    Does nothing if they are already running. 
+    """
+
+    def _start_threads(self):
+
+        if self._threads_started:
+            return
+        self._threads_started = True
+
+        if self.doorbell:
+            self.doorbell_thread = Thread(target=self.check_doorbell, args=())
+            self.doorbell_thread.daemon = True
+            self.doorbell_thread.start()
+        else:
+            self._start_channel_threads()
+
+        self.historic_chunks_thread = Thread(
+            target=self.parse_historic_chunks, args=())
+        self.historic_chunks_thread.daemon = True
+        self.historic_chunks_thread.start()
+
+        if self.coalesce_commands:
+            self.commands_thread = Thread(
+                target=self.send_pending_commands, args=())
+            self.commands_thread.daemon = True
+            self.commands_thread.start()
+
+        if self.stale_seconds is not None:
+            self.stale_watchdog_thread = Thread(
+                target=self.check_stale_symbols, args=())
+            self.stale_watchdog_thread.daemon = True
+            self.stale_watchdog_thread.start()
+
+    def _start_channel_threads(self):
+
         self.messages_thread = Thread(target=self.check_messages, args=())
         self.messages_thread.daemon = True
         self.messages_thread.start()
@@ -109,257 +390,1018 @@ class dwx_client():
         self.historic_data_thread.daemon = True
         self.historic_data_thread.start()
 
-        self.reset_command_ids()
+    """Tries to read a file. 
+    """
+
+    def try_read_file(self, file_path):
+
+        return self.transport.try_read_file(file_path)
+
+    """Tries to remove a file.
+    """
+
+    def try_remove_file(self, file_path):
+
+        self.transport.try_remove_file(file_path)
+
+    """Returns the effective poll rate (polls per second) of each channel. 
+    """
+
+    def get_poll_rates(self):
+
+        return dict(self.poll_rates)
+
+    """Keeps calling poll_function while the client is active. 
+
+    The sleep between two calls is given by the poll_policy of the 
+    channel. poll_function has to return True if the data changed. 
+    Transports that push the updates (e.g. dwx_socket_transport) end 
+    the sleep as soon as new data arrived. 
+    """
+
+    def _watch(self, channel, poll_function):
+
+        policy = self.poll_policies[channel]
+        interval = policy.min_interval
+        generation = self.transport.generation
+
+        while self.ACTIVE:
+
+            if policy.burst and monotonic() < self._burst_until:
+                self.transport.wait(policy.burst_interval, generation)
+            else:
+                self.transport.wait(interval, generation)
+            # taken before the poll, so that an update during the poll ends the next wait.
+            generation = self.transport.generation
+
+            if not self.START:
+                continue
+
+            # an exception must not end the thread. 
+            try:
+                changed = poll_function()
+            except json.JSONDecodeError:
+                # partially written file (without double buffer), it is read again next time. 
+                changed = False
+            except:
+                print_exc()
+                changed = False
+            interval = policy.next_interval(interval, changed)
+
+            self._poll_counts[channel] += 1
+            now = monotonic()
+            elapsed = now - self._poll_rate_start[channel]
+            if elapsed >= 1:
+                self.poll_rates[channel] = self._poll_counts[channel] / elapsed
+                self._poll_counts[channel] = 0
+                self._poll_rate_start[channel] = now
+
+    """Regularly checks the doorbell file instead of all other files 
+    (doorbell=True). 
+    """
+
+    def check_doorbell(self):
+
+        self._watch(self.DOORBELL_CHANNEL, self.poll_doorbell)
+
+    """Checks the doorbell file once. 
+
+    The mql server (doorbell=true) increases a counter per channel 
+    after every write of its file, and writes all counters to one small 
+    file. Only the channels whose counter changed are polled. 
+
+    Returns True if one of the channels changed. 
+    """
+
+    def poll_doorbell(self):
+
+        counters = self.transport.read('Doorbell').split()
+        # partially written.
+        if len(counters) != len(self.POLL_CHANNELS):
+            return False
+
+        poll_functions = [self.poll_open_orders, self.poll_messages, self.poll_market_data,
+                          self.poll_bar_data, self.poll_historic_data]
+        changed = False
+        # response files of requests are also checked without a new counter, 
+        # in case the file could not be read when its counter changed. 
+        waiting = len(self._pending_historic_chunks) + len(self._historic_requests) > 0
+        for channel, counter, poll_function in zip(self.POLL_CHANNELS, counters, poll_functions):
+            if counter == self._doorbell_counters.get(channel) and not (
+                    channel == 'historic_data' and waiting):
+                continue
+            # set before the poll, so that a write during the poll is seen next time.
+            self._doorbell_counters[channel] = counter
+            try:
+                changed |= bool(poll_function())
+            except json.JSONDecodeError:
+                # partially written, read again in the next round.
+                self._doorbell_counters.pop(channel, None)
+        return changed
+
+    """Regularly checks the file for open orders and triggers
+    the event_handler.on_order_event() function.
+    """
+
+    def check_open_orders(self):
+
+        self._watch('orders', self.poll_open_orders)
+
+    """Checks the file for open orders once. 
+
+    Returns True if the file changed. 
+    """
+
+    def poll_open_orders(self):
+
+        text = self.transport.read('Orders')
+
+        if len(text.strip()) == 0 or text == self._last_open_orders_str:
+            return False
+
+        self._last_open_orders_str = text
+        data = json.loads(text)
+
+        if self._is_seq_format(data):
+            data = self._merge_orders_delta(data)
+
+        # server time of the write, not sent by older mql servers.
+        if 'time_msc' in data:
+            now = time()
+            self.clock.add_sample(data['time_msc'], now)
+            self.orders_age = self.clock.age(data['time_msc'], now)
+
+        new_event = False
+        for order_id, order in self.open_orders.items():
+            # also triggers if a pending order got filled?
+            if order_id not in data['orders'].keys():
+                new_event = True
+                if self.verbose:
+                    print('Order removed: ', order)
+
+        for order_id, order in data['orders'].items():
+            if order_id not in self.open_orders:
+                new_event = True
+                if self.verbose:
+                    print('New order: ', order)
+
+        self._set_orders(data['account_info'], data['orders'])
+        self.order_overlay.on_orders(data['orders'])
+        if self.risk_aggregator is not None:
+            self.risk_aggregator.on_orders(data['orders'], data['account_info'], self.market_data)
+
+        if self.load_orders_from_file:
+            self.transport.store('Orders_Stored', json.dumps(data))
+
+        if self.event_handler is not None and new_event:
+            self.event_handler.on_order_event()
+
+        return True
+
+    """Regularly checks the file for messages and triggers
+    the event_handler.on_message() function.
+    """
+
+    def check_messages(self):
+
+        self._watch('messages', self.poll_messages)
+
+    """Checks the file for messages once. 
+
+    Returns True if the file changed. 
+    """
+
+    def poll_messages(self):
+
+        text = self.transport.read('Messages')
+
+        if len(text.strip()) == 0 or text == self._last_messages_str:
+            return False
+
+        self._last_messages_str = text
+        data = self._unwrap_seq('messages', json.loads(text))
+
+        # use sorted() to make sure that we don't miss messages
+        # because of (int(millis) > self._last_messages_millis).
+        for millis, message in sorted(data.items()):
+            if int(millis) > self._last_messages_millis:
+                self._last_messages_millis = int(millis)
+                if 'seq' in message and not self._check_message_seq(message):
+                    continue
+                # acknowledgements are only used internally.
+                if message.get('type') == 'ACK':
+                    continue
+                pending = self.order_overlay.on_message(message)
+                if pending is not None and self.verbose:
+                    print(f'Pending {pending["command"]} rolled back: {message.get("description")}')
+                # print(message)
+                if self.event_handler is not None:
+                    self.event_handler.on_message(message)
+
+        self._publish('messages')
+
+        self.transport.store('Messages_Stored', json.dumps(data))
+
+        return True
+
+    """Regularly checks the file for market data and triggers
+    the event_handler.on_tick() function.
+    """
+
+    def check_market_data(self):
+
+        self._watch('market_data', self.poll_market_data)
+
+    """Checks the file for market data once. 
+
+    Returns True if the file changed. 
+    """
+
+    def poll_market_data(self):
+
+        text = self.transport.read('Market_Data')
+
+        if len(text.strip()) == 0 or text == self._last_market_data_str:
+            return False
+
+        self._last_market_data_str = text
+        data = json.loads(text)
+
+        # in delta mode only the changed symbols are in the file.
+        full = True
+        if self._is_seq_format(data):
+            self._check_seq('market_data', data)
+            full = data['full']
+            data = data['data']
+
+        if full:
+            self.market_data.retain(data)
+
+        # the values are updated in place, see dwx_market_snapshot.
+        changed = [symbol for symbol, values in data.items()
+                   if self.market_data.update(symbol, values)]
+        if len(changed) > 0:
+            self._publish('market_data', changed)
+
+        # all samples are added first, so that the ages use the same offset.
+        now = time()
+        for symbol in changed:
+            if 'time_msc' in data[symbol]:
+                self.clock.add_sample(data[symbol]['time_msc'], now)
+        for symbol in changed:
+            if 'time_msc' in data[symbol]:
+                self.tick_ages[symbol] = self.clock.age(data[symbol]['time_msc'], now)
+            self._stale_symbols.discard(symbol)
+            if self.risk_aggregator is not None:
+                self.risk_aggregator.on_tick(symbol, self.market_data[symbol])
+
+        if self.event_handler is not None:
+            for symbol in changed:
+                self.event_handler.on_tick(symbol, data[symbol]['bid'], data[symbol]['ask'])
+
+        return True
+
+    """Regularly checks the file for bar data and triggers
+    the event_handler.on_bar_data() function.
+    """
+
+    def check_bar_data(self):
+
+        self._watch('bar_data', self.poll_bar_data)
+
+    """Checks the file for bar data once. 
+
+    Returns True if the file changed. 
+    """
+
+    def poll_bar_data(self):
+
+        text = self.transport.read('Bar_Data')
+
+        if len(text.strip()) == 0 or text == self._last_bar_data_str:
+            return False
+
+        self._last_bar_data_str = text
+        data = self._unwrap_seq('bar_data', json.loads(text))
+
+        self.bar_data = data
+        changed = [st for st in data.keys() if data[st] != self._last_bar_data.get(st)]
+        if len(changed) > 0:
+            self._publish('bar_data', changed)
+
+        for st in data.keys():
+            if st not in self._last_bar_data or self.bar_data[st] != self._last_bar_data[st]:
+                self._update_bar_window(st, self.bar_data[st])
+                # forming bars (publishFormingBars) only trigger on_bar_update().
+                if not self.bar_data[st].get('closed', True):
+                    continue
+                self.bar_ages[st] = self._bar_age(st, self.bar_data[st])
+                self.indicators.update(st, self.bar_data[st])
+                if self.event_handler is not None:
+                    symbol, time_frame = st.split('_')
+                    self.event_handler.on_bar_data(symbol,
+                                                   time_frame,
+                                                   self.bar_data[st]['time'],
+                                                   self.bar_data[st]['open'],
+                                                   self.bar_data[st]['high'],
+                                                   self.bar_data[st]['low'],
+                                                   self.bar_data[st]['close'],
+                                                   self.bar_data[st]['tick_volume'])
+        self._last_bar_data = data
+
+        return True
+
+    """Returns the seconds since the close of a bar (server time), or 
+    None if the clock offset is not known yet. 
+    """
+
+    def _bar_age(self, st, bar):
+
+        if self.clock.offset is None:
+            return None
+        time_frame = st.split('_')[1]
+        close_seconds = self.clock.parse_server_time(bar['time']) + self._time_frame_seconds(time_frame)
+        return self.clock.age(close_seconds * 1000)
+
+    """Returns the offset in seconds between the local time and the 
+    server time (including the time zone of the broker), or None if 
+    no update with a server timestamp was received yet. See dwx_clock. 
+    """
+
+    def get_clock_offset(self):
+
+        return self.clock.offset
+
+    """Returns how old the last tick of a symbol is now in seconds, 
+    or None if it is not known. 
+    """
+
+    def get_tick_age(self, symbol):
+
+        values = self.market_data.get(symbol)
+        if values is None or 'time_msc' not in values:
+            return None
+        return self.clock.age(values['time_msc'])
+
+    """Returns the stale_seconds threshold of a symbol, or None.
+    """
+
+    def _stale_threshold(self, symbol):
+
+        if isinstance(self.stale_seconds, dict):
+            return self.stale_seconds.get(symbol)
+        return self.stale_seconds
+
+    """Regularly checks the age of the last tick of every symbol and 
+    triggers the optional event_handler.on_stale(symbol, age) function 
+    once when it gets older than stale_seconds (e.g. a stalled terminal 
+    or feed). It is called again after the symbol got a new tick and 
+    got stale again. 
+    """
+
+    def check_stale_symbols(self):
+
+        while self.ACTIVE:
+            sleep(self.STALE_CHECK_INTERVAL)
+            if not self.START:
+                continue
+            try:
+                self.poll_stale_symbols()
+            except:
+                print_exc()
+
+    """Checks the age of the last tick of every symbol once. 
+
+    Returns:
+        list[str]: Symbols that got stale with this check. 
+    """
+
+    def poll_stale_symbols(self):
+
+        now = time()
+        stale = []
+        for symbol, values in self.market_data.items():
+            threshold = self._stale_threshold(symbol)
+            millis = values.get('time_msc')
+            if threshold is None or millis is None or symbol in self._stale_symbols:
+                continue
+            age = self.clock.age(millis, now)
+            if age is None or age <= threshold:
+                continue
+            self._stale_symbols.add(symbol)
+            stale.append(symbol)
+            if self.verbose:
+                print(f'No tick for {symbol} since {age:.1f} seconds.')
+            if self.event_handler is not None and hasattr(self.event_handler, 'on_stale'):
+                self.event_handler.on_stale(symbol, age)
+        return stale
+
+    """Returns the symbols that are stale since the last check. 
+    """
+
+    def get_stale_symbols(self):
+
+        return sorted(self._stale_symbols)
+
+    """Updates the bar window of a SYMBOL_TIMEFRAME and triggers the 
+    optional event_handler.on_bar_close() and event_handler.on_bar_update() 
+    functions. 
+    """
+
+    def _update_bar_window(self, st, bar):
+
+        window = self.bar_windows.get(st)
+        if window is None:
+            return
+
+        closed, forming_changed = window.update(bar)
+
+        # includes closed bars that were only published as forming bar.
+        for closed_bar in closed:
+            self.indicators.update(st, closed_bar)
 
-        # no need to wait.
         if self.event_handler is None:
-            self.start()
+            return
+        symbol, time_frame = st.split('_')
+        if hasattr(self.event_handler, 'on_bar_close'):
+            for closed_bar in closed:
+                self.event_handler.on_bar_close(symbol, time_frame, closed_bar)
+        if forming_changed and hasattr(self.event_handler, 'on_bar_update'):
+            self.event_handler.on_bar_update(symbol, time_frame, window.forming)
+
+    """Seeds the indicators and the bar window of a SYMBOL_TIMEFRAME 
+    from historic data. 
+    """
 
-    """START can be used to check if the client has been initialized.  
+    def _seed_from_history(self, st, data):
+
+        self.indicators.seed(st, data)
+
+        window = self.bar_windows.get(st)
+        if window is not None and len(data) > 0:
+            # ignore historic data that ends before the window (e.g. an older time range).
+            if window.last_time is None or max(data) >= window.last_time:
+                window.seed(data)
+
+    """Returns the dwx_bar_window of a bar data subscription with window_size. 
     """
 
-    def start(self):
-        self.START = True
+    def get_bar_window(self, symbol, time_frame):
 
-    """Tries to read a file. 
+        return self.bar_windows.get(f'{symbol}_{time_frame}')
+
+    """Returns the open orders with the order commands applied that were 
+    sent, but are not visible in open_orders yet (see dwx_order_overlay). 
+    Orders that come from a pending command have a 'pending' field with 
+    the command, new orders have the key 'pending_<n>'. 
     """
 
-    def try_read_file(self, file_path):
+    @property
+    def effective_orders(self):
 
-        try:
-            if exists(file_path):
-                with open(file_path) as f:
-                    text = f.read()
-                return text
-        # can happen if mql writes to the file. don't print anything here.
-        except (IOError, PermissionError):
-            pass
-        except:
-            print_exc()
-        return ''
+        return self.order_overlay.apply(self.open_orders)
+
+    """Returns the order commands that are waiting for confirmation. 
+    """
+
+    def get_pending_commands(self):
+
+        return self.order_overlay.pending()
+
+    """Sets the open orders and account info together with a new 
+    orders_snapshot. 
+    """
+
+    def _set_orders(self, account_info, open_orders):
+
+        with self._state_condition:
+            self.account_info = account_info
+            self.open_orders = open_orders
+            self.versions['orders'] += 1
+            self.orders_snapshot = orders_snapshot(self.versions['orders'],
+                                                   MappingProxyType(account_info),
+                                                   MappingProxyType(open_orders))
+            self._state_condition.notify_all()
+
+    """Increases the version of a channel and wakes up the waiting threads. 
+
+    Args:
+        channel (str): One of POLL_CHANNELS. 
+        keys (list[str]): Symbols (or SYMBOL_TIMEFRAMEs) that changed. 
+    """
+
+    def _publish(self, channel, keys=()):
+
+        with self._state_condition:
+            self.versions[channel] += 1
+            version = self.versions[channel]
+            for key in keys:
+                self._key_versions[channel][key] = version
+            self._state_condition.notify_all()
+
+    """Returns the current version of a channel, or of one symbol 
+    (or SYMBOL_TIMEFRAME) of the channel. 
+    """
+
+    def get_version(self, channel, key=None):
+
+        if key is None:
+            return self.versions[channel]
+        return self._key_versions[channel].get(key, 0)
+
+    """Waits until the data of a channel changed. 
+
+    Args:
+        channel (str): One of POLL_CHANNELS. 
+
+    Kwargs:
+        predicate (function): If given, also waits until predicate() 
+            returns True. It is checked with the lock of the condition, 
+            so it should be fast. 
+        key (str): Only wait for changes of this symbol (or SYMBOL_TIMEFRAME). 
+        after_version (int): Waits for a version larger than this. The 
+            default is the current version without predicate, else 
+            the predicate is checked directly. 
+        timeout (float): Seconds to wait, None waits forever. 
+
+    Returns:
+        int: The new version, or None after the timeout. 
+    """
+
+    def wait_for(self, channel, predicate=None, key=None, after_version=None, timeout=None):
+
+        with self._state_condition:
+            if after_version is None:
+                after_version = self.get_version(channel, key) if predicate is None else -1
+
+            def done():
+                return (self.get_version(channel, key) > after_version
+                        and (predicate is None or predicate()))
+
+            if not self._state_condition.wait_for(done, timeout):
+                return None
+            return self.get_version(channel, key)
+
+    """Waits for open orders that fulfill a condition, e.g. 
+    wait_for_orders(lambda s: len(s.open_orders) >= 5, timeout=10). 
+
+    Kwargs:
+        predicate (function): Gets the orders_snapshot. Without predicate, 
+            it waits for the next update. 
+        timeout (float): Seconds to wait, None waits forever. 
+
+    Returns:
+        orders_snapshot: The snapshot, or None after the timeout. 
+    """
+
+    def wait_for_orders(self, predicate=None, timeout=None):
+
+        if predicate is None:
+            version = self.wait_for('orders', timeout=timeout)
+        else:
+            version = self.wait_for('orders', lambda: predicate(self.orders_snapshot),
+                                    timeout=timeout)
+        return None if version is None else self.orders_snapshot
+
+    """Waits for a tick of a symbol. 
+
+    Kwargs:
+        after_version (int): Waits for a tick with a larger version. The 
+            default is the version of the last tick of the symbol, 
+            0 returns directly if there is market data for the symbol. 
+        timeout (float): Seconds to wait, None waits forever. 
+
+    Returns:
+        tick_snapshot: The version and a copy of the values of the 
+            symbol (at least as new as the version), or None after 
+            the timeout. 
+    """
+
+    def wait_for_tick(self, symbol, after_version=None, timeout=None):
+
+        version = self.wait_for('market_data', key=symbol,
+                                after_version=after_version, timeout=timeout)
+        if version is None:
+            return None
+        return tick_snapshot(version, symbol, self.market_data[symbol].to_dict())
+
+    """Waits for a new bar (or forming bar) of a symbol and time frame. 
+
+    Kwargs:
+        after_version (int): See wait_for_tick(). 
+        timeout (float): Seconds to wait, None waits forever. 
+
+    Returns:
+        bar_snapshot: The version and the bar, or None after the timeout. 
+    """
+
+    def wait_for_bar(self, symbol, time_frame, after_version=None, timeout=None):
+
+        st = f'{symbol}_{time_frame}'
+        version = self.wait_for('bar_data', key=st,
+                                after_version=after_version, timeout=timeout)
+        if version is None:
+            return None
+        return bar_snapshot(version, symbol, time_frame, self.bar_data[st])
+
+    """Waits until historic data of a symbol and time frame was received. 
+
+    Kwargs:
+        after_version (int): See wait_for_tick(). 0 returns directly if 
+            there is data from an earlier request. 
+        timeout (float): Seconds to wait, None waits forever. 
+
+    Returns:
+        dict: The historic data, or None after the timeout. 
+    """
+
+    def wait_for_historic_data(self, symbol, time_frame, after_version=None, timeout=None):
+
+        st = f'{symbol}_{time_frame}'
+        version = self.wait_for('historic_data', key=st,
+                                after_version=after_version, timeout=timeout)
+        if version is None:
+            return None
+        return self.historic_data[st]
+
+    """Regularly checks the file for historic data and trades and triggers
+    the event_handler.on_historic_data() function.
+    """
+
+    def check_historic_data(self):
+
+        self._watch('historic_data', self.poll_historic_data)
+
+    """Checks the files for historic data and trades once. 
+
+    Returns True if one of the files changed. 
+    """
+
+    def poll_historic_data(self):
+
+        changed = self.poll_historic_chunks()
+
+        text = self.transport.read('Historic_Data')
+
+        if len(text.strip()) > 0 and text != self._last_historic_data_str:
+
+            self._last_historic_data_str = text
+            changed = True
+
+            data = self._unwrap_seq('historic_data', json.loads(text))
+
+            for st in data.keys():
+                self.historic_data[st] = data[st]
+                self._seed_from_history(st, data[st])
+                if self.event_handler is not None:
+                    symbol, time_frame = st.split('_')
+                    self.event_handler.on_historic_data(
+                        symbol, time_frame, data[st])
+            self._publish('historic_data', data.keys())
+
+            self.transport.remove('Historic_Data')
+
+        # also check historic trades in the same thread.
+        text = self.transport.read('Historic_Trades')
+
+        if len(text.strip()) > 0 and text != self._last_historic_trades_str:
+
+            self._last_historic_trades_str = text
+            changed = True
+
+            data = self._unwrap_seq('historic_trades', json.loads(text))
+
+            self.historic_trades = data
+            self.event_handler.on_historic_trades()
+
+            self.transport.remove('Historic_Trades')
 
-    """Tries to remove a file.
-    """
+        return changed
 
-    def try_remove_file(self, file_path):
-        for _ in range(10):
-            try:
-                os.remove(file_path)
-                break
-            except (IOError, PermissionError):
-                pass
-            except:
-                print_exc()
+    """Checks if the data was written with a sequence number. 
 
-    """Regularly checks the file for open orders and triggers
-    the event_handler.on_order_event() function.
+    In delta mode or with sequenceNumbers=true, the mql server writes 
+    {"seq": ..., "full": ..., "data": ...}. 
     """
 
-    def check_open_orders(self):
+    def _is_seq_format(self, data):
 
-        while self.ACTIVE:
+        return 'seq' in data and 'full' in data and 'data' in data
 
-            sleep(self.sleep_delay)
+    """Checks the sequence number (if available) and returns the data 
+    in the same format as without sequence numbers. 
+    """
 
-            if not self.START:
-                continue
+    def _unwrap_seq(self, channel, data):
 
-            text = self.try_read_file(self.path_orders)
+        if not self._is_seq_format(data):
+            return data
+        self._check_seq(channel, data)
+        return data['data']
 
-            if len(text.strip()) == 0 or text == self._last_open_orders_str:
-                continue
+    """Checks the sequence number of a file and counts missed updates. 
 
-            self._last_open_orders_str = text
-            data = json.loads(text)
+    If a delta was missed (the file was overwritten before we read it),
+    a full snapshot is requested from the mql server. 
 
-            new_event = False
-            for order_id, order in self.open_orders.items():
-                # also triggers if a pending order got filled?
-                if order_id not in data['orders'].keys():
-                    new_event = True
-                    if self.verbose:
-                        print('Order removed: ', order)
+    Returns:
+        bool: True if no update was missed. 
+    """
 
-            for order_id, order in data['orders'].items():
-                if order_id not in self.open_orders:
-                    new_event = True
-                    if self.verbose:
-                        print('New order: ', order)
+    def _check_seq(self, channel, data):
 
-            self.account_info = data['account_info']
-            self.open_orders = data['orders']
+        seq = data['seq']
+        last_seq = self._last_seq.get(channel)
+        self._last_seq[channel] = seq
 
-            if self.load_orders_from_file:
-                with open(self.path_orders_stored, 'w') as f:
-                    f.write(json.dumps(data))
+        # first update or the mql server was restarted.
+        if last_seq is None or seq <= last_seq:
+            gap = 0
+        else:
+            gap = seq - last_seq - 1
 
-            if self.event_handler is not None and new_event:
-                self.event_handler.on_order_event()
+        if gap > 0:
+            self.missed_updates[channel] = self.missed_updates.get(channel, 0) + gap
+            self.last_gap[channel] = gap
+            if self.event_handler is not None and hasattr(self.event_handler, 'on_sequence_gap'):
+                self.event_handler.on_sequence_gap(channel, gap)
 
-    """Regularly checks the file for messages and triggers
-    the event_handler.on_message() function.
-    """
+        # a delta can only be merged if we have all earlier updates.
+        if not data['full'] and (gap > 0 or last_seq is None or seq <= last_seq):
+            # the mql side sends a full snapshot regularly anyway,
+            # so we don't need to ask for it more than once per second.
+            if monotonic() > self._last_snapshot_request.get(channel, 0) + 1:
+                self._last_snapshot_request[channel] = monotonic()
+                if self.verbose:
+                    print(f'Missed delta for {channel} (seq: {seq}), requesting snapshot.')
+                self.request_snapshot(channel)
 
-    def check_messages(self):
+        return gap == 0
 
-        while self.ACTIVE:
+    """Merges a delta of the orders file into the current orders. 
 
-            sleep(self.sleep_delay)
+    Returns:
+        dict: Data in the same format as the full orders file. 
+    """
 
-            if not self.START:
-                continue
+    def _merge_orders_delta(self, data):
 
-            text = self.try_read_file(self.path_messages)
+        self._check_seq('orders', data)
+        delta = data['data']
 
-            if len(text.strip()) == 0 or text == self._last_messages_str:
-                continue
+        if data['full']:
+            orders = delta['orders']
+        else:
+            orders = dict(self.open_orders)
+            orders.update(delta['orders'])
+            for ticket in delta['removed']:
+                orders.pop(ticket, None)
 
-            self._last_messages_str = text
-            data = json.loads(text)
+        merged = {'account_info': delta['account_info'], 'orders': orders}
+        if 'time_msc' in delta:
+            merged['time_msc'] = delta['time_msc']
+        return merged
 
-            # use sorted() to make sure that we don't miss messages
-            # because of (int(millis) > self._last_messages_millis).
-            for millis, message in sorted(data.items()):
-                if int(millis) > self._last_messages_millis:
-                    self._last_messages_millis = int(millis)
-                    # print(message)
-                    if self.event_handler is not None:
-                        self.event_handler.on_message(message)
+    """Checks the sequence number of a single message.
 
-            with open(self.path_messages_stored, 'w') as f:
-                f.write(json.dumps(data))
+    Requests missed messages from the mql server if there is a gap. 
 
-    """Regularly checks the file for market data and triggers
-    the event_handler.on_tick() function.
+    Returns:
+        bool: False if the message was already processed. 
     """
 
-    def check_market_data(self):
+    def _check_message_seq(self, message):
 
-        while self.ACTIVE:
+        seq = message['seq']
 
-            sleep(self.sleep_delay)
+        if message.get('replay', False):
+            if seq not in self._missing_message_seqs:
+                return False
+            self._missing_message_seqs.discard(seq)
+            self.recovered_messages += 1
+            return True
 
-            if not self.START:
-                continue
+        # first message or the mql server was restarted.
+        if self._last_message_seq is None or seq <= self._last_message_seq:
+            self._last_message_seq = seq
+            self._missing_message_seqs.clear()
+            return True
 
-            text = self.try_read_file(self.path_market_data)
+        missing = list(range(self._last_message_seq + 1, seq))
+        self._last_message_seq = seq
+        if len(missing) > 0:
+            self.missed_messages += len(missing)
+            self._missing_message_seqs.update(missing)
+            if self.event_handler is not None and hasattr(self.event_handler, 'on_sequence_gap'):
+                self.event_handler.on_sequence_gap('message_ids', len(missing))
+            self.request_messages(missing)
+        return True
 
-            if len(text.strip()) == 0 or text == self._last_market_data_str:
-                continue
+    """Checks for new chunks of chunked historic data requests.
 
-            self._last_market_data_str = text
-            data = json.loads(text)
+    The chunks are only read and deleted here. They are parsed in 
+    parse_historic_chunks() so that this thread is not blocked. 
 
-            self.market_data = data
+    Returns True if a chunk was found. 
+    """
 
-            if self.event_handler is not None:
-                for symbol in data.keys():
-                    if symbol not in self._last_market_data or self.market_data[symbol] != self._last_market_data[symbol]:
-                        self.event_handler.on_tick(symbol,
-                                                   self.market_data[symbol]['bid'],
-                                                   self.market_data[symbol]['ask'])
-            self._last_market_data = data
+    def poll_historic_chunks(self):
 
-    """Regularly checks the file for bar data and triggers
-    the event_handler.on_bar_data() function.
-    """
+        changed = False
 
-    def check_bar_data(self):
+        for st, chunk in list(self._pending_historic_chunks.items()):
+            while True:
+                name = f'Historic_Data_{st}_{chunk}'
+                text = self.transport.read(name)
+                if len(text.strip()) == 0:
+                    break
 
-        while self.ACTIVE:
+                changed = True
+                self.transport.remove(name)
+                self._historic_chunk_queue.put(text)
 
-            sleep(self.sleep_delay)
+                # the header is at the beginning, no need to parse everything here.
+                match = re.search(r'"num_chunks": (\d+)', text[:200])
+                chunk += 1
+                if match is None or chunk >= int(match.group(1)):
+                    self._pending_historic_chunks.pop(st, None)
+                    break
+                self._pending_historic_chunks[st] = chunk
 
-            if not self.START:
+        for request_id, request in list(self._historic_requests.items()):
+            if request['type'] != 'trades':
                 continue
+            name = f'Historic_Trades_{request_id}'
+            text = self.transport.read(name)
+            if len(text.strip()) == 0:
+                continue
+            changed = True
+            self.transport.remove(name)
+            self._historic_chunk_queue.put(text)
 
-            text = self.try_read_file(self.path_bar_data)
+        return changed
 
-            if len(text.strip()) == 0 or text == self._last_bar_data_str:
-                continue
+    """Parses the chunks of historic data and triggers the 
+    event_handler.on_historic_data_chunk() function for every chunk 
+    and event_handler.on_historic_data() after the last chunk. 
+    """
 
-            self._last_bar_data_str = text
-            data = json.loads(text)
+    def parse_historic_chunks(self):
 
-            self.bar_data = data
+        while self.ACTIVE:
 
-            if self.event_handler is not None:
-                for st in data.keys():
-                    if st not in self._last_bar_data or self.bar_data[st] != self._last_bar_data[st]:
-                        symbol, time_frame = st.split('_')
-                        self.event_handler.on_bar_data(symbol,
-                                                       time_frame,
-                                                       self.bar_data[st]['time'],
-                                                       self.bar_data[st]['open'],
-                                                       self.bar_data[st]['high'],
-                                                       self.bar_data[st]['low'],
-                                                       self.bar_data[st]['close'],
-                                                       self.bar_data[st]['tick_volume'])
-            self._last_bar_data = data
+            text = self._historic_chunk_queue.get()
+            # an exception must not end the thread, the later responses would never arrive.
+            try:
+                self._process_historic_chunk(text)
+            except:
+                print_exc()
 
-    """Regularly checks the file for historic data and trades and triggers
-    the event_handler.on_historic_data() function.
+    """Processes one historic data chunk or request response. 
+
+    The chunks can arrive in any order, the data is complete when 
+    num_chunks different chunks were received. 
     """
 
-    def check_historic_data(self):
+    def _process_historic_chunk(self, text):
 
-        while self.ACTIVE:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            print_exc()
+            return
+
+        if data.get('request_id', '') != '':
+            self._process_request_response(data)
+            return
+
+        st = data['symbol_tf']
+        received = self._received_historic_chunks.get(st)
+        # a chunk that was already received starts a new response.
+        if received is None or data['chunk'] in received or st not in self.historic_data:
+            received = self._received_historic_chunks[st] = set()
+            self.historic_data[st] = {}
+        received.add(data['chunk'])
+        self.historic_data[st].update(data['data'])
+        complete = len(received) >= data['num_chunks']
+        if complete:
+            self._received_historic_chunks.pop(st, None)
+            self._seed_from_history(st, self.historic_data[st])
+            self._publish('historic_data', [st])
 
-            sleep(self.sleep_delay)
+        if self.event_handler is None:
+            return
 
-            if not self.START:
-                continue
+        symbol, time_frame = st.split('_')
+        if hasattr(self.event_handler, 'on_historic_data_chunk'):
+            self.event_handler.on_historic_data_chunk(
+                symbol, time_frame, data['chunk'], data['num_chunks'], data['data'])
+
+        if complete:
+            self.event_handler.on_historic_data(
+                symbol, time_frame, self.historic_data[st])
 
-            text = self.try_read_file(self.path_historic_data)
+    """Processes a response (or a chunk of it) to a request 
+    with request ID and completes its Future. 
+    """
 
-            if len(text.strip()) > 0 and text != self._last_historic_data_str:
+    def _process_request_response(self, data):
+
+        request_id = data['request_id']
+        # the request is removed under the lock, so that it can not be 
+        # cancelled (_cancel_request) while it is completed. 
+        with self._requests_lock:
+            request = self._historic_requests.get(request_id)
+            # timed out or cancelled.
+            if request is None:
+                return
+            if request['type'] == 'data' and 'error' not in data:
+                request['data'].update(data['data'])
+                request.setdefault('received', set()).add(data['chunk'])
+                complete = len(request['received']) >= data['num_chunks']
+            else:
+                complete = True
+            if complete:
+                self._historic_requests.pop(request_id, None)
+
+        future = request['future']
+        # False if the future was cancelled by the caller (future.cancel()).
+        if complete and not future.set_running_or_notify_cancel():
+            return
+
+        if 'error' in data:
+            future.set_exception(RuntimeError(data['error']))
+            return
+
+        if request['type'] == 'trades' and request.get('sync'):
+            try:
+                future.set_result(self.deal_store.merge(data['data']))
+            except Exception as e:
+                future.set_exception(e)
+            return
+
+        if request['type'] == 'trades':
+            self.historic_trades = data['data']
+            future.set_result(data['data'])
+            if self.event_handler is not None:
+                self.event_handler.on_historic_trades()
+            return
 
-                self._last_historic_data_str = text
+        st = data['symbol_tf']
+        symbol, time_frame = st.split('_')
 
-                data = json.loads(text)
+        if self.event_handler is not None and hasattr(self.event_handler, 'on_historic_data_chunk'):
+            self.event_handler.on_historic_data_chunk(
+                symbol, time_frame, data['chunk'], data['num_chunks'], data['data'])
 
-                for st in data.keys():
-                    self.historic_data[st] = data[st]
-                    if self.event_handler is not None:
-                        symbol, time_frame = st.split('_')
-                        self.event_handler.on_historic_data(
-                            symbol, time_frame, data[st])
+        if not complete:
+            return
 
-                self.try_remove_file(self.path_historic_data)
+        self.historic_data[st] = request['data']
+        self._seed_from_history(st, request['data'])
+        self._publish('historic_data', [st])
+        future.set_result(request['data'])
+        if self.event_handler is not None:
+            self.event_handler.on_historic_data(symbol, time_frame, request['data'])
 
-            # also check historic trades in the same thread.
-            text = self.try_read_file(self.path_historic_trades)
+    """Returns a new ID for requests with their own response files. 
+    """
 
-            if len(text.strip()) > 0 and text != self._last_historic_trades_str:
+    def _new_request_id(self):
 
-                self._last_historic_trades_str = text
+        return f'{self._request_id_prefix}{next(self._request_numbers)}'
 
-                data = json.loads(text)
+    """Removes a request that will not be completed anymore. 
+    """
 
-                self.historic_trades = data
-                self.event_handler.on_historic_trades()
+    def _cancel_request(self, request_id):
 
-                self.try_remove_file(self.path_historic_trades)
+        self._pending_historic_chunks.pop(request_id, None)
+        with self._requests_lock:
+            request = self._historic_requests.pop(request_id, None)
+        if request is not None:
+            # wait() only sees cancelled futures as done after the notification.
+            if request['future'].cancel():
+                request['future'].set_running_or_notify_cancel()
 
     """Loads stored orders from file (in case of a restart). 
     """
 
     def load_orders(self):
 
-        text = self.try_read_file(self.path_orders_stored)
+        text = self.transport.load('Orders_Stored')
 
         if len(text) > 0:
             self._last_open_orders_str = text
             data = json.loads(text)
-            self.account_info = data['account_info']
-            self.open_orders = data['orders']
+            self._set_orders(data['account_info'], data['orders'])
 
     """Loads stored messages from file (in case of a restart). 
     """
 
     def load_messages(self):
 
-        text = self.try_read_file(self.path_messages_stored)
+        text = self.transport.load('Messages_Stored')
 
         if len(text) > 0:
 
@@ -388,7 +1430,114 @@ class dwx_client():
 
     def subscribe_symbols(self, symbols):
 
-        self.send_command('SUBSCRIBE_SYMBOLS', ','.join(symbols))
+        with self._subscription_lock:
+            self._symbol_refs = {symbol: 1 for symbol in symbols}
+            return self.send_command('SUBSCRIBE_SYMBOLS', ','.join(symbols))
+
+    """Adds symbols to the tick data subscription. 
+
+    Only the symbols that are not subscribed yet are sent to the mql 
+    server (ADD_SYMBOLS), the other symbols are not touched. Every call 
+    increases a reference count per symbol, so that several strategies 
+    can share one client. 
+
+    Args:
+        symbols (list[str]): List of symbols to subscribe to. 
+
+    Returns:
+        bool: False if the command could not be sent. 
+    """
+
+    def add_symbols(self, symbols):
+
+        with self._subscription_lock:
+            saved_refs = self._save_refs(self._symbol_refs, symbols)
+            new_symbols = self._add_refs(self._symbol_refs, symbols)
+            if len(new_symbols) == 0:
+                return True
+            if not self.send_command('ADD_SYMBOLS', ','.join(new_symbols)):
+                self._restore_refs(self._symbol_refs, saved_refs)
+                return False
+            return True
+
+    """Removes symbols from the tick data subscription. 
+
+    A symbol is only removed (REMOVE_SYMBOLS) after remove_symbols() was 
+    called as often as add_symbols(). 
+
+    Args:
+        symbols (list[str]): List of symbols to unsubscribe from. 
+
+    Returns:
+        bool: False if the command could not be sent. 
+    """
+
+    def remove_symbols(self, symbols):
+
+        with self._subscription_lock:
+            saved_refs = self._save_refs(self._symbol_refs, symbols)
+            removed_symbols = self._remove_refs(self._symbol_refs, symbols)
+            if len(removed_symbols) == 0:
+                return True
+            if not self.send_command('REMOVE_SYMBOLS', ','.join(removed_symbols)):
+                self._restore_refs(self._symbol_refs, saved_refs)
+                return False
+            self.market_data.retain(self._symbol_refs)
+            return True
+
+    """Returns the symbols of the tick data subscription. 
+    """
+
+    def get_subscribed_symbols(self):
+
+        return list(self._symbol_refs)
+
+    """Increases the reference counts and returns the new keys. 
+    """
+
+    def _add_refs(self, refs, keys):
+
+        new_keys = []
+        for key in keys:
+            if key not in refs:
+                refs[key] = 0
+                new_keys.append(key)
+            refs[key] += 1
+        return new_keys
+
+    """Decreases the reference counts and returns the removed keys. 
+    """
+
+    def _remove_refs(self, refs, keys):
+
+        removed_keys = []
+        for key in keys:
+            if key not in refs:
+                continue
+            refs[key] -= 1
+            if refs[key] <= 0:
+                del refs[key]
+                removed_keys.append(key)
+        return removed_keys
+
+    """Returns the reference counts of the keys (None if not subscribed), 
+    to restore them with _restore_refs() if a command could not be sent. 
+    """
+
+    def _save_refs(self, refs, keys):
+
+        return {key: refs.get(key) for key in keys}
+
+    """Restores the reference counts saved by _save_refs(). 
+    """
+
+    def _restore_refs(self, refs, saved_refs):
+
+        for key, count in saved_refs.items():
+            if count is None:
+                refs.pop(key, None)
+            else:
+                refs[key] = count
 
     """Sends a SUBSCRIBE_SYMBOLS_BAR_DATA command to subscribe to bar data.
 
@@ -396,21 +1545,122 @@ class dwx_client():
         symbols (list[list[str]]): List of lists containing symbol/time frame 
         combinations to subscribe to. For example:
         symbols = [['EURUSD', 'M1'], ['GBPUSD', 'H1']]
+        window_size (int): If larger than zero, the last window_size closed 
+            bars are kept in a dwx_bar_window (see get_bar_window()), 
+            which is seeded with get_historic_data(). 
     
     Returns:
         None
 
         The data will be stored in self.bar_data. 
         On receiving the data the event_handler.on_bar_data() 
-        function will be triggered. 
+        function will be triggered. With window_size, the optional 
+        event_handler.on_bar_close() and event_handler.on_bar_update() 
+        (forming bar, needs publishFormingBars=true) functions are 
+        triggered as well. 
     
     """
 
-    def subscribe_symbols_bar_data(self, symbols=[['EURUSD', 'M1']]):
+    def subscribe_symbols_bar_data(self, symbols=[['EURUSD', 'M1']], window_size=0):
+
+        with self._subscription_lock:
+            self._bar_data_refs = {(st[0], st[1]): 1 for st in symbols}
+            data = [f'{st[0]},{st[1]}' for st in symbols]
+            success = self.send_command('SUBSCRIBE_SYMBOLS_BAR_DATA',
+                                        ','.join(str(p) for p in data))
+
+        self._setup_bar_windows(symbols, window_size)
+        return success
+
+    """Adds symbol/time frame combinations to the bar data subscription 
+    (ADD_SYMBOLS_BAR_DATA), with reference counting like add_symbols(). 
+
+    Args:
+        symbols (list[list[str]]): For example [['EURUSD', 'M1']]. 
+
+    Kwargs:
+        window_size (int): See subscribe_symbols_bar_data(). 
+
+    Returns:
+        bool: False if the command could not be sent. 
+    """
+
+    def add_symbols_bar_data(self, symbols, window_size=0):
+
+        with self._subscription_lock:
+            keys = [(st[0], st[1]) for st in symbols]
+            saved_refs = self._save_refs(self._bar_data_refs, keys)
+            new_symbols = self._add_refs(self._bar_data_refs, keys)
+            if len(new_symbols) > 0 and not self.send_command(
+                    'ADD_SYMBOLS_BAR_DATA', ','.join(f'{st[0]},{st[1]}' for st in new_symbols)):
+                self._restore_refs(self._bar_data_refs, saved_refs)
+                return False
+
+        # also for subscribed keys, e.g. to create or resize their window.
+        self._setup_bar_windows(keys, window_size)
+        return True
+
+    """Removes symbol/time frame combinations from the bar data 
+    subscription (REMOVE_SYMBOLS_BAR_DATA), with reference counting 
+    like remove_symbols(). 
+
+    Args:
+        symbols (list[list[str]]): For example [['EURUSD', 'M1']]. 
+
+    Returns:
+        bool: False if the command could not be sent. 
+    """
+
+    def remove_symbols_bar_data(self, symbols):
+
+        with self._subscription_lock:
+            keys = [(st[0], st[1]) for st in symbols]
+            saved_refs = self._save_refs(self._bar_data_refs, keys)
+            removed_symbols = self._remove_refs(self._bar_data_refs, keys)
+            if len(removed_symbols) == 0:
+                return True
+            if not self.send_command('REMOVE_SYMBOLS_BAR_DATA',
+                                     ','.join(f'{st[0]},{st[1]}' for st in removed_symbols)):
+                self._restore_refs(self._bar_data_refs, saved_refs)
+                return False
+            for symbol, time_frame in removed_symbols:
+                self.bar_windows.pop(f'{symbol}_{time_frame}', None)
+            return True
+
+    """Returns the symbol/time frame combinations of the bar data subscription. 
+    """
+
+    def get_subscribed_bar_data(self):
 
-        data = [f'{st[0]},{st[1]}' for st in symbols]
-        self.send_command('SUBSCRIBE_SYMBOLS_BAR_DATA',
-                          ','.join(str(p) for p in data))
+        return [list(st) for st in self._bar_data_refs]
+
+    """Creates the bar windows and requests the historic data to fill them. 
+    """
+
+    def _setup_bar_windows(self, symbols, window_size):
+
+        if window_size <= 0:
+            return
+
+        now = datetime.now(timezone.utc)
+        for symbol, time_frame in symbols:
+            st = f'{symbol}_{time_frame}'
+            window = self.bar_windows.get(st)
+            if window is None or window.size != window_size:
+                self.bar_windows[st] = dwx_bar_window(window_size)
+            # enough time for window_size bars, including weekends.
+            lookback = timedelta(seconds=1.5 * window_size * self._time_frame_seconds(time_frame),
+                                 days=3)
+            self.get_historic_data(symbol, time_frame, (now - lookback).timestamp(), now.timestamp())
+
+    """Returns the length of a time frame (e.g. 'M15', 'H4', 'D1') in seconds. 
+    """
+
+    def _time_frame_seconds(self, time_frame):
+
+        units = {'M': 60, 'H': 3600, 'D': 86400, 'W': 604800, 'MN': 2592000}
+        unit = 'MN' if time_frame.startswith('MN') else time_frame[0]
+        return units[unit] * int(time_frame[len(unit):] or 1)
 
     """Sends a GET_HISTORIC_DATA command to request historic data. 
     
@@ -419,13 +1669,17 @@ class dwx_client():
         time_frame (str): Time frame for the requested data.
         start (int): Start timestamp (seconds since epoch) of the requested data.
         end (int): End timestamp of the requested data.
+        chunk_bars (int): If larger than zero, the data is sent in chunks 
+            of at most chunk_bars bars (MT5 only). 
     
     Returns:
         None
 
         The data will be stored in self.historic_data. 
         On receiving the data the event_handler.on_historic_data()
-        function will be triggered. 
+        function will be triggered. If chunk_bars is used, the 
+        optional event_handler.on_historic_data_chunk() function 
+        will also be triggered for every chunk. 
     """
 
     def get_historic_data(self,
@@ -433,14 +1687,130 @@ class dwx_client():
                           time_frame='D1',
                           start=(datetime.now(timezone.utc) -
                                  timedelta(days=30)).timestamp(),
-                          end=datetime.now(timezone.utc).timestamp()):
+                          end=datetime.now(timezone.utc).timestamp(),
+                          chunk_bars=0):
 
         # start_date.strftime('%Y.%m.%d %H:%M:00')
         data = [symbol, time_frame,
                 int(start),
                 int(end)]
+        if chunk_bars > 0:
+            data.append(int(chunk_bars))
+            self._pending_historic_chunks[f'{symbol}_{time_frame}'] = 0
+            self._received_historic_chunks.pop(f'{symbol}_{time_frame}', None)
         self.send_command('GET_HISTORIC_DATA', ','.join(str(p) for p in data))
 
+    """Sends a GET_HISTORIC_DATA command with a request ID (MT5 only). 
+
+    The response is written to its own file, so that multiple requests 
+    can be sent at the same time without overwriting each other. 
+
+    Kwargs:
+        symbol (str): Symbol to get historic data.
+        time_frame (str): Time frame for the requested data.
+        start (int): Start timestamp (seconds since epoch). Defaults to 
+            30 days ago. 
+        end (int): End timestamp. Defaults to now. 
+        chunk_bars (int): If larger than zero, the data is sent in chunks 
+            of at most chunk_bars bars. 
+
+    Returns:
+        Future: Completes with the bars as dictionary. The data will also 
+        be stored in self.historic_data and event_handler.on_historic_data() 
+        will be triggered. 
+    """
+
+    def request_historic_data(self,
+                              symbol='EURUSD',
+                              time_frame='D1',
+                              start=None,
+                              end=None,
+                              chunk_bars=0):
+
+        now = datetime.now(timezone.utc)
+        if start is None:
+            start = (now - timedelta(days=30)).timestamp()
+        if end is None:
+            end = now.timestamp()
+
+        request_id = self._new_request_id()
+        future = Future()
+        future.request_id = request_id
+        self._historic_requests[request_id] = {'type': 'data', 'future': future, 'data': {}}
+        self._pending_historic_chunks[request_id] = 0
+
+        data = [symbol, time_frame, int(start), int(end), int(chunk_bars), request_id]
+        if not self.send_command('GET_HISTORIC_DATA', ','.join(str(p) for p in data)):
+            self._cancel_request(request_id)
+        return future
+
+    """Requests historic data for many symbols/time frames (MT5 only). 
+
+    Up to max_concurrency requests are sent at the same time. A new one 
+    is sent as soon as a response arrived. 
+
+    Args:
+        requests (list[list]): List of [symbol, time_frame] or 
+            [symbol, time_frame, start, end] entries. 
+
+    Kwargs:
+        max_concurrency (int): Maximum number of requests at the same time. 
+        timeout (float): Maximum seconds to wait for all responses. 
+        chunk_bars (int): Passed to request_historic_data(). 
+        return_exceptions (bool): If True, failed requests are returned 
+            as exception in the result. Else the first exception is raised. 
+            A request that could not be sent is cancelled (CancelledError). 
+
+    Returns:
+        dict: symbol_timeframe -> bars. 
+
+    Raises:
+        TimeoutError: If not all responses arrived within timeout seconds. 
+    """
+
+    def get_historic_data_many(self, requests, max_concurrency=8,
+                               timeout=60, chunk_bars=0,
+                               return_exceptions=False):
+
+        end_time = monotonic() + timeout
+        waiting = deque(requests)
+        in_flight = {}
+        results = {}
+
+        while len(waiting) > 0 or len(in_flight) > 0:
+
+            while len(waiting) > 0 and len(in_flight) < max_concurrency:
+                request = list(waiting.popleft())
+                future = self.request_historic_data(*request, chunk_bars=chunk_bars)
+                in_flight[future] = f'{request[0]}_{request[1]}'
+
+            done, _ = wait(list(in_flight), timeout=max(0, end_time - monotonic()),
+                           return_when=FIRST_COMPLETED)
+
+            if len(done) == 0:
+                for future in in_flight:
+                    self._cancel_request(future.request_id)
+                raise TimeoutError(
+                    f'No historic data for {len(in_flight) + len(waiting)} requests within {timeout} seconds.')
+
+            for future in done:
+                st = in_flight.pop(future)
+                # exception() raises CancelledError for a cancelled future.
+                if future.cancelled():
+                    exception = CancelledError(f'Historic data request for {st} was cancelled.')
+                else:
+                    exception = future.exception()
+                if exception is None:
+                    results[st] = future.result()
+                elif return_exceptions:
+                    results[st] = exception
+                else:
+                    for other_future in in_flight:
+                        self._cancel_request(other_future.request_id)
+                    raise exception
+
+        return results
+
     """Sends a GET_HISTORIC_TRADES command to request historic trades.
     
     Kwargs:
@@ -459,6 +1829,62 @@ class dwx_client():
 
         self.send_command('GET_HISTORIC_TRADES', str(lookback_days))
 
+    """Sends a GET_HISTORIC_TRADES command with a request ID (MT5 only). 
+    
+    Kwargs:
+        lookback_days (int): Days to look back into the trade history. 
+    
+    Returns:
+        Future: Completes with the trades as dictionary. The data will also 
+        be stored in self.historic_trades and event_handler.on_historic_trades() 
+        will be triggered. 
+    """
+
+    def request_historic_trades(self,
+                                lookback_days=30):
+
+        request_id = self._new_request_id()
+        future = Future()
+        future.request_id = request_id
+        self._historic_requests[request_id] = {'type': 'trades', 'future': future}
+
+        if not self.send_command('GET_HISTORIC_TRADES', f'{lookback_days},{request_id}'):
+            self._cancel_request(request_id)
+        return future
+
+    """Requests only the deals that are newer than the last deal in the 
+    local deal store (MT5 only). 
+    
+    The new deals are merged into self.deal_store, which is stored in 
+    DWX_Deals_Stored.txt and indexed by ticket, magic and symbol. 
+    self.historic_trades is not changed and on_historic_trades() 
+    is not triggered. 
+    
+    Kwargs:
+        lookback_days (int): Days to look back if the deal store is empty. 
+    
+    Returns:
+        Future: Completes with the new deals as dictionary. 
+    """
+
+    def sync_historic_trades(self,
+                             lookback_days=30):
+
+        if self.deal_store is None:
+            self.deal_store = dwx_deal_store(self.transport.store_path('Deals_Stored'))
+
+        request_id = self._new_request_id()
+        future = Future()
+        future.request_id = request_id
+        self._historic_requests[request_id] = {'type': 'trades', 'sync': True, 'future': future}
+
+        # the server skips deals with a smaller or equal ticket, so that deals 
+        # with the same time as the last one are not lost. 
+        if not self.send_command('GET_HISTORIC_TRADES',
+                                 f'{lookback_days},{request_id},{self.deal_store.last_ticket},{self.deal_store.last_time}'):
+            self._cancel_request(request_id)
+        return future
+
     """Sends an OPEN_ORDER command to open an order.
 
     Kwargs:
@@ -491,7 +1917,7 @@ class dwx_client():
 
         data = [symbol, order_type, lots, price, stop_loss,
                 take_profit, magic, comment, expiration]
-        self.send_command('OPEN_ORDER', ','.join(str(p) for p in data))
+        return self.send_command('OPEN_ORDER', ','.join(str(p) for p in data))
 
     """Sends a MODIFY_ORDER command to modify an order.
 
@@ -515,7 +1941,7 @@ class dwx_client():
                      expiration=0):
 
         data = [ticket, price, stop_loss, take_profit, expiration]
-        self.send_command('MODIFY_ORDER', ','.join(str(p) for p in data))
+        return self.send_command('MODIFY_ORDER', ','.join(str(p) for p in data))
 
     """Sends a CLOSE_ORDER command to close an order.
 
@@ -532,14 +1958,14 @@ class dwx_client():
     def close_order(self, ticket, lots=0):
 
         data = [ticket, lots]
-        self.send_command('CLOSE_ORDER', ','.join(str(p) for p in data))
+        return self.send_command('CLOSE_ORDER', ','.join(str(p) for p in data))
 
     """Sends a CLOSE_ALL_ORDERS command to close all orders.
     """
 
     def close_all_orders(self):
 
-        self.send_command('CLOSE_ALL_ORDERS', '')
+        return self.send_command('CLOSE_ALL_ORDERS', '')
 
     """Sends a CLOSE_ORDERS_BY_SYMBOL command to close all orders
     with a given symbol.
@@ -551,7 +1977,7 @@ class dwx_client():
 
     def close_orders_by_symbol(self, symbol):
 
-        self.send_command('CLOSE_ORDERS_BY_SYMBOL', symbol)
+        return self.send_command('CLOSE_ORDERS_BY_SYMBOL', symbol)
 
     """Sends a CLOSE_ORDERS_BY_MAGIC command to close all orders
     with a given magic number.
@@ -564,38 +1990,240 @@ class dwx_client():
 
     def close_orders_by_magic(self, magic):
 
-        self.send_command('CLOSE_ORDERS_BY_MAGIC', magic)
+        return self.send_command('CLOSE_ORDERS_BY_MAGIC', magic)
+
+    """Sends a RESEND_MESSAGES command to request messages that were missed. 
+
+    Only works if sequenceNumbers=true on the mql side and the messages 
+    are still in its history (messageHistorySize). 
+
+    The sequence numbers are sent in commands of at most 
+    MAX_RESEND_MESSAGES each. 
+
+    Args:
+        seqs (list[int]): Sequence numbers of the messages. 
+    """
+
+    def request_messages(self, seqs):
+
+        seqs = list(seqs)
+        for i in range(0, len(seqs), self.MAX_RESEND_MESSAGES):
+            batch = seqs[i:i + self.MAX_RESEND_MESSAGES]
+            self.send_command('RESEND_MESSAGES', ','.join(str(seq) for seq in batch))
+
+    """Sends a REQUEST_SNAPSHOT command to request a full snapshot in delta mode. 
+
+    Kwargs:
+        channel (str): 'market_data', 'orders' or '' for both. 
+    """
+
+    def request_snapshot(self, channel=''):
+
+        self.send_command('REQUEST_SNAPSHOT', channel)
 
     """Sends a RESET_COMMAND_IDS command to reset stored command IDs. 
     This should be used when restarting the python side without restarting 
     the mql side.
 
+    Kwargs:
+        timeout (float): Maximum seconds to wait until the mql server 
+            acknowledged the reset. 
+
+    Returns:
+        bool: True if the acknowledgement was received. Older server 
+        versions do not send it, in which case it just waits for timeout.
     """
 
-    def reset_command_ids(self):
+    def reset_command_ids(self, timeout=0.5):
 
-        self.command_id = 0
+        with self._command_id_lock:
+            self.command_id = 0
+
+        token = f'{os.getpid()}_{int(monotonic() * 1e6)}'
+        self.send_command("RESET_COMMAND_IDS", token)
+
+        # wait to make sure it is read before other commands.
+        return self._wait_for_ack(token, timeout)
+
+    """Waits until the message file contains the acknowledgement 
+    with the given token. 
+
+    Returns:
+        bool: True if found within timeout seconds. 
+    """
+
+    def _wait_for_ack(self, token, timeout):
+
+        end_time = monotonic() + timeout
+        last_text = ''
+        while True:
+            text = self.transport.read('Messages')
+            if len(text.strip()) > 0 and text != last_text:
+                last_text = text
+                try:
+                    data = json.loads(text)
+                except ValueError:
+                    # file was only partially written.
+                    data = {}
+                if self._is_seq_format(data):
+                    data = data['data']
+                for message in data.values():
+                    if message.get('type') == 'ACK' and message.get('token') == token:
+                        return True
+            if monotonic() >= end_time:
+                return False
+            sleep(self.sleep_delay)
+
+    """Adds a command to the pending commands and removes the pending 
+    commands that are superseded by it: 
+        - MODIFY_ORDER for the same ticket. 
+        - MODIFY_ORDER for a ticket that is closed completely 
+          (CLOSE_ORDER without lots or CLOSE_ALL_ORDERS). 
+        - SUBSCRIBE_SYMBOLS and SUBSCRIBE_SYMBOLS_BAR_DATA, since a new 
+          subscription replaces the previous one. 
+    """
+
+    def _add_pending_command(self, command, content, priority, overlay_entry=None):
+
+        superseded = []
+        if command in ['MODIFY_ORDER', 'CLOSE_ORDER']:
+            fields = content.split(',')
+            if command == 'MODIFY_ORDER' or len(fields) < 2 or float(fields[1] or 0) == 0:
+                superseded = [['MODIFY_ORDER', fields[0]]]
+        elif command == 'CLOSE_ALL_ORDERS':
+            superseded = [['MODIFY_ORDER', None]]
+        elif command == 'SUBSCRIBE_SYMBOLS':
+            # the full list also replaces the changes sent before.
+            superseded = [[command, None], ['ADD_SYMBOLS', None], ['REMOVE_SYMBOLS', None]]
+        elif command == 'SUBSCRIBE_SYMBOLS_BAR_DATA':
+            superseded = [[command, None], ['ADD_SYMBOLS_BAR_DATA', None],
+                          ['REMOVE_SYMBOLS_BAR_DATA', None]]
+
+        with self._pending_commands_condition:
+            remaining = []
+            for pending in self._pending_commands:
+                dropped = False
+                for superseded_command, ticket in superseded:
+                    if pending[0] == superseded_command and (
+                            ticket is None or pending[1].split(',')[0] == ticket):
+                        dropped = True
+                if dropped:
+                    self.coalesced_commands[pending[0]] = self.coalesced_commands.get(pending[0], 0) + 1
+                    self.order_overlay.remove(pending[3])
+                else:
+                    remaining.append(pending)
+            remaining.append([command, content, priority, overlay_entry])
+            self._pending_commands = remaining
+            self._pending_commands_condition.notify()
+
+    """Sends the pending commands if coalesce_commands is True. 
+
+    Commands are only written if less than max_commands_in_flight 
+    command files are waiting to be read, so that superseded commands 
+    can still be dropped in the meantime. High priority commands are 
+    sent first. 
+    """
+
+    def send_pending_commands(self):
+
+        while self.ACTIVE:
 
-        self.send_command("RESET_COMMAND_IDS", "")
+            with self._pending_commands_condition:
+                if len(self._pending_commands) == 0:
+                    self._pending_commands_condition.wait(0.1)
+                    continue
 
-        # sleep to make sure it is read before other commands.
-        sleep(0.5)
+            while self.ACTIVE and self.transport.num_commands_in_flight() >= self.max_commands_in_flight:
+                sleep(self.sleep_delay)
 
-    """Sends a command to the mql server by writing it to 
-    one of the command files. 
+            with self._pending_commands_condition:
+                index = 0
+                for i, pending in enumerate(self._pending_commands):
+                    if pending[2] == 'high':
+                        index = i
+                        break
+                command, content, priority, overlay_entry = self._pending_commands.pop(index)
+
+            self._write_command(command, content, priority, overlay_entry)
+
+    """Sends a command to the mql server via the transport, by default 
+    by writing it to one of the command files. 
 
     Multiple command files are used to allow for fast execution 
     of multiple commands in the correct chronological order. 
+
+    Commands in HIGH_PRIORITY_COMMANDS use the first 
+    num_high_priority_command_files files (see dwx_file_transport), 
+    which the mql server always reads first. If these are all in use, 
+    the other files are used as well. 
+
+    If coalesce_commands is True, the command is only added to the 
+    pending commands, which are sent by send_pending_commands(). 
+
+    If a rate_limiter is set, commands have to pass it first. Commands 
+    in RATE_LIMIT_EXEMPT_COMMANDS (closing orders) are never throttled, 
+    MODIFY_ORDER is limited although it has a high priority. 
+
+    Order commands are shown in effective_orders until the orders file 
+    shows them (see dwx_order_overlay). 
+
+    Kwargs:
+        priority (str): 'high' or 'normal'. If None, the priority 
+            is determined by HIGH_PRIORITY_COMMANDS. 
     
+    Returns:
+        bool: False if the command was rejected by the rate limiter or 
+        could not be written within max_retry_command_seconds. 
+    """
+
+    def send_command(self, command, content, priority=None):
+
+        if priority is None:
+            priority = 'high' if command in self.HIGH_PRIORITY_COMMANDS else 'normal'
+
+        # risk reducing commands are never delayed or rejected.
+        if self.rate_limiter is not None and command not in self.RATE_LIMIT_EXEMPT_COMMANDS:
+            if not self.rate_limiter.acquire(command, self._command_symbol(command, content)):
+                if self.verbose:
+                    print(f'Command rejected by rate limiter: {command}|{content}')
+                return False
+
+        # shown in effective_orders until the orders file shows it.
+        overlay_entry = self.order_overlay.add(command, content, self.open_orders)
+
+        # the reset is needed before any other command is read.
+        if self.coalesce_commands and command != 'RESET_COMMAND_IDS':
+            self._add_pending_command(command, content, priority, overlay_entry)
+            return True
+
+        return self._write_command(command, content, priority, overlay_entry)
+
+    """Returns the symbol of a command for the rate limiter or None. 
     """
 
-    def send_command(self, command, content):
+    def _command_symbol(self, command, content):
+
+        if command in ['OPEN_ORDER', 'CLOSE_ORDERS_BY_SYMBOL']:
+            return content.split(',')[0]
+        if command in ['MODIFY_ORDER', 'CLOSE_ORDER']:
+            order = self.open_orders.get(content.split(',')[0])
+            if order is not None:
+                return order.get('symbol')
+        return None
+
+    def _write_command(self, command, content, priority, overlay_entry=None):
 
-        # Acquire lock so that different threads do not use the same 
-        # command_id or write at the same time.
-        self.lock.acquire()
+        # Acquire lock so that different threads of the same priority 
+        # do not write at the same time.
+        self._priority_locks[priority].acquire()
 
-        self.command_id = (self.command_id + 1) % 100000
+        success = False
+
+        with self._command_id_lock:
+            self.command_id = (self.command_id + 1) % 100000
+            command_id = self.command_id
+        # set before sending, so that an error message can be matched.
+        self.order_overlay.set_command_id(overlay_entry, command_id)
 
         end_time = datetime.now(timezone.utc) + timedelta(seconds=self.max_retry_command_seconds)
         now = datetime.now(timezone.utc)
@@ -603,25 +2231,18 @@ class dwx_client():
         # trying again for X seconds in case all files exist or are 
         # currently read from mql side.
         while now < end_time:
-            # using 10 different files to increase the execution speed 
-            # for muliple commands.
-            success = False
-            for i in range(self.num_command_files):
-                # only send commend if the file does not exists so that we 
-                # do not overwrite all commands.
-                file_path = f'{self.path_commands_prefix}{i}.txt'
-                if not exists(file_path):
-                    try:
-                        with open(file_path, 'w') as f:
-                            f.write(f'<:{self.command_id}|{command}|{content}:>')
-                        success = True
-                        break
-                    except:
-                        print_exc()
+            success = self.transport.send_command(f'<:{command_id}|{command}|{content}:>', priority)
             if success:
+                # poll orders and messages faster for a while to get the response quickly.
+                self._burst_until = monotonic() + self.burst_spin_seconds
                 break
             sleep(self.sleep_delay)
             now = datetime.now(timezone.utc)
         
         # release lock again
-        self.lock.release()
+        self._priority_locks[priority].release()
+
+        if not success:
+            self.order_overlay.remove(overlay_entry)
+
+        return success
@@ -0,0 +1,97 @@
+
+from time import time, strptime
+from calendar import timegm
+from collections import deque
+
+
+"""Clock offset
+
+Estimates the offset between the server time of the mql terminal and the
+local clock of the client, to compute how old the data is when it is
+dispatched.
+
+Every update with a server timestamp ("time_msc" of the ticks and the
+orders file) is a sample of local receive time minus server time. This
+is the clock offset plus the delay of the update, so the smallest sample
+of the last window_seconds is used as offset (the fastest update had
+the smallest delay). The window lets the estimate follow a restart of
+the terminal or a changed clock.
+
+The offset also contains the time zone of the broker, since the server
+time is broker time. Ages are relative to the fastest update of the
+window, e.g. a tick that took 50 ms longer than the fastest one is
+50 ms old.
+
+Kwargs:
+    window_seconds (float): Length of the window of the samples.
+
+"""
+
+
+class dwx_clock():
+
+    def __init__(self, window_seconds=60):
+
+        self.window_seconds = window_seconds
+        # (local time, sample) with increasing samples, the first one is the minimum.
+        self._samples = deque()
+
+    """Adds a sample.
+
+    Args:
+        server_millis (float): Server time of the update in milliseconds.
+        local_time (float): Local time (time.time()) when it was received.
+    """
+
+    def add_sample(self, server_millis, local_time=None):
+
+        if local_time is None:
+            local_time = time()
+        sample = local_time - server_millis / 1000
+        samples = self._samples
+        # samples that are larger than a newer one can never be the minimum again.
+        while len(samples) > 0 and samples[-1][1] >= sample:
+            samples.pop()
+        samples.append((local_time, sample))
+        while samples[0][0] < local_time - self.window_seconds:
+            samples.popleft()
+
+    """Returns the offset in seconds (local time minus server time),
+    or None if there was no sample yet.
+    """
+
+    @property
+    def offset(self):
+
+        samples = self._samples
+        return samples[0][1] if len(samples) > 0 else None
+
+    """Converts a server time (seconds) to local time.
+    """
+
+    def to_local(self, server_seconds):
+
+        offset = self.offset
+        return None if offset is None else server_seconds + offset
+
+    """Returns the age in seconds of data with the given server time
+    (milliseconds), or None if the offset is not known yet.
+    """
+
+    def age(self, server_millis, now=None):
+
+        offset = self.offset
+        if offset is None:
+            return None
+        if now is None:
+            now = time()
+        return max(0.0, now - server_millis / 1000 - offset)
+
+    """Returns the server time in seconds of a time string of the mql
+    server, e.g. '2024.01.31 12:00' or '2024.01.31 12:00:00'.
+    """
+
+    def parse_server_time(self, text):
+
+        format = '%Y.%m.%d %H:%M:%S' if text.count(':') == 2 else '%Y.%m.%d %H:%M'
+        return timegm(strptime(text, format))
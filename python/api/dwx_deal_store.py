@@ -0,0 +1,143 @@
+
+import json
+from bisect import bisect_right, insort
+from calendar import timegm
+from time import strptime
+from threading import Lock
+from os.path import exists
+
+
+"""Local deal store
+
+Keeps the trade history (deals) received via GET_HISTORIC_TRADES, so that
+only new deals have to be requested from MetaTrader. The deals are indexed
+by ticket, magic number and symbol.
+
+If file_path is given, new deals are appended to this file (one JSON object
+per line) and loaded again on the next start.
+
+"""
+
+
+class dwx_deal_store():
+
+    def __init__(self, file_path=None):
+
+        self.file_path = file_path
+
+        # ticket (str) -> deal dictionary, same format as self.historic_trades.
+        self.deals = {}
+        self._tickets = []  # sorted int tickets.
+        self._by_magic = {}
+        self._by_symbol = {}
+
+        # highest ticket and deal time (server time, seconds) seen so far.
+        self.last_ticket = 0
+        self.last_time = 0
+
+        self.lock = Lock()
+
+        if self.file_path is not None:
+            self.load()
+
+    """Loads the stored deals from file.
+    """
+
+    def load(self):
+
+        if not exists(self.file_path):
+            return
+
+        deals = {}
+        with open(self.file_path) as f:
+            for line in f:
+                if len(line.strip()) == 0:
+                    continue
+                try:
+                    ticket, deal = json.loads(line)
+                except ValueError:
+                    # the last line could be incomplete after a crash.
+                    continue
+                deals[ticket] = deal
+        self._add(deals)
+
+    """Merges deals into the store.
+
+    Args:
+        deals (dict): ticket -> deal, as returned by GET_HISTORIC_TRADES.
+
+    Returns:
+        dict: The deals that were not in the store yet.
+    """
+
+    def merge(self, deals):
+
+        with self.lock:
+            new_deals = {str(ticket): deal for ticket, deal in deals.items()
+                         if str(ticket) not in self.deals}
+            if len(new_deals) == 0:
+                return new_deals
+            self._add(new_deals)
+
+            if self.file_path is not None:
+                with open(self.file_path, 'a') as f:
+                    for ticket in sorted(new_deals, key=int):
+                        f.write(json.dumps([ticket, new_deals[ticket]]) + '\n')
+        return new_deals
+
+    def _add(self, deals):
+
+        for ticket, deal in deals.items():
+            self.deals[ticket] = deal
+            insort(self._tickets, int(ticket))
+            self._by_magic.setdefault(deal.get('magic'), []).append(ticket)
+            self._by_symbol.setdefault(deal.get('symbol'), []).append(ticket)
+
+            self.last_ticket = max(self.last_ticket, int(ticket))
+            if 'deal_time' in deal:
+                self.last_time = max(self.last_time, self._to_timestamp(deal['deal_time']))
+
+    """Converts a deal time string to seconds, as MetaTrader uses them.
+    """
+
+    def _to_timestamp(self, deal_time):
+
+        try:
+            return timegm(strptime(deal_time, '%Y.%m.%d %H:%M:%S'))
+        except ValueError:
+            return 0
+
+    """Returns all deals with a ticket larger than the given one.
+
+    Args:
+        ticket (int): Ticket of the last known deal.
+
+    Returns:
+        dict: ticket -> deal, sorted by ticket.
+    """
+
+    def since(self, ticket):
+
+        with self.lock:
+            i = bisect_right(self._tickets, int(ticket))
+            return {str(t): self.deals[str(t)] for t in self._tickets[i:]}
+
+    """Returns all deals with the given magic number.
+    """
+
+    def by_magic(self, magic):
+
+        with self.lock:
+            return {t: self.deals[t] for t in self._by_magic.get(magic, [])}
+
+    """Returns all deals of the given symbol.
+    """
+
+    def by_symbol(self, symbol):
+
+        with self.lock:
+            return {t: self.deals[t] for t in self._by_symbol.get(symbol, [])}
+
+    def __len__(self):
+
+        return len(self.deals)
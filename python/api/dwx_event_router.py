@@ -0,0 +1,193 @@
+
+from threading import Lock
+from collections import namedtuple
+
+
+_registration = namedtuple('_registration', ['handler', 'symbols', 'time_frames', 'magics', 'channels'])
+
+
+"""Event router
+
+Runs several strategies on one dwx_client. Each strategy is an event
+handler that is registered for the symbols, time frames and magic
+numbers it owns, and only gets the events of those:
+
+    router = dwx_event_router()
+    client = dwx_client(router, metatrader_dir_path)
+    router.dwx = client
+    router.register(trend_strategy, symbols=['EURUSD'], time_frames=['H1'], magics=[1])
+    router.register(scalper, symbols=['GBPUSD', 'USDJPY'], magics=[2])
+
+on_tick() and on_stale() are routed by symbol, on_bar_data(),
+on_bar_close(), on_bar_update(), on_historic_data() and
+on_historic_data_chunk() by symbol and time frame, and
+on_sequence_gap() by channel (e.g. 'market_data' or 'orders').
+on_order_event() is only called for handlers
+whose magic numbers had orders opened, closed or changed (type or lots),
+and on_message() by the "magic" field of the message. Messages without
+magic number and all other events (e.g. on_historic_trades()) go to all
+handlers. Optional functions are only called on the handlers that
+have them.
+
+A filter that is None matches everything. The handlers of every
+(function, symbol, time frame, magic, channel) combination are looked up once
+and cached until the next register() or unregister().
+
+Args:
+    dwx (dwx_client): Client whose open_orders are used to find the
+        magic numbers of order events.
+
+"""
+
+
+class dwx_event_router():
+
+    def __init__(self, dwx=None):
+
+        self.dwx = dwx
+        self._registrations = []
+        # (function name, symbol, time_frame, magic, channel) -> tuple of functions
+        self._routes = {}
+        self._lock = Lock()
+        # last open orders, to find the magic numbers of removed orders.
+        self._open_orders = {}
+
+    """Registers an event handler.
+
+    Kwargs:
+        symbols (list): Symbols of the ticks and bars, None for all.
+        time_frames (list): Time frames of the bars, None for all.
+        magics (list): Magic numbers of the order events and messages,
+            None for all.
+        channels (list): Channels of the sequence gaps, None for all.
+    """
+
+    def register(self, handler, symbols=None, time_frames=None, magics=None, channels=None):
+
+        registration = _registration(handler,
+                                     None if symbols is None else frozenset(symbols),
+                                     None if time_frames is None else frozenset(time_frames),
+                                     None if magics is None else frozenset(int(m) for m in magics),
+                                     None if channels is None else frozenset(channels))
+        with self._lock:
+            self._registrations.append(registration)
+            self._routes = {}
+
+    def unregister(self, handler):
+
+        with self._lock:
+            self._registrations = [r for r in self._registrations if r.handler is not handler]
+            self._routes = {}
+
+    def _matches(self, registration, symbol, time_frame, magic, channel):
+
+        # None as argument: the event is not specific to this filter.
+        for value, values in [(symbol, registration.symbols),
+                              (time_frame, registration.time_frames),
+                              (magic, registration.magics),
+                              (channel, registration.channels)]:
+            if value is not None and values is not None and value not in values:
+                return False
+        return True
+
+    def _route(self, name, symbol=None, time_frame=None, magic=None, channel=None):
+
+        key = (name, symbol, time_frame, magic, channel)
+        functions = self._routes.get(key)
+        if functions is None:
+            with self._lock:
+                functions = tuple(getattr(r.handler, name) for r in self._registrations
+                                  if hasattr(r.handler, name)
+                                  and self._matches(r, symbol, time_frame, magic, channel))
+                self._routes[key] = functions
+        return functions
+
+    def on_tick(self, symbol, bid, ask):
+
+        for function in self._route('on_tick', symbol):
+            function(symbol, bid, ask)
+
+    def on_stale(self, symbol, age):
+
+        for function in self._route('on_stale', symbol):
+            function(symbol, age)
+
+    def on_sequence_gap(self, channel, gap):
+
+        for function in self._route('on_sequence_gap', channel=channel):
+            function(channel, gap)
+
+    def on_bar_data(self, symbol, time_frame, time, open_price, high, low, close_price, tick_volume):
+
+        for function in self._route('on_bar_data', symbol, time_frame):
+            function(symbol, time_frame, time, open_price, high, low, close_price, tick_volume)
+
+    def on_bar_close(self, symbol, time_frame, bar):
+
+        for function in self._route('on_bar_close', symbol, time_frame):
+            function(symbol, time_frame, bar)
+
+    def on_bar_update(self, symbol, time_frame, bar):
+
+        for function in self._route('on_bar_update', symbol, time_frame):
+            function(symbol, time_frame, bar)
+
+    def on_historic_data(self, symbol, time_frame, data):
+
+        for function in self._route('on_historic_data', symbol, time_frame):
+            function(symbol, time_frame, data)
+
+    def on_historic_data_chunk(self, symbol, time_frame, chunk, num_chunks, data):
+
+        for function in self._route('on_historic_data_chunk', symbol, time_frame):
+            function(symbol, time_frame, chunk, num_chunks, data)
+
+    """Calls on_order_event() of the handlers whose magic numbers had
+    orders opened, closed or changed since the last order event.
+    """
+
+    def on_order_event(self):
+
+        open_orders = dict(self.dwx.open_orders) if self.dwx is not None else {}
+        magics = set()
+        for ticket, order in open_orders.items():
+            previous = self._open_orders.get(ticket)
+            if previous is None or previous.get('type') != order.get('type') \
+                    or previous.get('lots') != order.get('lots'):
+                magics.add(order.get('magic'))
+        for ticket, order in self._open_orders.items():
+            if ticket not in open_orders:
+                magics.add(order.get('magic'))
+        self._open_orders = open_orders
+
+        # without known orders (e.g. no dwx) all handlers are notified.
+        if len(magics) == 0:
+            magics.add(None)
+
+        called = set()
+        for magic in magics:
+            for function in self._route('on_order_event', magic=None if magic is None else int(magic)):
+                # a handler with several magic numbers is only called once.
+                if function not in called:
+                    called.add(function)
+                    function()
+
+    def on_message(self, message):
+
+        magic = message.get('magic')
+        for function in self._route('on_message', magic=None if magic is None else int(magic)):
+            function(message)
+
+    def __getattr__(self, name):
+
+        # all other events go to all handlers that have the function.
+        if not name.startswith('on_'):
+            raise AttributeError(name)
+        functions = self._route(name)
+        if len(functions) == 0:
+            raise AttributeError(name)
+
+        def broadcast(*args, **kwargs):
+            for function in functions:
+                function(*args, **kwargs)
+        return broadcast
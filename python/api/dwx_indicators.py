@@ -0,0 +1,448 @@
+
+from collections import deque
+from threading import Lock
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""Streaming indicators
+
+Every indicator keeps only the state that is needed for the next bar,
+so that update() is O(1). seed() initializes the state from historic
+bars. With numpy, seed() and batch() are vectorized.
+
+update() takes the bar time as well: a bar with the same time as the
+last one replaces it (e.g. a forming bar), older bars are ignored.
+
+"""
+
+
+"""Returns the result of v = v + alpha * (x - v) for all x in values,
+starting with v = initial. values can be 2D (one row per symbol).
+"""
+
+
+def _ewm_last(values, alpha, initial):
+
+    n = values.shape[-1] if np is not None and isinstance(values, np.ndarray) else len(values)
+    if n == 0:
+        return initial
+    if np is not None:
+        decay = (1 - alpha) ** np.arange(n - 1, -1, -1)
+        return initial * (1 - alpha) ** n + alpha * np.dot(values, decay)
+    value = initial
+    for x in values:
+        value += alpha * (x - value)
+    return value
+
+
+class indicator():
+
+    # attributes that are restored if the last bar is replaced.
+    STATE = ('value', 'count')
+
+    def __init__(self, period):
+
+        self.period = period
+        self.value = None
+        self.count = 0
+        self.last_time = None
+        self._previous = None
+
+    @property
+    def name(self):
+
+        return f'{type(self).__name__}_{self.period}'
+
+    """Updates the indicator with a new bar (dict with open/high/low/close).
+
+    Returns:
+        float: The new value or None if there are not enough bars yet.
+    """
+
+    def update(self, bar, time=None):
+
+        if time is not None and self.last_time is not None and time <= self.last_time:
+            if time < self.last_time:
+                return self.value
+            self._replace(bar)
+            return self.value
+
+        self._previous = tuple(getattr(self, attr) for attr in self.STATE)
+        self._update(bar)
+        self.last_time = time
+        return self.value
+
+    def _replace(self, bar):
+
+        for attr, value in zip(self.STATE, self._previous):
+            setattr(self, attr, value)
+        self._update(bar)
+
+    """Initializes the indicator from historic bars.
+
+    Args:
+        bars (list): Bars sorted by time.
+        times (list): Times of the bars.
+    """
+
+    def seed(self, bars, times=None):
+
+        if len(bars) == 0:
+            return
+        self.__init__(self.period)
+        # the last bar is added with update(), so that it can still be replaced.
+        self._seed(bars[:-1])
+        self.update(bars[-1], times[-1] if times is not None else None)
+
+    def _seed(self, bars):
+
+        for bar in bars:
+            self._update(bar)
+
+    def _column(self, bars, field):
+
+        if np is not None:
+            return np.array([bar[field] for bar in bars], dtype=float)
+        return [bar[field] for bar in bars]
+
+    """Computes the last value for many symbols at once (numpy only).
+
+    Args:
+        closes, highs, lows (np.ndarray): One row per symbol.
+
+    Returns:
+        np.ndarray: Last value per row, NaN where update() would give
+        None (not enough bars yet).
+    """
+
+    @classmethod
+    def batch(cls, period, closes, highs=None, lows=None):
+
+        raise NotImplementedError
+
+
+class sma(indicator):
+
+    def __init__(self, period):
+
+        super().__init__(period)
+        self._window = deque(maxlen=period)
+        self._sum = 0.0
+
+    def _update(self, bar):
+
+        if len(self._window) == self.period:
+            self._sum -= self._window[0]
+        self._window.append(bar['close'])
+        self._sum += bar['close']
+        self.count += 1
+        self.value = self._sum / self.period if len(self._window) == self.period else None
+
+    # the deque is not part of STATE, the last close is swapped instead.
+    def _replace(self, bar):
+
+        self._sum += bar['close'] - self._window[-1]
+        self._window[-1] = bar['close']
+        self.value = self._sum / self.period if len(self._window) == self.period else None
+
+    def _seed(self, bars):
+
+        # only the last period closes are needed.
+        closes = [bar['close'] for bar in bars[-self.period:]]
+        self._window.extend(closes)
+        self._sum = sum(closes)
+        self.count = len(bars)
+        self.value = self._sum / self.period if len(self._window) == self.period else None
+
+    @classmethod
+    def batch(cls, period, closes, highs=None, lows=None):
+
+        if closes.shape[1] < period:
+            return np.full(closes.shape[0], np.nan)
+        return closes[:, -period:].mean(axis=1)
+
+
+class ema(indicator):
+
+    def __init__(self, period):
+
+        super().__init__(period)
+        self.alpha = 2.0 / (period + 1)
+
+    def _update(self, bar):
+
+        if self.value is None:
+            self.value = bar['close']
+        else:
+            self.value += self.alpha * (bar['close'] - self.value)
+        self.count += 1
+
+    def _seed(self, bars):
+
+        if len(bars) == 0:
+            return
+        closes = self._column(bars, 'close')
+        self.value = float(_ewm_last(closes[1:], self.alpha, closes[0]))
+        self.count = len(bars)
+
+    @classmethod
+    def batch(cls, period, closes, highs=None, lows=None):
+
+        return _ewm_last(closes[:, 1:], 2.0 / (period + 1), closes[:, 0])
+
+
+"""Average true range with Wilder's smoothing.
+"""
+
+
+class atr(indicator):
+
+    STATE = ('value', 'count', '_prev_close')
+
+    def __init__(self, period):
+
+        super().__init__(period)
+        self._prev_close = None
+
+    def _update(self, bar):
+
+        tr = bar['high'] - bar['low']
+        if self._prev_close is not None:
+            tr = max(tr, abs(bar['high'] - self._prev_close), abs(bar['low'] - self._prev_close))
+        self.value = tr if self.value is None else self.value + (tr - self.value) / self.period
+        self._prev_close = bar['close']
+        self.count += 1
+
+    def _seed(self, bars):
+
+        if len(bars) == 0 or np is None:
+            return super()._seed(bars)
+        highs, lows, closes = [self._column(bars, field) for field in ['high', 'low', 'close']]
+        tr = self._true_range(closes[None, :], highs[None, :], lows[None, :])[0]
+        self.value = float(_ewm_last(tr[1:], 1.0 / self.period, tr[0]))
+        self._prev_close = float(closes[-1])
+        self.count = len(bars)
+
+    @staticmethod
+    def _true_range(closes, highs, lows):
+
+        tr = highs - lows
+        prev_close = closes[:, :-1]
+        tr[:, 1:] = np.maximum(tr[:, 1:], np.maximum(np.abs(highs[:, 1:] - prev_close),
+                                                     np.abs(lows[:, 1:] - prev_close)))
+        return tr
+
+    @classmethod
+    def batch(cls, period, closes, highs=None, lows=None):
+
+        tr = cls._true_range(closes, highs, lows)
+        return _ewm_last(tr[:, 1:], 1.0 / period, tr[:, 0])
+
+
+"""Relative strength index with Wilder's smoothing.
+"""
+
+
+class rsi(indicator):
+
+    STATE = ('value', 'count', '_prev_close', '_avg_gain', '_avg_loss')
+
+    def __init__(self, period):
+
+        super().__init__(period)
+        self._prev_close = None
+        self._avg_gain = None
+        self._avg_loss = None
+
+    def _update(self, bar):
+
+        close = bar['close']
+        if self._prev_close is not None:
+            change = close - self._prev_close
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            if self._avg_gain is None:
+                self._avg_gain, self._avg_loss = gain, loss
+            else:
+                self._avg_gain += (gain - self._avg_gain) / self.period
+                self._avg_loss += (loss - self._avg_loss) / self.period
+            self._set_value(self.count)
+        self._prev_close = close
+        self.count += 1
+
+    def _set_value(self, num_changes):
+
+        if num_changes < self.period:
+            self.value = None
+        elif self._avg_loss == 0:
+            self.value = 100.0
+        else:
+            self.value = 100.0 - 100.0 / (1.0 + self._avg_gain / self._avg_loss)
+
+    def _seed(self, bars):
+
+        if len(bars) < 2 or np is None:
+            return super()._seed(bars)
+        closes = self._column(bars, 'close')
+        changes = np.diff(closes)
+        gains, losses = np.maximum(changes, 0), np.maximum(-changes, 0)
+        self._avg_gain = float(_ewm_last(gains[1:], 1.0 / self.period, gains[0]))
+        self._avg_loss = float(_ewm_last(losses[1:], 1.0 / self.period, losses[0]))
+        self._prev_close = float(closes[-1])
+        self.count = len(bars)
+        self._set_value(len(changes))
+
+    @classmethod
+    def batch(cls, period, closes, highs=None, lows=None):
+
+        if closes.shape[1] - 1 < period:
+            return np.full(closes.shape[0], np.nan)
+        changes = np.diff(closes, axis=1)
+        gains, losses = np.maximum(changes, 0), np.maximum(-changes, 0)
+        avg_gain = _ewm_last(gains[:, 1:], 1.0 / period, gains[:, 0])
+        avg_loss = _ewm_last(losses[:, 1:], 1.0 / period, losses[:, 0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + avg_gain / avg_loss))
+
+
+"""Indicator registry
+
+Keeps the indicators per SYMBOL_TIMEFRAME. dwx_client updates them
+with every new bar of the bar data subscription and seeds them when
+historic data for the same SYMBOL_TIMEFRAME arrives.
+
+Example:
+    dwx.indicators.add('EURUSD', 'M1', ema(20))
+    dwx.get_historic_data('EURUSD', 'M1')
+    ...
+    dwx.indicators.get('EURUSD', 'M1', 'ema_20')
+
+"""
+
+
+class dwx_indicators():
+
+    INDICATORS = {'sma': sma, 'ema': ema, 'atr': atr, 'rsi': rsi}
+
+    def __init__(self):
+
+        # symbol_tf -> name -> indicator
+        self._indicators = {}
+        self.lock = Lock()
+
+    """Adds an indicator.
+
+    Args:
+        indicator (indicator): e.g. ema(20).
+        name (str): Name for get(). Default: class name and period, e.g. 'ema_20'.
+        history (dict): Optional historic data (time -> bar) to seed it.
+
+    Returns:
+        str: Name of the indicator.
+    """
+
+    def add(self, symbol, time_frame, indicator, name=None, history=None):
+
+        name = name or indicator.name
+        with self.lock:
+            self._indicators.setdefault(f'{symbol}_{time_frame}', {})[name] = indicator
+            if history is not None:
+                times = sorted(history)
+                indicator.seed([history[t] for t in times], times)
+        return name
+
+    def remove(self, symbol, time_frame, name):
+
+        with self.lock:
+            self._indicators.get(f'{symbol}_{time_frame}', {}).pop(name, None)
+
+    """Returns the current value of an indicator (None if unknown or not ready).
+    """
+
+    def get(self, symbol, time_frame, name):
+
+        indicator = self._indicators.get(f'{symbol}_{time_frame}', {}).get(name)
+        return None if indicator is None else indicator.value
+
+    """Returns the current values of all indicators of a SYMBOL_TIMEFRAME.
+    """
+
+    def values(self, symbol, time_frame):
+
+        with self.lock:
+            return {name: indicator.value for name, indicator
+                    in self._indicators.get(f'{symbol}_{time_frame}', {}).items()}
+
+    """Updates all indicators of a SYMBOL_TIMEFRAME with a new bar.
+    """
+
+    def update(self, symbol_tf, bar):
+
+        indicators = self._indicators.get(symbol_tf)
+        if not indicators:
+            return
+        with self.lock:
+            for indicator in indicators.values():
+                indicator.update(bar, bar.get('time'))
+
+    """Seeds all indicators of a SYMBOL_TIMEFRAME from historic data.
+
+    Historic data that ends before the last bar an indicator has seen
+    (e.g. an older time range) is ignored.
+    """
+
+    def seed(self, symbol_tf, data):
+
+        indicators = self._indicators.get(symbol_tf)
+        if not indicators or len(data) == 0:
+            return
+        times = sorted(data)
+        bars = [data[t] for t in times]
+        with self.lock:
+            for indicator in indicators.values():
+                if indicator.last_time is None or times[-1] >= indicator.last_time:
+                    indicator.seed(bars, times)
+
+    """Computes an indicator for all symbols of a time frame at once.
+
+    Requires numpy. Only the last num_bars bars that all symbols have
+    in common are used.
+
+    Args:
+        name (str): 'sma', 'ema', 'atr' or 'rsi'.
+        period (int): Period of the indicator.
+        time_frame (str): Time frame, e.g. 'H1'.
+        historic_data (dict): SYMBOL_TIMEFRAME -> time -> bar,
+            e.g. dwx.historic_data.
+        num_bars (int): Max. number of bars per symbol.
+
+    Returns:
+        dict: symbol -> last value, None if there are not enough bars.
+    """
+
+    def batch(self, name, period, time_frame, historic_data, num_bars=1000):
+
+        if np is None:
+            raise ImportError('numpy is needed for dwx_indicators.batch().')
+
+        symbols = []
+        columns = {'close': [], 'high': [], 'low': []}
+        for st, data in historic_data.items():
+            symbol, tf = st.rsplit('_', 1)
+            if tf != time_frame or len(data) == 0:
+                continue
+            symbols.append(symbol)
+            bars = [data[t] for t in sorted(data)[-num_bars:]]
+            for field, column in columns.items():
+                column.append(np.array([bar[field] for bar in bars], dtype=float))
+
+        if len(symbols) == 0:
+            return {}
+
+        length = min(len(column) for column in columns['close'])
+        arrays = {field: np.vstack([c[-length:] for c in column]) for field, column in columns.items()}
+        values = self.INDICATORS[name].batch(period, arrays['close'], arrays['high'], arrays['low'])
+        return {symbol: None if np.isnan(value) else float(value) for symbol, value in zip(symbols, values)}
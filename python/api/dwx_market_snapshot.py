@@ -0,0 +1,229 @@
+
+from array import array
+from threading import Lock
+
+
+"""Market data snapshot
+
+Stores the market data of all subscribed symbols in one float array per
+field (bid, ask, last, tick_value, ...) instead of one dictionary per
+symbol. Every symbol gets a fixed index on its first update and the
+values are overwritten in place, so that updates do not allocate new
+objects.
+
+It can be used like the previous dictionary:
+market_data['EURUSD']['bid'], 'EURUSD' in market_data,
+market_data.items() and so on.
+
+"""
+
+
+class dwx_market_snapshot():
+
+    FIELDS = ('bid', 'ask', 'last', 'tick_value', 'tick_size', 'margin_per_lot')
+
+    def __init__(self, capacity=64):
+
+        self._capacity = capacity
+        # symbol -> index into the arrays.
+        self._index = {}
+        self._symbols = []
+        self._views = []
+        # symbols that were removed from the subscription keep their index.
+        self._present = bytearray(capacity)
+        # fields that are not in FIELDS are added on first use.
+        self._columns = {}
+        for field in self.FIELDS:
+            self._add_column(field)
+
+        self.lock = Lock()
+
+    def _add_column(self, field):
+
+        self._columns[field] = array('d', [float('nan')]) * self._capacity
+
+    def _grow(self):
+
+        self._capacity *= 2
+        for column in self._columns.values():
+            column.extend(array('d', [float('nan')]) * (self._capacity - len(column)))
+        self._present.extend(bytearray(self._capacity - len(self._present)))
+
+    def _get_index(self, symbol):
+
+        i = self._index.get(symbol)
+        if i is None:
+            i = len(self._symbols)
+            if i >= self._capacity:
+                self._grow()
+            self._index[symbol] = i
+            self._symbols.append(symbol)
+            self._views.append(symbol_view(self, i, symbol))
+        return i
+
+    """Updates the values of one symbol in place.
+
+    Args:
+        symbol (str): Symbol name.
+        values (dict): field -> value, as sent by the mql server.
+
+    Returns:
+        bool: True if the symbol is new or any value changed.
+    """
+
+    def update(self, symbol, values):
+
+        with self.lock:
+            i = self._get_index(symbol)
+            changed = not self._present[i]
+            if changed:
+                # a symbol that is added again must not show values from before its removal.
+                for column in self._columns.values():
+                    column[i] = float('nan')
+            self._present[i] = 1
+            for field, value in values.items():
+                column = self._columns.get(field)
+                if column is None:
+                    self._add_column(field)
+                    column = self._columns[field]
+                if column[i] != value:
+                    column[i] = value
+                    changed = True
+            return changed
+
+    """Removes all symbols that are not in the given list,
+    e.g. after a full snapshot was received.
+    """
+
+    def retain(self, symbols):
+
+        with self.lock:
+            for i, symbol in enumerate(self._symbols):
+                if self._present[i] and symbol not in symbols:
+                    self._present[i] = 0
+
+    def __getitem__(self, symbol):
+
+        i = self._index.get(symbol)
+        if i is None or not self._present[i]:
+            raise KeyError(symbol)
+        return self._views[i]
+
+    def get(self, symbol, default=None):
+
+        try:
+            return self[symbol]
+        except KeyError:
+            return default
+
+    def __contains__(self, symbol):
+
+        i = self._index.get(symbol)
+        return i is not None and self._present[i] == 1
+
+    def __iter__(self):
+
+        return iter(self.keys())
+
+    def __len__(self):
+
+        return sum(self._present)
+
+    def keys(self):
+
+        return [symbol for i, symbol in enumerate(self._symbols) if self._present[i]]
+
+    def values(self):
+
+        return [self._views[i] for i in range(len(self._symbols)) if self._present[i]]
+
+    def items(self):
+
+        return [(view.symbol, view) for view in self.values()]
+
+    """Returns a consistent copy as dictionary (symbol -> field -> value).
+    """
+
+    def to_dict(self):
+
+        with self.lock:
+            return {view.symbol: view._to_dict() for view in self.values()}
+
+    def __eq__(self, other):
+
+        if isinstance(other, dwx_market_snapshot):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+
+        return repr(self.to_dict())
+
+
+"""Read-only view of the market data of one symbol.
+"""
+
+
+class symbol_view():
+
+    __slots__ = ('_snapshot', '_index', 'symbol')
+
+    def __init__(self, snapshot, index, symbol):
+
+        self._snapshot = snapshot
+        self._index = index
+        self.symbol = symbol
+
+    def __getitem__(self, field):
+
+        value = self._snapshot._columns[field][self._index]
+        # fields that were never sent for this symbol (e.g. 'last' with MT4).
+        if value != value:
+            raise KeyError(field)
+        return value
+
+    def get(self, field, default=None):
+
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __contains__(self, field):
+
+        return self.get(field) is not None
+
+    def __iter__(self):
+
+        return iter(self.keys())
+
+    def keys(self):
+
+        return [field for field, column in self._snapshot._columns.items()
+                if column[self._index] == column[self._index]]
+
+    def items(self):
+
+        return [(field, self[field]) for field in self.keys()]
+
+    def _to_dict(self):
+
+        return dict(self.items())
+
+    """Returns a consistent copy as dictionary (field -> value).
+    """
+
+    def to_dict(self):
+
+        with self._snapshot.lock:
+            return self._to_dict()
+
+    def __eq__(self, other):
+
+        if isinstance(other, symbol_view):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+
+        return repr(self.to_dict())
@@ -0,0 +1,237 @@
+
+from time import monotonic
+from itertools import count
+from threading import Lock
+
+
+"""Order overlay
+
+Keeps the order commands that were sent, but are not visible in the
+orders file yet, and applies them on top of the open orders, so that a
+strategy sees its own intent at once and does not send an order twice:
+
+    OPEN_ORDER: an order with the key 'pending_<n>' is added.
+    MODIFY_ORDER: the new price, stop loss and take profit are shown.
+    CLOSE_ORDER: the order is removed (or its lots reduced).
+    CLOSE_ALL_ORDERS, CLOSE_ORDERS_BY_SYMBOL, CLOSE_ORDERS_BY_MAGIC:
+        the orders that were open when it was sent are removed.
+
+The orders that come from the overlay have a 'pending' field with the
+command. A pending command is
+
+    confirmed as soon as the orders file shows its effect (e.g. a new
+        ticket with the same symbol, type and magic number, or the
+        closed ticket is gone),
+    rolled back if an ERROR message with its command_id arrives,
+    expired after timeout seconds (e.g. if the broker changed the
+        requested values, so that the effect can not be recognized).
+
+Args:
+    timeout (float): Seconds after which a pending command is dropped.
+
+"""
+
+
+class dwx_order_overlay():
+
+    COMMANDS = ['OPEN_ORDER', 'MODIFY_ORDER', 'CLOSE_ORDER', 'CLOSE_ALL_ORDERS',
+                'CLOSE_ORDERS_BY_SYMBOL', 'CLOSE_ORDERS_BY_MAGIC']
+
+    def __init__(self, timeout=5):
+
+        self.timeout = timeout
+        # number -> pending command (dict).
+        self._pending = {}
+        self._numbers = count(1)
+        self._lock = Lock()
+        # number of pending commands that were confirmed, rolled back or expired.
+        self.confirmed = 0
+        self.rolled_back = 0
+        self.expired = 0
+
+    """Adds a pending command.
+
+    Args:
+        command (str), content (str): As sent to the mql server.
+        open_orders (dict): Open orders when the command was sent.
+
+    Returns:
+        dict: The pending command, or None if it is not an order command 
+            or the content could not be parsed (the mql server will 
+            answer with an error, so it is not shown). 
+    """
+
+    def add(self, command, content, open_orders):
+
+        if command not in self.COMMANDS:
+            return None
+
+        try:
+            pending = self._parse(command, content, open_orders)
+        except (ValueError, IndexError, KeyError, TypeError):
+            return None
+
+        with self._lock:
+            self._pending[pending['number']] = pending
+        return pending
+
+    def _parse(self, command, content, open_orders):
+
+        # the magic number of CLOSE_ORDERS_BY_MAGIC can be an int.
+        content = str(content)
+        fields = content.split(',')
+        pending = {'number': next(self._numbers), 'command': command, 'command_id': None,
+                   'time': monotonic()}
+
+        if command == 'OPEN_ORDER':
+            symbol, order_type, lots, price, stop_loss, take_profit, magic, comment = fields[:8]
+            pending['order'] = {'magic': int(magic), 'symbol': symbol, 'lots': float(lots),
+                                'type': order_type, 'open_price': float(price),
+                                'SL': float(stop_loss), 'TP': float(take_profit),
+                                'pnl': 0.0, 'swap': 0.0, 'comment': comment}
+            pending['known_tickets'] = set(open_orders)
+        elif command == 'MODIFY_ORDER':
+            pending['ticket'] = fields[0]
+            pending['values'] = {'open_price': float(fields[1]), 'SL': float(fields[2]),
+                                 'TP': float(fields[3])}
+        elif command == 'CLOSE_ORDER':
+            ticket = fields[0]
+            lots = float(fields[1]) if len(fields) > 1 and fields[1] != '' else 0
+            order = open_orders.get(ticket)
+            # a partial close reduces the lots, everything else removes the order.
+            if order is not None and 0 < lots < order['lots']:
+                pending['ticket'] = ticket
+                pending['lots'] = lots
+                pending['lots_before'] = order['lots']
+            else:
+                pending['tickets'] = {ticket}
+        else:
+            pending['tickets'] = {ticket for ticket, order in open_orders.items()
+                                  if (command != 'CLOSE_ORDERS_BY_SYMBOL' or order.get('symbol') == content)
+                                  and (command != 'CLOSE_ORDERS_BY_MAGIC' or str(order.get('magic')) == content)}
+
+        return pending
+
+    """Sets the command ID, under which the command was sent.
+    """
+
+    def set_command_id(self, pending, command_id):
+
+        if pending is not None:
+            pending['command_id'] = command_id
+
+    """Removes a pending command, e.g. if it could not be sent or was
+    superseded.
+    """
+
+    def remove(self, pending):
+
+        if pending is not None:
+            with self._lock:
+                self._pending.pop(pending['number'], None)
+
+    """Confirms the pending commands whose effect is visible in the new
+    open orders and drops the expired ones.
+    """
+
+    def on_orders(self, open_orders):
+
+        with self._lock:
+            self._expire()
+            # every new ticket can only confirm one pending OPEN_ORDER.
+            claimed = set()
+            for number, pending in list(self._pending.items()):
+                if self._is_confirmed(pending, open_orders, claimed):
+                    del self._pending[number]
+                    self.confirmed += 1
+
+    def _is_confirmed(self, pending, open_orders, claimed):
+
+        command = pending['command']
+        if command == 'OPEN_ORDER':
+            intent = pending['order']
+            for ticket, order in open_orders.items():
+                if ticket in pending['known_tickets'] or ticket in claimed:
+                    continue
+                if order.get('symbol') == intent['symbol'] and order.get('type') == intent['type'] \
+                        and int(order.get('magic', 0)) == intent['magic']:
+                    claimed.add(ticket)
+                    return True
+            return False
+        if command == 'MODIFY_ORDER':
+            order = open_orders.get(pending['ticket'])
+            if order is None:
+                return True
+            values = pending['values']
+            # the price is only changed for pending orders (non-zero).
+            return all(abs(order.get(field, 0) - value) < 1e-6 for field, value in values.items()
+                       if field != 'open_price' or value != 0)
+        if 'lots' in pending:
+            order = open_orders.get(pending['ticket'])
+            return order is None or order['lots'] < pending['lots_before']
+        return all(ticket not in open_orders for ticket in pending['tickets'])
+
+    """Rolls back the pending command of an ERROR message with command_id.
+
+    Returns:
+        dict: The pending command that was rolled back, or None.
+    """
+
+    def on_message(self, message):
+
+        if message.get('type') != 'ERROR' or 'command_id' not in message:
+            return None
+        with self._lock:
+            for number, pending in list(self._pending.items()):
+                if pending['command_id'] == message['command_id']:
+                    del self._pending[number]
+                    self.rolled_back += 1
+                    return pending
+        return None
+
+    def _expire(self):
+
+        now = monotonic()
+        for number, pending in list(self._pending.items()):
+            if now > pending['time'] + self.timeout:
+                del self._pending[number]
+                self.expired += 1
+
+    """Returns the pending commands (oldest first).
+    """
+
+    def pending(self):
+
+        with self._lock:
+            self._expire()
+            return [dict(pending) for pending in self._pending.values()]
+
+    """Returns the open orders with the pending commands applied.
+    """
+
+    def apply(self, open_orders):
+
+        with self._lock:
+            self._expire()
+            if len(self._pending) == 0:
+                return dict(open_orders)
+            orders = dict(open_orders)
+            for number, pending in self._pending.items():
+                command = pending['command']
+                if command == 'OPEN_ORDER':
+                    orders[f'pending_{number}'] = dict(pending['order'], pending=command)
+                elif command == 'MODIFY_ORDER':
+                    order = orders.get(pending['ticket'])
+                    if order is not None:
+                        values = {field: value for field, value in pending['values'].items()
+                                  if field != 'open_price' or value != 0}
+                        orders[pending['ticket']] = dict(order, **values, pending=command)
+                elif 'lots' in pending:
+                    order = orders.get(pending['ticket'])
+                    if order is not None:
+                        orders[pending['ticket']] = dict(order, lots=max(0.0, order['lots'] - pending['lots']),
+                                                         pending=command)
+                else:
+                    for ticket in pending['tickets']:
+                        orders.pop(ticket, None)
+            return orders
@@ -0,0 +1,587 @@
+
+from heapq import heappush, heappop, heapify
+from itertools import count
+from threading import RLock
+from datetime import datetime, timezone
+
+
+"""Paper trading simulator
+
+Simulates the order functions of dwx_client (open_order, modify_order,
+close_order, close_all_orders, close_orders_by_symbol and
+close_orders_by_magic) against live or recorded ticks, without sending
+anything to MetaTrader.
+
+open_orders, account_info, historic_trades, the messages and
+on_order_event() have the same format as with dwx_client.
+
+For live ticks, the paper trader is used as event handler of the
+dwx_client and forwards all events to the actual event handler:
+
+    paper = dwx_paper_trader(my_handler)
+    client = dwx_client(paper, metatrader_dir_path)
+    paper.dwx = client
+
+Functions that are not simulated (e.g. subscribe_symbols()) are passed
+on to paper.dwx, so that a strategy can use the paper trader like a
+dwx_client. Recorded ticks can be replayed with run(ticks).
+
+Pending orders, stop losses and take profits are kept in one heap per
+symbol, price side and direction, so that a tick only has to look at
+the orders that are triggered.
+
+Args:
+    event_handler: Same event handler as for dwx_client.
+    dwx (dwx_client): Client for all functions that are not simulated.
+    balance (float): Initial balance.
+    currency (str): Account currency.
+    leverage (int): Leverage for the margin calculation.
+    contract_size (float): Units per lot. The profit is
+        price difference * lots * tick_value / tick_size in the account
+        currency. tick_value and tick_size are taken from tick_values or
+        from dwx.market_data. Without them, the profit is
+        price difference * lots * contract_size, which is only in the
+        account currency if the symbol is quoted in it.
+    contract_sizes (dict): symbol -> contract size, if different.
+    tick_values (dict): symbol -> (tick_value, tick_size), e.g. for
+        replayed ticks.
+    slippage (float or function): Price difference by which market
+        orders and stop orders/losses are filled worse than the tick.
+        Can be a function f(symbol, order_type) returning the slippage.
+    latency (float): Seconds (in tick time) until an order function
+        is executed.
+
+"""
+
+
+class dwx_paper_trader():
+
+    ORDER_TYPES = ['buy', 'sell', 'buylimit', 'selllimit', 'buystop', 'sellstop']
+
+    # order type -> (price side, direction) that fills a pending order.
+    # direction 1: price >= level, -1: price <= level.
+    FILL_TRIGGERS = {'buylimit': ('ask', -1), 'selllimit': ('bid', 1),
+                     'buystop': ('ask', 1), 'sellstop': ('bid', -1)}
+
+    def __init__(self, event_handler=None, dwx=None,
+                 balance=10000.0, currency='USD', leverage=100,
+                 contract_size=100000, contract_sizes=None, tick_values=None,
+                 slippage=0.0, latency=0.0, verbose=True):
+
+        self.event_handler = event_handler
+        self.dwx = dwx
+        self.balance = balance
+        self.currency = currency
+        self.leverage = leverage
+        self.contract_size = contract_size
+        self.contract_sizes = contract_sizes or {}
+        self.tick_values = tick_values or {}
+        self.slippage = slippage
+        self.latency = latency
+        self.verbose = verbose
+
+        # ticket -> paper_order
+        self._orders = {}
+        # symbol -> [bid, ask]
+        self._prices = {}
+        # (symbol, side, direction) -> heap of (key, n, ticket, version, kind)
+        self._triggers = {}
+        # heap of (expiration, n, ticket, version)
+        self._expirations = []
+        # heap key ((symbol, side, direction) or 'expiration') -> number of
+        # entries of old order versions, which are removed once they are the majority.
+        self._dead_entries = {}
+        # heap of (time, n, function, args) for the latency.
+        self._actions = []
+
+        self._tickets = count(1)
+        self._deal_tickets = count(1)
+        self._counter = count()
+
+        self.historic_trades = {}
+        self.time = datetime.now(timezone.utc).timestamp()
+
+        self._pending_messages = []
+        self._order_event = False
+
+        self.lock = RLock()
+
+    def __getattr__(self, name):
+
+        # only called for attributes that are not simulated. Events are
+        # answered by the event handler, so that hasattr() checks of the
+        # client for optional events (e.g. on_stale) see the event handler.
+        if name.startswith('on_'):
+            if self.__dict__.get('event_handler') is None:
+                raise AttributeError(name)
+            return getattr(self.event_handler, name)
+        if name == 'dwx' or self.__dict__.get('dwx') is None:
+            raise AttributeError(name)
+        return getattr(self.dwx, name)
+
+    """Open orders in the same format as dwx_client.open_orders.
+    """
+
+    @property
+    def open_orders(self):
+
+        with self.lock:
+            return {str(ticket): order.to_dict(self._pnl(order))
+                    for ticket, order in self._orders.items()}
+
+    """Account information in the same format as dwx_client.account_info.
+    """
+
+    @property
+    def account_info(self):
+
+        with self.lock:
+            pnl = 0.0
+            margin = 0.0
+            for order in self._orders.values():
+                if order.type in ['buy', 'sell']:
+                    pnl += self._pnl(order)
+                    margin += order.lots * self._value_per_price(order.symbol) * order.open_price / self.leverage
+            equity = self.balance + pnl
+            return {'name': 'paper', 'number': 0, 'currency': self.currency,
+                    'leverage': self.leverage, 'free_margin': equity - margin,
+                    'balance': self.balance, 'equity': equity}
+
+    """Replays recorded ticks.
+
+    Args:
+        ticks (iterable): (time, symbol, bid, ask) with time as timestamp in seconds.
+    """
+
+    def run(self, ticks):
+
+        for time, symbol, bid, ask in ticks:
+            self.on_tick(symbol, bid, ask, time)
+
+    """Processes a tick and forwards it to the event handler.
+
+    Args:
+        time (float): Tick time as timestamp. If None, the current time is used.
+    """
+
+    def on_tick(self, symbol, bid, ask, time=None):
+
+        with self.lock:
+            self.time = time if time is not None else datetime.now(timezone.utc).timestamp()
+            self._prices[symbol] = [bid, ask]
+
+            while len(self._actions) > 0 and self._actions[0][0] <= self.time:
+                _, _, function, args = heappop(self._actions)
+                function(*args)
+
+            self._check_triggers(symbol, bid, ask)
+            self._check_expirations()
+
+        self._dispatch_events()
+
+        if self.event_handler is not None:
+            self.event_handler.on_tick(symbol, bid, ask)
+
+    def on_bar_data(self, *args):
+
+        if self.event_handler is not None:
+            self.event_handler.on_bar_data(*args)
+
+    def on_historic_data(self, *args):
+
+        if self.event_handler is not None:
+            self.event_handler.on_historic_data(*args)
+
+    def on_historic_trades(self):
+
+        if self.event_handler is not None:
+            self.event_handler.on_historic_trades()
+
+    def on_message(self, message):
+
+        if self.event_handler is not None:
+            self.event_handler.on_message(message)
+
+    # orders of the real account are ignored.
+    def on_order_event(self):
+
+        pass
+
+    def open_order(self, symbol='EURUSD',
+                   order_type='buy',
+                   lots=0.01,
+                   price=0,
+                   stop_loss=0,
+                   take_profit=0,
+                   magic=0,
+                   comment='',
+                   expiration=0):
+
+        return self._submit(self._open_order, [symbol, order_type, float(lots), float(price),
+                                               float(stop_loss), float(take_profit), int(magic),
+                                               comment, int(expiration)])
+
+    def modify_order(self, ticket,
+                     price=0,
+                     stop_loss=0,
+                     take_profit=0,
+                     expiration=0):
+
+        return self._submit(self._modify_order, [int(ticket), float(price), float(stop_loss),
+                                                 float(take_profit), int(expiration)])
+
+    def close_order(self, ticket, lots=0):
+
+        return self._submit(self._close_order, [int(ticket), float(lots)])
+
+    def close_all_orders(self):
+
+        return self._submit(self._close_orders, ['', lambda order: True])
+
+    def close_orders_by_symbol(self, symbol):
+
+        return self._submit(self._close_orders, [f' with symbol {symbol}',
+                                                 lambda order: order.symbol == symbol])
+
+    def close_orders_by_magic(self, magic):
+
+        return self._submit(self._close_orders, [f' with magic {magic}',
+                                                 lambda order: order.magic == int(magic)])
+
+    def _submit(self, function, args):
+
+        with self.lock:
+            if self.latency > 0:
+                heappush(self._actions, (self.time + self.latency, next(self._counter), function, args))
+            else:
+                function(*args)
+        self._dispatch_events()
+        return True
+
+    def _open_order(self, symbol, order_type, lots, price, stop_loss, take_profit,
+                    magic, comment, expiration):
+
+        if order_type not in self.ORDER_TYPES:
+            self._send_error('OPEN_ORDER_TYPE', f'Order type could not be parsed: {order_type}')
+            return
+        if lots <= 0:
+            self._send_error('OPEN_ORDER_LOTSIZE_OUT_OF_RANGE', f'Lot size out of range: {lots}')
+            return
+        if order_type in ['buy', 'sell']:
+            if symbol not in self._prices:
+                self._send_error('OPEN_ORDER_PRICE_ZERO', f'No tick received for {symbol}.')
+                return
+        elif price <= 0:
+            self._send_error('OPEN_ORDER_PRICE_ZERO', f'Price is zero: {symbol}, {order_type}')
+            return
+
+        order = paper_order(next(self._tickets), magic, symbol, lots, order_type, price,
+                            self._time_string(self.time), stop_loss, take_profit, comment, expiration)
+        self._orders[order.ticket] = order
+
+        if order_type in ['buy', 'sell']:
+            self._fill(order)
+        else:
+            self._schedule(order)
+        self._order_event = True
+        self._send_info(f'Successfully sent order: {symbol}, {order_type}, {lots:.2f}, {order.open_price:.5f}')
+
+    def _modify_order(self, ticket, price, stop_loss, take_profit, expiration):
+
+        order = self._orders.get(ticket)
+        if order is None:
+            self._send_error('MODIFY_ORDER_SELECT_TICKET', f'Could not select order with ticket: {ticket}')
+            return
+
+        if price > 0 and order.type not in ['buy', 'sell']:
+            order.open_price = price
+        order.SL = stop_loss
+        order.TP = take_profit
+        order.expiration = expiration
+        self._schedule(order)
+        self._send_info(f'Successfully modified order {ticket}: {order.symbol}, {order.type}, '
+                        f'{order.open_price:.5f}, {stop_loss:.5f}, {take_profit:.5f}')
+
+    def _close_order(self, ticket, lots):
+
+        order = self._orders.get(ticket)
+        if order is None:
+            self._send_error('CLOSE_ORDER_SELECT_TICKET', f'Could not select order with ticket: {ticket}')
+            return
+
+        if lots <= 0 or lots > order.lots:
+            lots = order.lots
+        self._close(order, lots)
+        self._send_info(f'Successfully closed order: {ticket}, {order.symbol}, {lots:.2f}')
+
+    def _close_orders(self, description, condition):
+
+        orders = [order for order in self._orders.values() if condition(order)]
+        if len(orders) == 0:
+            self._send_info(f'No orders to close{description}.')
+            return
+        for order in orders:
+            self._close(order, 0)
+        self._send_info(f'Successfully closed {len(orders)} orders{description}.')
+
+    """Fills a market order or a triggered pending order at the current price.
+
+    Limit orders are filled at the limit price, or at the market price if
+    it is better (gap), without slippage.
+    """
+
+    def _fill(self, order):
+
+        bid, ask = self._prices[order.symbol]
+        if order.type == 'buylimit':
+            order.open_price = min(order.open_price, ask)
+        elif order.type == 'selllimit':
+            order.open_price = max(order.open_price, bid)
+        elif order.type.startswith('buy'):
+            order.open_price = ask + self._slippage(order.symbol, 'buy')
+        else:
+            order.open_price = bid - self._slippage(order.symbol, 'sell')
+        order.type = 'buy' if order.type.startswith('buy') else 'sell'
+        order.open_time = self._time_string(self.time)
+        order.expiration = 0
+        self._add_deal(order, order.lots, 'entry_in', order.open_price, 0.0)
+        self._schedule(order)
+
+    """Closes a position (completely if lots is 0) or deletes a pending order.
+    """
+
+    def _close(self, order, lots, price=None, slippage=True):
+
+        if order.type not in ['buy', 'sell']:
+            self._remove(order)
+            return
+
+        if lots <= 0 or lots >= order.lots:
+            lots = order.lots
+
+        if price is None:
+            bid, ask = self._prices[order.symbol]
+            price = bid if order.type == 'buy' else ask
+        if slippage:
+            side = 'sell' if order.type == 'buy' else 'buy'
+            s = self._slippage(order.symbol, side)
+            price = price - s if order.type == 'buy' else price + s
+
+        pnl = self._pnl(order, price, lots)
+        self.balance += pnl
+        self._add_deal(order, lots, 'entry_out', price, pnl)
+
+        order.lots = round(order.lots - lots, 8)
+        if order.lots <= 0:
+            self._remove(order)
+
+    def _remove(self, order):
+
+        self._orders.pop(order.ticket, None)
+        # remaining heap entries are ignored because of the version.
+        self._new_version(order)
+        self._order_event = True
+
+    """Increases the version of an order, which makes its heap entries dead. 
+    """
+
+    def _new_version(self, order):
+
+        order.version += 1
+        for key in order.entries:
+            self._dead_entries[key] = self._dead_entries.get(key, 0) + 1
+        order.entries = set()
+
+    def _push(self, key, heap, entry, order):
+
+        heappush(heap, entry)
+        order.entries.add(key)
+        # e.g. a trailing stop that is modified on every tick.
+        if self._dead_entries.get(key, 0) > len(heap) // 2:
+            heap[:] = [e for e in heap if self._is_live(e[2], e[3])]
+            heapify(heap)
+            self._dead_entries[key] = 0
+
+    def _is_live(self, ticket, version):
+
+        order = self._orders.get(ticket)
+        return order is not None and order.version == version
+
+    """Returns the order of a heap entry that was popped, or None if the 
+    entry is dead. 
+    """
+
+    def _pop_order(self, key, ticket, version):
+
+        if not self._is_live(ticket, version):
+            self._dead_entries[key] -= 1
+            return None
+        order = self._orders[ticket]
+        order.entries.discard(key)
+        return order
+
+    """Adds the heap entries for the fill of a pending order,
+    stop loss, take profit and expiration.
+    """
+
+    def _schedule(self, order):
+
+        self._new_version(order)
+
+        triggers = []
+        if order.type in self.FILL_TRIGGERS:
+            triggers.append(self.FILL_TRIGGERS[order.type] + ('fill', order.open_price))
+            if order.expiration > 0:
+                self._push('expiration', self._expirations,
+                           (order.expiration, next(self._counter), order.ticket, order.version), order)
+        else:
+            side = 'bid' if order.type == 'buy' else 'ask'
+            direction = -1 if order.type == 'buy' else 1
+            if order.SL > 0:
+                triggers.append((side, direction, 'sl', order.SL))
+            if order.TP > 0:
+                triggers.append((side, -direction, 'tp', order.TP))
+
+        for side, direction, kind, level in triggers:
+            key = (order.symbol, side, direction)
+            heap = self._triggers.setdefault(key, [])
+            self._push(key, heap, (level * direction, next(self._counter), order.ticket, order.version, kind), order)
+
+    def _check_triggers(self, symbol, bid, ask):
+
+        for side, price in [['bid', bid], ['ask', ask]]:
+            for direction in [1, -1]:
+                heap = self._triggers.get((symbol, side, direction))
+                # key is level for direction 1 and -level for direction -1.
+                while heap and heap[0][0] <= price * direction:
+                    _, _, ticket, version, kind = heappop(heap)
+                    order = self._pop_order((symbol, side, direction), ticket, version)
+                    if order is None:
+                        continue
+                    if kind == 'fill':
+                        self._fill(order)
+                        self._order_event = True
+                    elif kind == 'tp':
+                        self._close(order, 0, price, slippage=False)
+                    else:
+                        self._close(order, 0, price)
+
+    def _check_expirations(self):
+
+        while len(self._expirations) > 0 and self._expirations[0][0] <= self.time:
+            _, _, ticket, version = heappop(self._expirations)
+            order = self._pop_order('expiration', ticket, version)
+            if order is not None:
+                self._remove(order)
+
+    def _pnl(self, order, price=None, lots=None):
+
+        if order.type not in ['buy', 'sell']:
+            return 0.0
+        if price is None:
+            prices = self._prices.get(order.symbol)
+            if prices is None:
+                return 0.0
+            price = prices[0] if order.type == 'buy' else prices[1]
+        if lots is None:
+            lots = order.lots
+        difference = price - order.open_price if order.type == 'buy' else order.open_price - price
+        return difference * lots * self._value_per_price(order.symbol)
+
+    # account currency per lot and price unit.
+    def _value_per_price(self, symbol):
+
+        tick_value, tick_size = self.tick_values.get(symbol, (0, 0))
+        if not tick_value > 0 and self.__dict__.get('dwx') is not None:
+            values = self.dwx.market_data.get(symbol, {})
+            # NaN if the server did not send them.
+            tick_value, tick_size = values.get('tick_value') or 0, values.get('tick_size') or 0
+        if tick_value > 0 and tick_size > 0:
+            return tick_value / tick_size
+        return self.contract_sizes.get(symbol, self.contract_size)
+
+    def _slippage(self, symbol, order_type):
+
+        if callable(self.slippage):
+            return self.slippage(symbol, order_type)
+        return self.slippage
+
+    def _add_deal(self, order, lots, entry, price, pnl):
+
+        is_buy = (order.type == 'buy') == (entry == 'entry_in')
+        self.historic_trades[str(next(self._deal_tickets))] = {
+            'magic': order.magic, 'symbol': order.symbol, 'lots': lots,
+            'type': 'buy' if is_buy else 'sell', 'entry': entry,
+            'deal_time': self._time_string(self.time), 'deal_price': price,
+            'pnl': pnl, 'commission': 0.0, 'swap': 0.0, 'comment': order.comment}
+
+    def _time_string(self, timestamp):
+
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y.%m.%d %H:%M:%S')
+
+    def _send_info(self, message):
+
+        if self.verbose:
+            print('INFO:', message)
+        self._pending_messages.append({'type': 'INFO', 'time': self._time_string(self.time),
+                                       'message': message})
+
+    def _send_error(self, error_type, description):
+
+        if self.verbose:
+            print('ERROR:', error_type, '|', description)
+        self._pending_messages.append({'type': 'ERROR', 'time': self._time_string(self.time),
+                                       'error_type': error_type, 'description': description})
+
+    """Triggers on_message() and on_order_event() outside of the lock,
+    so that the event handler can call the order functions again.
+    """
+
+    def _dispatch_events(self):
+
+        with self.lock:
+            messages = self._pending_messages
+            self._pending_messages = []
+            order_event = self._order_event
+            self._order_event = False
+
+        if self.event_handler is None:
+            return
+        for message in messages:
+            self.event_handler.on_message(message)
+        if order_event:
+            self.event_handler.on_order_event()
+
+
+"""Order of the paper trader.
+"""
+
+
+class paper_order():
+
+    __slots__ = ('ticket', 'magic', 'symbol', 'lots', 'type', 'open_price', 'open_time',
+                 'SL', 'TP', 'comment', 'expiration', 'version', 'entries')
+
+    def __init__(self, ticket, magic, symbol, lots, order_type, open_price, open_time,
+                 stop_loss, take_profit, comment, expiration):
+
+        self.ticket = ticket
+        self.magic = magic
+        self.symbol = symbol
+        self.lots = lots
+        self.type = order_type
+        self.open_price = open_price
+        self.open_time = open_time
+        self.SL = stop_loss
+        self.TP = take_profit
+        self.comment = comment
+        self.expiration = expiration
+        self.version = 0
+        # keys of the heaps with a live entry of this version.
+        self.entries = set()
+
+    def to_dict(self, pnl):
+
+        return {'magic': self.magic, 'symbol': self.symbol, 'lots': self.lots,
+                'type': self.type, 'open_price': self.open_price, 'open_time': self.open_time,
+                'SL': self.SL, 'TP': self.TP, 'pnl': pnl, 'swap': 0.0, 'comment': self.comment}
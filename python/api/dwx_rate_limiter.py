@@ -0,0 +1,162 @@
+
+from time import sleep, monotonic
+from threading import Lock
+
+
+"""Token bucket
+
+Allows rate commands per second on average and bursts of up to
+capacity commands. The tokens can become negative, which reserves
+tokens for commands that are waiting.
+
+"""
+
+
+class token_bucket():
+
+    def __init__(self, rate, capacity=None, now=None):
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self._last_time = monotonic() if now is None else now
+
+    def _refill(self, now):
+
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_time) * self.rate)
+        self._last_time = now
+
+    """Returns the seconds until the next token is available.
+    """
+
+    def wait_time(self, now):
+
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+
+        self.tokens -= 1
+
+
+"""Command rate limiter
+
+Limits the commands that are sent to the mql server with token buckets
+per command type and per symbol.
+
+Args:
+    command_limits (dict): command -> (rate, capacity) or token_bucket.
+        The key '*' limits all commands together.
+    symbol_limits (dict): symbol -> (rate, capacity) or token_bucket.
+        The key '*' is used as default, every symbol gets its own bucket.
+    mode (str): What happens if a command is over the limit:
+        'block': waits until the command is allowed.
+        'reject': the command is not sent.
+        'queue': waits at most max_wait seconds, else the command is not sent.
+    max_wait (float): Deadline in seconds for mode 'queue'.
+    time_function, sleep_function: Clock and sleep, e.g. to replace them
+        in tests. Buckets that are passed as token_bucket must use the
+        same clock.
+
+The client does not check the limiter for the commands that close
+orders (dwx_client.RATE_LIMIT_EXEMPT_COMMANDS), limits that are set
+for them have no effect.
+
+"""
+
+
+class dwx_rate_limiter():
+
+    MODES = ['block', 'reject', 'queue']
+
+    def __init__(self, command_limits=None, symbol_limits=None,
+                 mode='block', max_wait=1.0,
+                 time_function=monotonic, sleep_function=sleep):
+
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown rate limiter mode: {mode}')
+
+        self.mode = mode
+        self.max_wait = max_wait
+        self.time_function = time_function
+        self.sleep_function = sleep_function
+
+        self._command_buckets = {command: self._to_bucket(limit)
+                                 for command, limit in (command_limits or {}).items()}
+        self._symbol_limits = dict(symbol_limits or {})
+        self._symbol_buckets = {}
+
+        # command -> number of commands that had to wait / were not sent.
+        self.throttled = {}
+        self.rejected = {}
+        self.wait_seconds = 0.0
+
+        self.lock = Lock()
+
+    def _to_bucket(self, limit):
+
+        if isinstance(limit, token_bucket):
+            return limit
+        return token_bucket(*limit, now=self.time_function())
+
+    def _get_buckets(self, command, symbol):
+
+        buckets = []
+        for key in [command, '*']:
+            if key in self._command_buckets:
+                buckets.append(self._command_buckets[key])
+
+        if symbol is not None:
+            bucket = self._symbol_buckets.get(symbol)
+            if bucket is None:
+                limit = self._symbol_limits.get(symbol, self._symbol_limits.get('*'))
+                if limit is not None:
+                    bucket = self._to_bucket(limit)
+                    self._symbol_buckets[symbol] = bucket
+            if bucket is not None:
+                buckets.append(bucket)
+        return buckets
+
+    """Waits until a command is allowed, depending on the mode.
+
+    Args:
+        command (str): Command name, e.g. 'OPEN_ORDER'.
+        symbol (str): Symbol of the command or None.
+
+    Returns:
+        bool: True if the command can be sent.
+    """
+
+    def acquire(self, command, symbol=None):
+
+        with self.lock:
+            buckets = self._get_buckets(command, symbol)
+            now = self.time_function()
+            wait = max([bucket.wait_time(now) for bucket in buckets], default=0.0)
+
+            if wait > 0:
+                if self.mode == 'reject' or (self.mode == 'queue' and wait > self.max_wait):
+                    self.rejected[command] = self.rejected.get(command, 0) + 1
+                    return False
+                self.throttled[command] = self.throttled.get(command, 0) + 1
+                self.wait_seconds += wait
+
+            # the tokens are reserved now, so that later commands wait longer.
+            for bucket in buckets:
+                bucket.take()
+
+        if wait > 0:
+            self.sleep_function(wait)
+        return True
+
+    """Returns the number of throttled and rejected commands.
+    """
+
+    def get_metrics(self):
+
+        with self.lock:
+            return {'throttled': dict(self.throttled),
+                    'rejected': dict(self.rejected),
+                    'wait_seconds': self.wait_seconds}
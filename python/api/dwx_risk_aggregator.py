@@ -0,0 +1,276 @@
+
+from time import time
+from collections import deque
+from threading import Lock
+
+
+"""Risk aggregator
+
+Keeps the net lots, the notional exposure, the margin and the floating
+pnl of the open positions per symbol, per magic number and per currency
+(notional only), so that a
+pre-trade check is one dictionary lookup instead of a loop over all
+open orders:
+
+    risk = dwx_risk_aggregator()
+    dwx = dwx_client(processor, metatrader_dir_path, risk_aggregator=risk)
+    ...
+    if abs(risk.get_symbol('EURUSD')['net_lots']) + lots > max_lots:
+
+It is rebuilt on every orders update and on a tick only the positions
+of that symbol are recomputed, and the difference is applied to the
+totals of their magic numbers and currencies.
+
+Values are in the account currency, computed with the tick value and
+tick size of the market data (value of a price change of one per lot =
+tick_value / tick_size):
+
+    notional = lots * mid price * tick_value / tick_size, positive for
+        buy and negative for sell positions. Until the first tick of a
+        symbol, the open price is used instead of the mid price.
+    pnl = lots * (bid or ask - open price) * tick_value / tick_size
+        + swap + commission. Until the first tick of a symbol, the pnl
+        of the server is used.
+    margin = lots * margin_per_lot of the market data, or
+        abs(notional) / leverage of the account without it. Reduced
+        margins of hedged positions are not taken into account, the
+        margin of the account is in account_margin.
+
+Positions of symbols without market data (not subscribed) have no
+notional and margin. They are counted in 'unpriced', so that a check can
+see that the totals are incomplete.
+
+A currency exposure is the notional of the symbols with that currency
+as base (positive) or quote currency (negative). The currencies are
+taken from symbol_currencies, or from the first six letters of the
+symbol (e.g. 'EURUSD.a' -> EUR, USD). Other symbols only count for the
+symbol and magic number. Pending orders are not included.
+
+The equity (balance + floating pnl) is sampled every sample_seconds.
+
+Kwargs:
+    sample_seconds (float): Interval of the equity series.
+    max_samples (int): Length of the equity series.
+    symbol_currencies (dict): symbol -> (base currency, quote currency).
+
+"""
+
+
+class dwx_risk_aggregator():
+
+    def __init__(self, sample_seconds=1, max_samples=86400, symbol_currencies=None):
+
+        self.sample_seconds = sample_seconds
+        self.symbol_currencies = symbol_currencies or {}
+        # (time, equity) tuples.
+        self.equity_series = deque(maxlen=max_samples)
+        self._last_sample_time = 0
+        self._lock = Lock()
+
+        self.balance = 0.0
+        self.leverage = 0
+        self.floating_pnl = 0.0
+        self.margin = 0.0
+        # equity - free margin of the account_info, None if not known.
+        self.account_margin = None
+        # symbol -> list of (magic, side, lots, open_price, swap and commission, server pnl).
+        self._positions = {}
+        # symbol -> magic -> [net_lots, notional, pnl, margin, unpriced], the last values of the symbol.
+        self._parts = {}
+        # symbol or magic -> {'net_lots', 'notional', 'pnl', 'margin', 'unpriced'}, currency -> notional.
+        self._symbols = {}
+        self._magics = {}
+        self._currencies = {}
+
+    """Rebuilds everything from the open orders.
+
+    Args:
+        open_orders (dict): ticket -> order, as in dwx_client.open_orders.
+        account_info (dict): As in dwx_client.account_info.
+        market_data: symbol -> values (bid, ask, tick_value, tick_size,
+            margin_per_lot).
+    """
+
+    def on_orders(self, open_orders, account_info, market_data):
+
+        positions = {}
+        for order in open_orders.values():
+            if order.get('type') not in ('buy', 'sell'):
+                continue
+            positions.setdefault(order['symbol'], []).append(
+                (int(order.get('magic', 0)), 1 if order['type'] == 'buy' else -1, order['lots'],
+                 order['open_price'], order.get('swap', 0) + order.get('commission', 0),
+                 order.get('pnl', 0)))
+
+        with self._lock:
+            self.balance = account_info.get('balance', self.balance)
+            self.leverage = account_info.get('leverage', self.leverage)
+            if 'equity' in account_info and 'free_margin' in account_info:
+                self.account_margin = account_info['equity'] - account_info['free_margin']
+            self._positions = positions
+            self._parts = {}
+            self._symbols = {}
+            self._magics = {}
+            self._currencies = {}
+            self.floating_pnl = 0.0
+            self.margin = 0.0
+            for symbol in positions:
+                self._parts[symbol] = self._compute_parts(symbol, market_data.get(symbol))
+                self._apply(symbol, self._parts[symbol], 1)
+            self._sample()
+
+    """Recomputes the positions of one symbol with its new tick.
+
+    Args:
+        symbol (str): Symbol of the tick.
+        values: Market data of the symbol (bid, ask, tick_value, tick_size,
+            margin_per_lot).
+    """
+
+    def on_tick(self, symbol, values):
+
+        with self._lock:
+            if symbol in self._positions:
+                self._apply(symbol, self._parts[symbol], -1)
+                self._parts[symbol] = self._compute_parts(symbol, values)
+                self._apply(symbol, self._parts[symbol], 1)
+            self._sample()
+
+    def _compute_parts(self, symbol, values):
+
+        bid = ask = value_per_price = margin_per_lot = None
+        if values is not None:
+            bid, ask = values.get('bid'), values.get('ask')
+            tick_value, tick_size = values.get('tick_value'), values.get('tick_size')
+            if tick_value and tick_size:
+                value_per_price = tick_value / tick_size
+            margin_per_lot = values.get('margin_per_lot')
+
+        parts = {}
+        for magic, side, lots, open_price, costs, server_pnl in self._positions[symbol]:
+            part = parts.setdefault(magic, [0.0, 0.0, 0.0, 0.0, 0])
+            part[0] += side * lots
+            if value_per_price is None:
+                part[2] += server_pnl + costs
+                part[4] += 1
+                continue
+            if bid and ask:
+                notional = side * lots * (bid + ask) / 2 * value_per_price
+                # buy positions are closed at the bid, sell positions at the ask.
+                part[2] += side * lots * ((bid if side > 0 else ask) - open_price) * value_per_price + costs
+            else:
+                notional = side * lots * open_price * value_per_price
+                part[2] += server_pnl + costs
+            part[1] += notional
+            if margin_per_lot:
+                part[3] += lots * margin_per_lot
+            elif self.leverage:
+                part[3] += abs(notional) / self.leverage
+        return parts
+
+    def _apply(self, symbol, parts, sign):
+
+        currencies = self._get_currencies(symbol)
+        for magic, (net_lots, notional, pnl, margin, unpriced) in parts.items():
+            for totals, key in [(self._symbols, symbol), (self._magics, magic)]:
+                total = totals.get(key)
+                if total is None:
+                    total = totals[key] = self._empty_total()
+                total['net_lots'] += sign * net_lots
+                total['notional'] += sign * notional
+                total['pnl'] += sign * pnl
+                total['margin'] += sign * margin
+                total['unpriced'] += sign * unpriced
+            if currencies is not None:
+                base, quote = currencies
+                self._currencies[base] = self._currencies.get(base, 0.0) + sign * notional
+                self._currencies[quote] = self._currencies.get(quote, 0.0) - sign * notional
+            self.floating_pnl += sign * pnl
+            self.margin += sign * margin
+
+    def _empty_total(self):
+
+        return {'net_lots': 0.0, 'notional': 0.0, 'pnl': 0.0, 'margin': 0.0, 'unpriced': 0}
+
+    def _get_currencies(self, symbol):
+
+        currencies = self.symbol_currencies.get(symbol)
+        if currencies is None and len(symbol) >= 6 and symbol[:6].isalpha() and symbol[:6].isupper():
+            currencies = (symbol[:3], symbol[3:6])
+        return currencies
+
+    def _sample(self):
+
+        now = time()
+        if now >= self._last_sample_time + self.sample_seconds:
+            self._last_sample_time = now
+            self.equity_series.append((now, self.balance + self.floating_pnl))
+
+    """Returns the net lots, notional, pnl, margin and number of unpriced
+    positions of a symbol (zero if there are no positions).
+    """
+
+    def get_symbol(self, symbol):
+
+        with self._lock:
+            return dict(self._symbols.get(symbol) or self._empty_total())
+
+    """Returns the net lots, notional, pnl, margin and number of unpriced
+    positions of a magic number.
+    """
+
+    def get_magic(self, magic):
+
+        with self._lock:
+            return dict(self._magics.get(int(magic)) or self._empty_total())
+
+    """Returns the notional exposure of a currency.
+    """
+
+    def get_currency(self, currency):
+
+        with self._lock:
+            return self._currencies.get(currency, 0.0)
+
+    """Returns the symbols with positions that have no notional and margin
+    (no market data).
+    """
+
+    def get_unpriced_symbols(self):
+
+        with self._lock:
+            return [symbol for symbol, total in self._symbols.items() if total['unpriced'] > 0]
+
+    """Returns the values of all symbols, magic numbers or currencies.
+
+    Args:
+        by (str): 'symbol', 'magic' or 'currency'.
+    """
+
+    def get_all(self, by='symbol'):
+
+        with self._lock:
+            if by == 'symbol':
+                return {key: dict(total) for key, total in self._symbols.items()}
+            if by == 'magic':
+                return {key: dict(total) for key, total in self._magics.items()}
+            if by == 'currency':
+                return dict(self._currencies)
+        raise ValueError(f'Unknown group key: {by}')
+
+    """Balance plus floating pnl.
+    """
+
+    @property
+    def equity(self):
+
+        with self._lock:
+            return self.balance + self.floating_pnl
+
+    """Returns the sampled equity as list of (time, equity) tuples.
+    """
+
+    def get_equity_series(self):
+
+        with self._lock:
+            return list(self.equity_series)
@@ -0,0 +1,387 @@
+
+import json
+from time import sleep, monotonic
+from threading import Thread, Lock
+from queue import Empty
+from traceback import print_exc
+
+from api.dwx_client import dwx_client
+from api.dwx_transport import dwx_transport
+
+
+"""Event handler wrapper
+
+Calls the functions of the event handler with the terminal tag as first
+argument, e.g. on_tick(tag, symbol, bid, ask). Functions that the event
+handler does not have raise AttributeError, so that the optional
+functions (hasattr) keep working.
+
+"""
+
+
+class _tagged_handler():
+
+    def __init__(self, event_handler, tag):
+
+        self._event_handler = event_handler
+        self._tag = tag
+
+    def __getattr__(self, name):
+
+        function = getattr(self._event_handler, name)
+
+        def tagged(*args, **kwargs):
+            return function(self._tag, *args, **kwargs)
+        return tagged
+
+
+"""Terminal manager class
+
+Owns several mql terminals (one dwx_client per DWX folder) and drives
+all of them from one shared watcher thread instead of one set of threads
+per terminal.
+
+Symbol subscriptions are partitioned across the terminals. Every symbol
+stays with the terminal it was assigned to (first come to the terminal
+with the fewest symbols, or assign_symbol()). Order commands are sent to
+the terminal that owns the symbol or ticket, or to the one given with
+terminal=, which can be a tag or an account number.
+
+All event handler functions get the terminal tag as first argument,
+e.g. on_tick(tag, symbol, bid, ask) or on_order_event(tag).
+
+Args:
+    event_handler: Object with the usual event handler functions.
+    terminals (dict): tag -> metatrader_dir_path, or a dwx_transport of
+        that terminal. A list can be used as well, the tags are then
+        '0', '1', ...
+
+Kwargs:
+    sleep_delay (float): Sleep of the watcher if nothing changed.
+    client_kwargs: Passed to every dwx_client (e.g. verbose, rate_limiter).
+        coalesce_commands is not supported, since the commands are not
+        sent from the watcher. A risk_aggregator can only belong to one
+        client, set it with clients[tag].risk_aggregator instead, and
+        a transport is given per terminal in terminals.
+
+"""
+
+
+class dwx_terminal_manager():
+
+    def __init__(self, event_handler=None, terminals={},
+                 sleep_delay=0.005,
+                 **client_kwargs):
+
+        if isinstance(terminals, (list, tuple)):
+            terminals = {str(i): path for i, path in enumerate(terminals)}
+        if len(terminals) == 0:
+            raise ValueError('At least one terminal is needed.')
+        if client_kwargs.get('coalesce_commands'):
+            raise ValueError('coalesce_commands is not supported by dwx_terminal_manager.')
+        if client_kwargs.get('risk_aggregator') is not None:
+            raise ValueError('Set a risk_aggregator per client with clients[tag].risk_aggregator.')
+        if client_kwargs.get('transport') is not None:
+            raise ValueError('Give the transport of every terminal in terminals.')
+
+        self.event_handler = event_handler
+        self.sleep_delay = sleep_delay
+
+        # tag -> dwx_client
+        self.clients = {}
+        for tag, path in terminals.items():
+            handler = None if event_handler is None else _tagged_handler(event_handler, tag)
+            transport = None
+            if isinstance(path, dwx_transport):
+                transport, path = path, ''
+            self.clients[tag] = dwx_client(handler, path, sleep_delay=sleep_delay,
+                                           auto_connect=False, transport=transport,
+                                           **client_kwargs)
+
+        # symbol -> tag
+        self.symbol_terminals = {}
+        self._bar_window_size = 0
+
+        self.ACTIVE = False
+        self.lock = Lock()
+        self._last_stale_check = 0
+
+    """Connects all terminals and starts the shared watcher thread.
+
+    Kwargs:
+        timeout (float): Seconds to wait for each mql server.
+
+    Raises:
+        FileNotFoundError, TimeoutError: See dwx_client.connect().
+    """
+
+    def connect(self, timeout=5):
+
+        for client in self.clients.values():
+            client.connect(timeout, start_threads=False)
+            client.START = True
+
+        if self.ACTIVE:
+            return
+        self.ACTIVE = True
+        self.watcher_thread = Thread(target=self.watch, args=())
+        self.watcher_thread.daemon = True
+        self.watcher_thread.start()
+
+    def stop(self):
+
+        self.ACTIVE = False
+        for client in self.clients.values():
+            client.ACTIVE = False
+
+    """Polls all files of all terminals in one loop.
+    """
+
+    def watch(self):
+
+        while self.ACTIVE:
+            changed = False
+            for client in self.clients.values():
+                changed |= self.poll(client)
+            # the stale_seconds watchdog of the clients.
+            if monotonic() >= self._last_stale_check + dwx_client.STALE_CHECK_INTERVAL:
+                self._last_stale_check = monotonic()
+                for client in self.clients.values():
+                    if client.stale_seconds is None:
+                        continue
+                    try:
+                        client.poll_stale_symbols()
+                    except:
+                        print_exc()
+            if not changed:
+                sleep(self.sleep_delay)
+
+    def poll(self, client):
+
+        changed = False
+        poll_functions = [client.poll_open_orders, client.poll_messages,
+                          client.poll_market_data, client.poll_bar_data,
+                          client.poll_historic_data]
+        # with doorbell=True only the doorbell file is read.
+        if client.doorbell:
+            poll_functions = [client.poll_doorbell]
+        for poll_function in poll_functions:
+            try:
+                changed |= bool(poll_function())
+            except json.JSONDecodeError:
+                # partially written file, read again next time.
+                pass
+            except:
+                print_exc()
+
+        # the chunks are parsed here as well, instead of in an extra thread.
+        while True:
+            try:
+                text = client._historic_chunk_queue.get_nowait()
+            except Empty:
+                break
+            changed = True
+            try:
+                client._process_historic_chunk(text)
+            except:
+                print_exc()
+        return changed
+
+    """Assigns a symbol to a terminal. Takes effect with the next
+    subscribe_symbols() or subscribe_symbols_bar_data() call.
+    """
+
+    def assign_symbol(self, symbol, tag):
+
+        if tag not in self.clients:
+            raise ValueError(f'Unknown terminal: {tag}')
+        with self.lock:
+            self.symbol_terminals[symbol] = tag
+
+    def _get_symbol_terminal(self, symbol):
+
+        with self.lock:
+            tag = self.symbol_terminals.get(symbol)
+            if tag is None:
+                counts = {tag: 0 for tag in self.clients}
+                for t in self.symbol_terminals.values():
+                    counts[t] += 1
+                tag = min(counts, key=counts.get)
+                self.symbol_terminals[symbol] = tag
+            return tag
+
+    """Returns the client of a terminal tag or account number.
+    """
+
+    def get_client(self, terminal):
+
+        if terminal in self.clients:
+            return self.clients[terminal]
+        for client in self.clients.values():
+            if str(client.account_info.get('number')) == str(terminal):
+                return client
+        raise ValueError(f'Unknown terminal or account: {terminal}')
+
+    def _ticket_client(self, ticket, terminal):
+
+        if terminal is not None:
+            return self.get_client(terminal)
+        for client in self.clients.values():
+            if str(ticket) in client.open_orders:
+                return client
+        raise ValueError(f'Ticket {ticket} is not an open order of any terminal.')
+
+    def _partition(self, items, symbol_function):
+
+        parts = {tag: [] for tag in self.clients}
+        for item in items:
+            parts[self._get_symbol_terminal(symbol_function(item))].append(item)
+        return parts
+
+    """Subscribes to tick data. The symbols are partitioned across the
+    terminals; every terminal gets its full list (also if it is empty,
+    to remove old subscriptions).
+
+    Returns:
+        bool: True if all commands were sent.
+    """
+
+    def subscribe_symbols(self, symbols):
+
+        parts = self._partition(symbols, lambda symbol: symbol)
+        return all([self.clients[tag].subscribe_symbols(part)
+                    for tag, part in parts.items()])
+
+    """Adds and removes symbols on the terminals that own them,
+    see dwx_client.add_symbols().
+    """
+
+    def add_symbols(self, symbols):
+
+        parts = self._partition(symbols, lambda symbol: symbol)
+        return all([self.clients[tag].add_symbols(part)
+                    for tag, part in parts.items() if len(part) > 0])
+
+    def remove_symbols(self, symbols):
+
+        parts = self._partition(symbols, lambda symbol: symbol)
+        return all([self.clients[tag].remove_symbols(part)
+                    for tag, part in parts.items() if len(part) > 0])
+
+    """Subscribes to bar data, partitioned like subscribe_symbols().
+    """
+
+    def subscribe_symbols_bar_data(self, symbols=[['EURUSD', 'M1']], window_size=0):
+
+        self._bar_window_size = window_size
+        parts = self._partition(symbols, lambda st: st[0])
+        return all([self.clients[tag].subscribe_symbols_bar_data(part, window_size)
+                    for tag, part in parts.items()])
+
+    def add_symbols_bar_data(self, symbols, window_size=0):
+
+        parts = self._partition(symbols, lambda st: st[0])
+        return all([self.clients[tag].add_symbols_bar_data(part, window_size)
+                    for tag, part in parts.items() if len(part) > 0])
+
+    def remove_symbols_bar_data(self, symbols):
+
+        parts = self._partition(symbols, lambda st: st[0])
+        return all([self.clients[tag].remove_symbols_bar_data(part)
+                    for tag, part in parts.items() if len(part) > 0])
+
+    """Moves the subscriptions of a symbol to another terminal.
+    """
+
+    def move_symbol(self, symbol, tag):
+
+        old_client = self.clients[self._get_symbol_terminal(symbol)]
+        self.assign_symbol(symbol, tag)
+        if old_client is self.clients[tag]:
+            return True
+
+        # the reference counts are moved as well.
+        success = True
+        count = old_client._symbol_refs.get(symbol, 0)
+        if count > 0:
+            success &= old_client.remove_symbols([symbol] * count)
+            success &= self.clients[tag].add_symbols([symbol] * count)
+        for st in old_client.get_subscribed_bar_data():
+            if st[0] != symbol:
+                continue
+            count = old_client._bar_data_refs[tuple(st)]
+            success &= old_client.remove_symbols_bar_data([st] * count)
+            success &= self.clients[tag].add_symbols_bar_data([st] * count, self._bar_window_size)
+        return success
+
+    def get_historic_data(self, symbol='EURUSD', *args, terminal=None, **kwargs):
+
+        client = self.get_client(terminal) if terminal is not None \
+            else self.clients[self._get_symbol_terminal(symbol)]
+        return client.get_historic_data(symbol, *args, **kwargs)
+
+    def get_bar_window(self, symbol, time_frame):
+
+        return self.clients[self._get_symbol_terminal(symbol)].get_bar_window(symbol, time_frame)
+
+    def open_order(self, symbol='EURUSD', *args, terminal=None, **kwargs):
+
+        client = self.get_client(terminal) if terminal is not None \
+            else self.clients[self._get_symbol_terminal(symbol)]
+        return client.open_order(symbol, *args, **kwargs)
+
+    def modify_order(self, ticket, *args, terminal=None, **kwargs):
+
+        return self._ticket_client(ticket, terminal).modify_order(ticket, *args, **kwargs)
+
+    def close_order(self, ticket, lots=0, terminal=None):
+
+        return self._ticket_client(ticket, terminal).close_order(ticket, lots)
+
+    def _clients(self, terminal):
+
+        if terminal is not None:
+            return [self.get_client(terminal)]
+        return list(self.clients.values())
+
+    """The close functions are sent to all terminals, or only to the
+    one given with terminal=.
+    """
+
+    def close_all_orders(self, terminal=None):
+
+        return all([client.close_all_orders() for client in self._clients(terminal)])
+
+    def close_orders_by_symbol(self, symbol, terminal=None):
+
+        return all([client.close_orders_by_symbol(symbol) for client in self._clients(terminal)])
+
+    def close_orders_by_magic(self, magic, terminal=None):
+
+        return all([client.close_orders_by_magic(magic) for client in self._clients(terminal)])
+
+    @property
+    def open_orders(self):
+
+        return {tag: client.open_orders for tag, client in self.clients.items()}
+
+    @property
+    def effective_orders(self):
+
+        return {tag: client.effective_orders for tag, client in self.clients.items()}
+
+    @property
+    def account_info(self):
+
+        return {tag: client.account_info for tag, client in self.clients.items()}
+
+    """Returns the market data of all terminals (symbol -> values).
+    """
+
+    @property
+    def market_data(self):
+
+        market_data = {}
+        for client in self.clients.values():
+            market_data.update(client.market_data.to_dict())
+        return market_data
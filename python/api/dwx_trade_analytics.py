@@ -0,0 +1,313 @@
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+"""Trade analytics
+
+Converts the trade history (dwx_client.historic_trades or a
+dwx_deal_store) once into numpy columns and computes the summaries with
+vectorized group-bys, without one Python object per deal.
+
+MT5 sends deals (entry_in, entry_out, ...), which are matched FIFO to
+round trips. If the deals contain the position ID (DWX server with
+"position" field), the deals are matched per position and the exit deals
+get the magic number of their position. MT4 sends closed orders, which
+already are round trips.
+
+Only buy and sell deals are used, balance, credit and other deals
+are ignored. Times are server times in seconds.
+
+Args:
+    historic_trades (dict): ticket -> deal, as in dwx_client.historic_trades,
+        or a dwx_deal_store.
+
+"""
+
+
+class dwx_trade_analytics():
+
+    PERIODS = ['day', 'week', 'month']
+    # lots are matched as integers to avoid rounding errors.
+    LOT_SCALE = 10**8
+    ENTRIES = {'entry_in': 0, 'entry_out': 1, 'entry_out_by': 1, 'in_out': 2}
+
+    def __init__(self, historic_trades):
+
+        if np is None:
+            raise ImportError('numpy is needed for dwx_trade_analytics.')
+
+        if hasattr(historic_trades, 'deals'):
+            historic_trades = historic_trades.deals
+
+        tickets = [ticket for ticket, deal in historic_trades.items()
+                   if deal.get('type') in ('buy', 'sell')]
+        deals = [historic_trades[ticket] for ticket in tickets]
+
+        # MT4 sends closed orders instead of deals.
+        self.is_deals = len(deals) == 0 or 'entry' in deals[0]
+        time_key = 'deal_time' if self.is_deals else 'close_time'
+
+        c = {}
+        c['ticket'] = np.array(tickets, dtype=np.int64)
+        c['time'] = self._to_seconds([deal[time_key] for deal in deals])
+        c['magic'] = np.array([deal['magic'] for deal in deals], dtype=np.int64)
+        # symbol -> code, a dictionary is faster than np.unique() for strings.
+        symbols = {}
+        c['symbol'] = np.array([symbols.setdefault(deal['symbol'], len(symbols)) for deal in deals],
+                               dtype=np.int64)
+        self.symbols = np.array(list(symbols), dtype=str)
+        c['lots'] = np.array([deal['lots'] for deal in deals], dtype=float)
+        c['side'] = np.where(np.array([deal['type'] for deal in deals], dtype=str) == 'buy', 1, -1)
+        for field in ['pnl', 'commission', 'swap']:
+            c[field] = np.array([deal[field] for deal in deals], dtype=float)
+
+        if self.is_deals:
+            c['price'] = np.array([deal['deal_price'] for deal in deals], dtype=float)
+            c['entry'] = np.array([self.ENTRIES.get(deal['entry'], -1) for deal in deals],
+                                  dtype=np.int64)
+            c['position'] = np.array([deal.get('position', 0) for deal in deals], dtype=np.int64)
+        else:
+            c['open_time'] = self._to_seconds([deal['open_time'] for deal in deals])
+            c['open_price'] = np.array([deal['open_price'] for deal in deals], dtype=float)
+            c['close_price'] = np.array([deal['close_price'] for deal in deals], dtype=float)
+
+        order = np.lexsort((c['ticket'], c['time']))
+        self.columns = {field: column[order] for field, column in c.items()}
+
+        if self.is_deals:
+            self._set_position_magic()
+
+    def __len__(self):
+
+        return len(self.columns['ticket'])
+
+    def _to_seconds(self, times):
+
+        # '2024.01.31 12:00:00' -> seconds since 1970.
+        return np.array([time.replace('.', '-') for time in times],
+                        dtype='datetime64[s]').astype(np.int64)
+
+    """The exit deals are sent with the magic number of the last order
+    that was opened, so they get the magic number of their position.
+    """
+
+    def _set_position_magic(self):
+
+        c = self.columns
+        has_position = c['position'] != 0
+        entries = np.flatnonzero(has_position & (c['entry'] == 0))
+        if len(entries) == 0:
+            return
+        positions, first = np.unique(c['position'][entries], return_index=True)
+        magics = c['magic'][entries][first]
+
+        index = np.searchsorted(positions, c['position'])
+        index[index >= len(positions)] = 0
+        known = has_position & (positions[index] == c['position'])
+        c['magic'] = np.where(known, magics[index], c['magic'])
+
+    def _key_codes(self, key):
+
+        c = self.columns
+        if key == 'magic':
+            values, codes = np.unique(c['magic'], return_inverse=True)
+            return values.tolist(), codes
+        if key == 'symbol':
+            return self.symbols.tolist(), c['symbol']
+        if key not in self.PERIODS:
+            raise ValueError(f'Unknown group key: {key}')
+
+        days = c['time'] // 86400
+        if key == 'week':
+            # 1970.01.01 was a thursday, weeks start on monday.
+            days = days - (days + 3) % 7
+        periods = days.astype('datetime64[D]')
+        if key == 'month':
+            periods = periods.astype('datetime64[M]')
+        values, codes = np.unique(periods, return_inverse=True)
+        return [str(value).replace('-', '.') for value in values], codes
+
+    """Sums the realized pnl, commission and swap per group.
+
+    Kwargs:
+        by (str or tuple): 'magic', 'symbol', 'day', 'week', 'month' or a
+            tuple of them, e.g. ('magic', 'day').
+
+    Returns:
+        dict: group -> {'pnl', 'commission', 'swap', 'net', 'deals'}.
+            With a tuple, the groups are tuples as well.
+    """
+
+    def summary(self, by='magic'):
+
+        keys = [by] if isinstance(by, str) else list(by)
+        if len(self) == 0:
+            return {}
+
+        values, codes = zip(*[self._key_codes(key) for key in keys])
+        # one integer per combination of the keys.
+        combined = np.zeros(len(self), dtype=np.int64)
+        for k, code in enumerate(codes):
+            combined = combined * len(values[k]) + code
+        groups, inverse = np.unique(combined, return_inverse=True)
+
+        c = self.columns
+        sums = {field: np.bincount(inverse, weights=c[field], minlength=len(groups))
+                for field in ['pnl', 'commission', 'swap']}
+        sums['net'] = sums['pnl'] + sums['commission'] + sums['swap']
+        sums['deals'] = np.bincount(inverse, minlength=len(groups))
+
+        result = {}
+        for g, group in enumerate(groups.tolist()):
+            key = []
+            for k in reversed(range(len(keys))):
+                group, code = divmod(group, len(values[k]))
+                key.insert(0, values[k][code])
+            key = key[0] if isinstance(by, str) else tuple(key)
+            result[key] = {field: sums[field][g].item() for field in sums}
+        return result
+
+    """Reconstructs the round trips (FIFO).
+
+    MT5 entry deals are matched with the exit deals of the same position
+    (or symbol, magic and direction without position IDs) by their
+    cumulative volume, so that partial closes give several round trips.
+    in_out deals (reversals on netting accounts) are not matched. If the
+    history starts while a position was open, its exits can not be matched.
+
+    Returns:
+        dict: Columns (numpy arrays) symbol, magic, type, lots, open_time,
+            close_time, open_price, close_price, pnl, commission, swap,
+            open_ticket, close_ticket.
+    """
+
+    def round_trips(self):
+
+        c = self.columns
+        if not self.is_deals:
+            return {'symbol': self.symbols[c['symbol']],
+                    'magic': c['magic'],
+                    'type': np.where(c['side'] == 1, 'buy', 'sell'),
+                    'lots': c['lots'],
+                    'open_time': c['open_time'],
+                    'close_time': c['time'],
+                    'open_price': c['open_price'],
+                    'close_price': c['close_price'],
+                    'pnl': c['pnl'],
+                    'commission': c['commission'],
+                    'swap': c['swap'],
+                    'open_ticket': c['ticket'],
+                    'close_ticket': c['ticket']}
+
+        is_entry = c['entry'] == 0
+        is_exit = c['entry'] == 1
+        # direction of the position: exits are deals in the other direction.
+        direction = np.where(is_entry, c['side'], -c['side'])
+        volume = np.rint(c['lots'] * self.LOT_SCALE).astype(np.int64)
+
+        # one group per position, or per symbol, magic and direction.
+        _, magic = np.unique(c['magic'], return_inverse=True)
+        key = (c['symbol'] * (magic.max(initial=0) + 1) + magic) * 2 + (direction > 0)
+        key = np.where(c['position'] != 0, c['position'] * 2 + (direction > 0), -1 - key)
+        _, group = np.unique(key, return_inverse=True)
+        num_groups = group.max() + 1 if len(group) > 0 else 0
+
+        entries = np.flatnonzero(is_entry)
+        exits = np.flatnonzero(is_exit)
+        # stable sort keeps the time order within each group.
+        entries = entries[np.argsort(group[entries], kind='stable')]
+        exits = exits[np.argsort(group[exits], kind='stable')]
+
+        # every group gets its own range of the cumulative volume.
+        in_volume = np.bincount(group[entries], weights=volume[entries], minlength=num_groups)
+        out_volume = np.bincount(group[exits], weights=volume[exits], minlength=num_groups)
+        size = np.maximum(in_volume, out_volume).astype(np.int64)
+        base = np.concatenate([[0], np.cumsum(size)[:-1]]).astype(np.int64)
+
+        in_end = base[group[entries]] + self._group_cumsum(volume[entries], group[entries])
+        out_end = base[group[exits]] + self._group_cumsum(volume[exits], group[exits])
+
+        bounds = np.unique(np.concatenate([base, in_end, out_end]))
+        start, end = bounds[:-1], bounds[1:]
+        i = np.searchsorted(in_end, end)
+        o = np.searchsorted(out_end, end)
+        valid = (i < len(entries)) & (o < len(exits))
+        start, end, i, o = start[valid], end[valid], i[valid], o[valid]
+        entry, exit = entries[i], exits[o]
+        # the segment has to be inside the volume of both deals and of the same group.
+        valid = ((in_end[i] - volume[entry] <= start) & (out_end[o] - volume[exit] <= start)
+                 & (group[entry] == group[exit]))
+        start, end, entry, exit = start[valid], end[valid], entry[valid], exit[valid]
+
+        lots = end - start
+        in_share = lots / volume[entry]
+        out_share = lots / volume[exit]
+
+        return {'symbol': self.symbols[c['symbol'][entry]],
+                'magic': c['magic'][entry],
+                'type': np.where(direction[entry] == 1, 'buy', 'sell'),
+                'lots': lots / self.LOT_SCALE,
+                'open_time': c['time'][entry],
+                'close_time': c['time'][exit],
+                'open_price': c['price'][entry],
+                'close_price': c['price'][exit],
+                'pnl': c['pnl'][exit] * out_share,
+                'commission': c['commission'][entry] * in_share + c['commission'][exit] * out_share,
+                'swap': c['swap'][exit] * out_share,
+                'open_ticket': c['ticket'][entry],
+                'close_ticket': c['ticket'][exit]}
+
+    def _group_cumsum(self, values, groups):
+
+        # values are sorted by group.
+        total = np.cumsum(values)
+        if len(values) == 0:
+            return total
+        first = np.flatnonzero(np.concatenate([[True], groups[1:] != groups[:-1]]))
+        offset = np.concatenate([[0], total[first[1:] - 1]])
+        return total - np.repeat(offset, np.diff(np.append(first, len(values))))
+
+    """Returns the curve of the realized equity and its drawdown.
+
+    Kwargs:
+        initial (float): Start value of the equity (e.g. the balance).
+        magic (int): Only use the deals with this magic number.
+        symbol (str): Only use the deals with this symbol.
+
+    Returns:
+        dict: 'time', 'equity' and 'drawdown' (numpy arrays, one value per
+            deal) and 'max_drawdown' (float, negative or zero).
+    """
+
+    def drawdown(self, initial=0.0, magic=None, symbol=None):
+
+        c = self.columns
+        mask = np.ones(len(self), dtype=bool)
+        if magic is not None:
+            mask &= c['magic'] == int(magic)
+        if symbol is not None:
+            mask &= self.symbols[c['symbol']] == symbol
+
+        net = c['pnl'][mask] + c['commission'][mask] + c['swap'][mask]
+        equity = initial + np.cumsum(net)
+        peak = np.maximum.accumulate(np.concatenate([[initial], equity]))[1:]
+        drawdown = equity - peak
+        return {'time': c['time'][mask],
+                'equity': equity,
+                'drawdown': drawdown,
+                'max_drawdown': drawdown.min().item() if len(drawdown) > 0 else 0.0}
+
+    """Returns the columns as pandas DataFrame (requires pandas).
+    """
+
+    def to_dataframe(self):
+
+        import pandas as pd
+
+        df = pd.DataFrame(self.columns)
+        df['symbol'] = self.symbols[self.columns['symbol']]
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        return df.set_index('ticket')
@@ -0,0 +1,455 @@
+
+import os
+import socket
+from time import sleep
+from collections import deque
+from os.path import join, exists
+from threading import Thread, Lock, Condition, Event
+from traceback import print_exc
+
+
+"""Transports
+
+A transport moves the data between the mql server and dwx_client. The
+data is addressed by the file names of the file transport without
+prefix and extension, e.g. 'Orders', 'Market_Data' or
+'Historic_Data_EURUSD_M1_0'. The JSON payloads and the command format
+(<:command_id|COMMAND|content:>) are the same for all transports.
+
+    dwx_file_transport: Files in <metatrader_dir_path>/DWX (default).
+    dwx_socket_transport: TCP connection, the mql server pushes every
+        update as soon as it is written (MT5 with useSocket=true).
+    dwx_memory_transport: In memory, e.g. for tests without MetaTrader.
+
+Data that the client stores for a restart (e.g. 'Orders_Stored') is
+written to store_path(name), or kept in memory if that is None.
+
+generation is increased on every update that is pushed to the client.
+Transports without push (files) keep it at 0 and wait() just sleeps.
+
+"""
+
+
+class dwx_transport():
+
+    generation = 0
+
+    def __init__(self, store_dir=None):
+
+        self.store_dir = store_dir
+        # name -> text of the stored data if store_path() is None.
+        self._stored = {}
+
+    """Returns the text of the data with the given name, or '' if there
+    is none.
+    """
+
+    def read(self, name):
+
+        raise NotImplementedError
+
+    """Removes data that was consumed (e.g. historic data).
+    """
+
+    def remove(self, name):
+
+        raise NotImplementedError
+
+    """Sends a command.
+
+    Returns:
+        bool: False if it could not be sent right now and should be
+        tried again.
+    """
+
+    def send_command(self, text, priority):
+
+        raise NotImplementedError
+
+    """Returns the number of commands that were not read by the
+    mql server yet.
+    """
+
+    def num_commands_in_flight(self):
+
+        return 0
+
+    """Waits until the generation is different from the given one,
+    or for timeout seconds.
+    """
+
+    def wait(self, timeout, generation):
+
+        sleep(timeout)
+
+    """Checks that the mql server can be reached.
+
+    Raises:
+        FileNotFoundError, TimeoutError
+    """
+
+    def open(self, timeout):
+
+        pass
+
+    def close(self):
+
+        pass
+
+    def store_path(self, name):
+
+        return None
+
+    """Loads and stores data of the client (e.g. 'Orders_Stored').
+    """
+
+    def load(self, name):
+
+        path = self.store_path(name)
+        if path is None:
+            return self._stored.get(name, '')
+        return self.try_read_file(path)
+
+    def store(self, name, text):
+
+        path = self.store_path(name)
+        if path is None:
+            self._stored[name] = text
+            return
+        with open(path, 'w') as f:
+            f.write(text)
+
+    """Tries to read a file.
+    """
+
+    def try_read_file(self, file_path):
+
+        try:
+            if exists(file_path):
+                with open(file_path) as f:
+                    text = f.read()
+                return text
+        # can happen if mql writes to the file. don't print anything here.
+        except (IOError, PermissionError):
+            pass
+        except:
+            print_exc()
+        return ''
+
+    """Tries to remove a file.
+    """
+
+    def try_remove_file(self, file_path):
+        for _ in range(10):
+            try:
+                os.remove(file_path)
+                break
+            except (IOError, PermissionError):
+                pass
+            except:
+                print_exc()
+
+
+"""File transport
+
+Reads the files that the mql server writes to <metatrader_dir_path>/DWX
+and writes every command to its own command file.
+
+Commands with priority 'high' can use all command files, including the
+first num_high_priority_command_files ones, which the mql server
+always reads first. Normal commands only use the other files.
+
+With double_buffer=True (doubleBuffer=true on the mql side), the files
+in DOUBLE_BUFFERED are written alternately to two files (_A, _B) and the
+generation of the last complete write is published in the _Gen file.
+The client reads the file of the published generation, which the server
+only writes again two generations later, so that a read does not have
+to wait for or fail because of a write.
+
+"""
+
+
+class dwx_file_transport(dwx_transport):
+
+    DOUBLE_BUFFERED = ['Orders', 'Messages', 'Market_Data', 'Bar_Data']
+
+    def __init__(self, metatrader_dir_path, num_command_files=50,
+                 num_high_priority_command_files=10, double_buffer=False):
+
+        super().__init__()
+        self.metatrader_dir_path = metatrader_dir_path
+        self.dwx_dir = join(metatrader_dir_path, 'DWX')
+        self.path_commands_prefix = join(self.dwx_dir, 'DWX_Commands_')
+        self.num_command_files = num_command_files
+        # files 0-9 are reserved for high priority commands (same on the mql side).
+        self.num_high_priority_command_files = num_high_priority_command_files
+        self.double_buffer = double_buffer
+
+    def path(self, name):
+
+        return join(self.dwx_dir, f'DWX_{name}.txt')
+
+    def read(self, name):
+
+        if not self.double_buffer or name not in self.DOUBLE_BUFFERED:
+            return self.try_read_file(self.path(name))
+
+        generation = self._read_generation(name)
+        for _ in range(3):
+            if generation is None:
+                return ''
+            text = self.try_read_file(self.path(f'{name}_{"A" if generation % 2 == 0 else "B"}'))
+            # if a newer generation was published, the server could already
+            # write the file again. read the newer one instead.
+            last_generation = self._read_generation(name)
+            if last_generation == generation:
+                return text
+            generation = last_generation
+        return ''
+
+    def _read_generation(self, name):
+
+        text = self.try_read_file(self.path(f'{name}_Gen'))
+        try:
+            return int(text)
+        except ValueError:
+            # not written yet or only partially.
+            return None
+
+    def remove(self, name):
+
+        self.try_remove_file(self.path(name))
+
+    def send_command(self, text, priority):
+
+        if priority == 'high':
+            file_indices = range(self.num_command_files)
+        else:
+            file_indices = range(self.num_high_priority_command_files, self.num_command_files)
+
+        for i in file_indices:
+            # only send commend if the file does not exists so that we
+            # do not overwrite all commands.
+            file_path = f'{self.path_commands_prefix}{i}.txt'
+            if exists(file_path):
+                continue
+            try:
+                # 'x' fails if the other priority created the file in the meantime.
+                with open(file_path, 'x') as f:
+                    f.write(text)
+                return True
+            except FileExistsError:
+                continue
+            except:
+                print_exc()
+        return False
+
+    def num_commands_in_flight(self):
+
+        return sum(exists(f'{self.path_commands_prefix}{i}.txt')
+                   for i in range(self.num_command_files))
+
+    def open(self, timeout):
+
+        if not exists(self.dwx_dir):
+            raise FileNotFoundError(
+                f'DWX folder does not exist (is the server EA running?): {self.dwx_dir}')
+
+    def store_path(self, name):
+
+        return self.path(name)
+
+
+"""Memory transport
+
+Keeps the data in memory. The server side (e.g. a test) pushes the data
+with push(name, text) and takes the commands with pop_command().
+
+Kwargs:
+    store_dir (str): Folder for the data stored by the client. If None,
+        it is kept in memory.
+
+"""
+
+
+class dwx_memory_transport(dwx_transport):
+
+    def __init__(self, store_dir=None):
+
+        super().__init__(store_dir)
+        self._data = {}
+        self.commands = deque()
+        self._condition = Condition()
+        self.generation = 0
+
+    def read(self, name):
+
+        return self._data.get(name, '')
+
+    def remove(self, name):
+
+        self._data.pop(name, None)
+
+    def push(self, name, text):
+
+        with self._condition:
+            self._data[name] = text
+            self.generation += 1
+            self._condition.notify_all()
+
+    def send_command(self, text, priority):
+
+        self.commands.append(text)
+        return True
+
+    """Returns the oldest command that was sent, or None.
+    """
+
+    def pop_command(self):
+
+        try:
+            return self.commands.popleft()
+        except IndexError:
+            return None
+
+    def num_commands_in_flight(self):
+
+        return len(self.commands)
+
+    def wait(self, timeout, generation):
+
+        with self._condition:
+            self._condition.wait_for(lambda: self.generation != generation, timeout)
+
+    def store_path(self, name):
+
+        if self.store_dir is None:
+            return None
+        return join(self.store_dir, f'DWX_{name}.txt')
+
+
+"""Socket transport
+
+Listens on host:port for the mql server (MT5, useSocket=true, with the
+address allowed in Tools > Options > Expert Advisors), which connects
+as client and pushes every update instead of writing the file. The
+watcher threads wake up as soon as an update arrived, instead of
+after their next poll interval.
+
+Both directions use frames of the form "<name>|<number of bytes>\\n"
+followed by the UTF-8 payload. Commands are sent with the name
+'Commands' and are executed in the order in which they were sent.
+
+Kwargs:
+    port (int), host (str): Address to listen on.
+    store_dir (str): See dwx_memory_transport.
+
+"""
+
+
+class dwx_socket_transport(dwx_memory_transport):
+
+    def __init__(self, port=5555, host='127.0.0.1', store_dir=None):
+
+        super().__init__(store_dir)
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+
+        self._connection = None
+        self._connected = Event()
+        self._send_lock = Lock()
+
+        self.ACTIVE = True
+        self.accept_thread = Thread(target=self._accept, args=())
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+    """Accepts the connection of the mql server. A new connection (e.g.
+    after a restart of the EA) replaces the old one.
+    """
+
+    def _accept(self):
+
+        while self.ACTIVE:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                break
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = connection
+            self._connected.set()
+            self._receive(connection)
+            if self._connection is connection:
+                self._connected.clear()
+                self._connection = None
+
+    def _receive(self, connection):
+
+        buffer = bytearray()
+        while self.ACTIVE:
+            try:
+                data = connection.recv(65536)
+            except OSError:
+                break
+            if len(data) == 0:
+                break
+            buffer += data
+            while True:
+                end = buffer.find(b'\n')
+                if end < 0:
+                    break
+                start = end + 1
+                # ValueError (also UnicodeDecodeError) if the frame is not valid.
+                try:
+                    name, length = buffer[:end].decode().split('|')
+                    length = int(length)
+                    if length < 0:
+                        raise ValueError(f'Negative frame length: {length}')
+                    if len(buffer) < start + length:
+                        break
+                    text = buffer[start:start + length].decode('utf-8')
+                except ValueError:
+                    # the following frames can not be found anymore, the
+                    # mql server has to connect again.
+                    print_exc()
+                    connection.close()
+                    return
+                self.push(name, text)
+                del buffer[:start + length]
+
+    def send_command(self, text, priority):
+
+        connection = self._connection
+        if connection is None:
+            return False
+        payload = text.encode('utf-8')
+        try:
+            with self._send_lock:
+                connection.sendall(f'Commands|{len(payload)}\n'.encode() + payload)
+        except OSError:
+            return False
+        return True
+
+    def num_commands_in_flight(self):
+
+        # the commands are buffered by the mql server as soon as they are sent.
+        return 0
+
+    def open(self, timeout):
+
+        if not self._connected.wait(timeout):
+            raise TimeoutError(
+                f'The mql server did not connect to port {self.port} within {timeout} seconds.')
+
+    def close(self):
+
+        self.ACTIVE = False
+        self._server.close()
+        if self._connection is not None:
+            self._connection.close()
@@ -0,0 +1,83 @@
+
+from api.dwx_bar_window import dwx_bar_window
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the rolling bar window. They do not need MetaTrader.
+
+"""
+
+
+class TestDWXBarWindow(unittest.TestCase):
+
+    def bar(self, time, close, closed=True):
+
+        return {'time': time, 'open': close - 1, 'high': close + 1, 'low': close - 2,
+                'close': close, 'tick_volume': 10, 'closed': closed}
+
+    def test_ring_buffer(self):
+
+        window = dwx_bar_window(3)
+        for i in range(5):
+            closed, forming_changed = window.update(self.bar(60 * i, i))
+            self.assertEqual([bar['time'] for bar in closed], [60 * i])
+            self.assertFalse(forming_changed)
+        self.assertEqual(len(window), 3)
+        self.assertEqual(window.column('close'), [2, 3, 4])
+        self.assertEqual(window.column('time'), [120, 180, 240])
+        self.assertEqual(window[-1]['close'], 4)
+        self.assertEqual(window[0]['time'], 120)
+        with self.assertRaises(IndexError):
+            window[3]
+
+    def test_forming_bar_replacement(self):
+
+        window = dwx_bar_window(5)
+        window.update(self.bar(0, 1))
+        self.assertEqual(window.update(self.bar(60, 2, closed=False)), ([], True))
+        self.assertEqual(window.update(self.bar(60, 2.5, closed=False)), ([], True))
+        self.assertEqual(window.forming['close'], 2.5)
+        self.assertEqual(len(window), 1)
+
+        # the closed bar replaces the forming bar.
+        closed, _ = window.update(self.bar(60, 3))
+        self.assertEqual([bar['close'] for bar in closed], [3])
+        self.assertIsNone(window.forming)
+        self.assertEqual(window.column('close'), [1, 3])
+
+        # a newer forming bar closes the previous one, if its closed bar was missed.
+        window.update(self.bar(120, 4, closed=False))
+        closed, forming_changed = window.update(self.bar(180, 5, closed=False))
+        self.assertEqual([bar['close'] for bar in closed], [4])
+        self.assertTrue(forming_changed)
+        self.assertEqual(window.column('time'), [0, 60, 120])
+
+        # a late closed bar of the same time corrects the values.
+        window.update(self.bar(120, 4.5))
+        self.assertEqual(window.column('close'), [1, 3, 4.5])
+        self.assertEqual(len(window), 3)
+        # older bars are ignored.
+        self.assertEqual(window.update(self.bar(60, 0)), ([], False))
+        self.assertEqual(window.column('close'), [1, 3, 4.5])
+
+    def test_seed(self):
+
+        window = dwx_bar_window(2)
+        window.seed({60 * i: self.bar(60 * i, i) for i in range(5)})
+        # the last historic bar is kept as forming bar.
+        self.assertEqual(window.column('time'), [120, 180])
+        self.assertEqual(window.forming['time'], 240)
+
+        closed, _ = window.update(self.bar(240, 4.5))
+        self.assertEqual([bar['close'] for bar in closed], [4.5])
+        self.assertIsNone(window.forming)
+        self.assertEqual(window.column('close'), [3, 4.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,422 @@
+from api.dwx_client import dwx_client, poll_policy
+from api.dwx_transport import dwx_memory_transport
+from api.dwx_rate_limiter import dwx_rate_limiter
+import sys
+import json
+import unittest
+from time import sleep, monotonic, time
+from threading import Thread
+from concurrent.futures import CancelledError
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the client that do not need MetaTrader. The mql server is
+simulated on the other side of a memory transport.
+
+"""
+
+
+class TestDWXClientOffline(unittest.TestCase):
+
+    def setUp(self):
+
+        self.ticks = []
+        self.stale = []
+        self.gaps = []
+        self.historic_data = []
+        self.messages = []
+
+    def on_tick(self, symbol, bid, ask):
+        self.ticks.append([symbol, bid, ask])
+
+    def on_message(self, message):
+        self.messages.append(message)
+
+    def on_stale(self, symbol, age):
+        self.stale.append(symbol)
+
+    def on_order_event(self):
+        pass
+
+    def on_sequence_gap(self, channel, gap):
+        self.gaps.append((channel, gap))
+
+    def on_historic_data(self, symbol, time_frame, data):
+        self.historic_data.append((symbol, time_frame, data))
+
+    """Returns the acknowledgement of a RESET_COMMAND_IDS command.
+    """
+
+    def ack(self, command):
+
+        fields = command[2:-2].split('|')
+        return json.dumps({'1': {'type': 'ACK', 'command': fields[1], 'token': fields[2]}})
+
+    """Starts a client on a memory transport with a simulated mql server,
+    that answers the reset and records the other commands as list of
+    fields (command ID, command, content) in self.commands.
+    """
+
+    def start_client(self, **kwargs):
+
+        self.transport = transport = dwx_memory_transport()
+        self.commands = []
+        running = [True]
+
+        def server():
+            while running[0]:
+                command = transport.pop_command()
+                if command is None:
+                    sleep(0.001)
+                elif 'RESET_COMMAND_IDS' in command:
+                    transport.push('Messages', self.ack(command))
+                else:
+                    self.commands.append(command[2:-2].split('|'))
+
+        Thread(target=server, daemon=True).start()
+        dwx = dwx_client(self, '', verbose=False, auto_connect=False, transport=transport, **kwargs)
+
+        def stop():
+            dwx.ACTIVE = False
+            running[0] = False
+
+        self.addCleanup(stop)
+        dwx.connect(timeout=1)
+        dwx.start()
+        return dwx
+
+    """Checks that idle channels back off to their max_interval, while
+    channels with a short interval keep polling, and that pushed data
+    is still read at once.
+    """
+
+    def test_adaptive_polling(self):
+
+        policy = poll_policy(0.01, 0.05)
+        intervals = [0.01]
+        for i in range(4):
+            intervals.append(policy.next_interval(intervals[-1], False))
+        self.assertEqual(intervals, [0.01, 0.02, 0.04, 0.05, 0.05])
+        self.assertEqual(policy.next_interval(0.05, True), 0.01)
+        with self.assertRaises(ValueError):
+            dwx_client(self, '', auto_connect=False, transport=dwx_memory_transport(),
+                       poll_policies={'unknown': (0.01, 0.05)})
+
+        dwx = self.start_client(poll_policies={'bar_data': (0.005, 0.2), 'historic_data': (0.005, 0.005)})
+        sleep(0.5)
+        idle_polls = dwx._poll_counts['bar_data']
+        self.assertLess(idle_polls, 15)
+        self.assertGreater(dwx._poll_counts['historic_data'], 3 * idle_polls)
+
+        start_time = monotonic()
+        self.transport.push('Market_Data', json.dumps({'EURUSD': {'bid': 1.1, 'ask': 1.2}}))
+        self.assertIsNotNone(dwx.wait_for_tick('EURUSD', after_version=0, timeout=1))
+        self.assertLess(monotonic() - start_time, 0.1)
+
+    """Checks that deltas of the market data and orders files are merged,
+    with the removed tickets, and that a missed delta requests a snapshot.
+    """
+
+    def test_delta_mode(self):
+
+        dwx = self.start_client(load_orders_from_file=False)
+        transport = self.transport
+
+        transport.push('Market_Data', json.dumps({'seq': 1, 'full': True, 'data': {
+            'EURUSD': {'bid': 1.1, 'ask': 1.2}, 'GBPUSD': {'bid': 1.3, 'ask': 1.4}}}))
+        self.assertIsNotNone(dwx.wait_for_tick('GBPUSD', after_version=0, timeout=1))
+        transport.push('Market_Data', json.dumps({'seq': 2, 'full': False, 'data': {
+            'EURUSD': {'bid': 1.15, 'ask': 1.25}}}))
+        self.assertIsNotNone(dwx.wait_for(
+            'market_data', lambda: dwx.market_data.get('EURUSD', {}).get('bid') == 1.15, timeout=1))
+        self.assertEqual(dwx.market_data['GBPUSD'].to_dict(), {'bid': 1.3, 'ask': 1.4})
+
+        order = {'magic': 0, 'symbol': 'EURUSD', 'lots': 0.1, 'type': 'buy', 'SL': 0, 'TP': 0}
+        account_info = {'balance': 1000}
+        transport.push('Orders', json.dumps({'seq': 1, 'full': True, 'data': {
+            'account_info': account_info, 'orders': {'1': order, '2': order}, 'removed': []}}))
+        self.assertIsNotNone(dwx.wait_for_orders(lambda s: len(s.open_orders) == 2, timeout=1))
+        transport.push('Orders', json.dumps({'seq': 2, 'full': False, 'data': {
+            'account_info': account_info, 'orders': {'3': dict(order, lots=0.2)}, 'removed': ['1']}}))
+        snapshot = dwx.wait_for_orders(lambda s: '3' in s.open_orders, timeout=1)
+        self.assertEqual(sorted(snapshot.open_orders), ['2', '3'])
+        self.assertEqual(snapshot.open_orders['3']['lots'], 0.2)
+
+        # seq 3 was overwritten before it was read.
+        transport.push('Market_Data', json.dumps({'seq': 4, 'full': False, 'data': {
+            'EURUSD': {'bid': 1.16, 'ask': 1.26}}}))
+        self.assertIsNotNone(dwx.wait_for(
+            'market_data', lambda: dwx.market_data['EURUSD']['bid'] == 1.16, timeout=1))
+        self.assertEqual(dwx.missed_updates, {'market_data': 1})
+        self.assertEqual(self.gaps, [('market_data', 1)])
+        sleep(0.05)
+        self.assertEqual(self.commands[-1][1:], ['REQUEST_SNAPSHOT', 'market_data'])
+
+    """Checks that missed messages are requested again (RESEND_MESSAGES)
+    and that replayed messages are only processed once.
+    """
+
+    def test_message_seq_gap(self):
+
+        dwx = self.start_client()
+        transport = self.transport
+        millis = int(time() * 1000)
+
+        def push_messages(*messages):
+            nonlocal millis
+            data = {}
+            for message in messages:
+                millis += 1
+                data[str(millis)] = message
+            transport.push('Messages', json.dumps(data))
+            self.assertIsNotNone(dwx.wait_for(
+                'messages', lambda: self.messages[-1:] == [messages[-1]], timeout=1))
+
+        push_messages({'type': 'INFO', 'seq': 1})
+        push_messages({'type': 'INFO', 'seq': 4})
+        self.assertEqual(dwx.missed_messages, 2)
+        self.assertEqual(self.gaps, [('message_ids', 2)])
+        sleep(0.05)
+        self.assertEqual(self.commands[-1][1:], ['RESEND_MESSAGES', '2,3'])
+
+        push_messages({'type': 'INFO', 'seq': 2, 'replay': True}, {'type': 'INFO', 'seq': 3, 'replay': True})
+        # a second replay of the same message is dropped.
+        push_messages({'type': 'INFO', 'seq': 3, 'replay': True}, {'type': 'INFO', 'seq': 5})
+        self.assertEqual([message['seq'] for message in self.messages], [1, 4, 2, 3, 5])
+        self.assertEqual(dwx.recovered_messages, 2)
+
+        # large gaps are requested in several commands.
+        self.commands.clear()
+        push_messages({'type': 'INFO', 'seq': 256})
+        self.assertEqual(dwx.missed_messages, 2 + 250)
+        sleep(0.05)
+        self.assertEqual([len(command[2].split(',')) for command in self.commands], [100, 100, 50])
+        self.assertEqual(self.commands[0][2].split(',')[0], '6')
+
+    """Holds the pending commands back (max_commands_in_flight=0) and
+    checks which ones are superseded by the later commands, and that
+    their orders overlay entries are removed.
+    """
+
+    def test_coalesce_commands(self):
+
+        dwx = self.start_client(load_orders_from_file=False, coalesce_commands=True)
+        dwx.max_commands_in_flight = 0
+        order = {'magic': 0, 'symbol': 'EURUSD', 'lots': 0.1, 'type': 'buy', 'SL': 0, 'TP': 0}
+        self.transport.push('Orders', json.dumps({'account_info': {'balance': 1000},
+                                                  'orders': {'11': order, '12': order}}))
+        self.assertIsNotNone(dwx.wait_for_orders(lambda s: len(s.open_orders) == 2, timeout=1))
+
+        # modify -> modify.
+        dwx.modify_order(11, stop_loss=1.0)
+        dwx.modify_order(11, stop_loss=1.05)
+        self.assertEqual(dwx.coalesced_commands, {'MODIFY_ORDER': 1})
+        self.assertEqual(len(dwx.order_overlay.pending()), 1)
+        self.assertEqual(dwx.effective_orders['11']['SL'], 1.05)
+
+        # only a complete close supersedes a modify.
+        dwx.modify_order(12, stop_loss=1.0)
+        dwx.close_order(12, 0.05)
+        self.assertEqual(dwx.coalesced_commands, {'MODIFY_ORDER': 1})
+        dwx.close_order(12)
+        self.assertEqual(dwx.coalesced_commands, {'MODIFY_ORDER': 2})
+
+        dwx.close_all_orders()
+        self.assertEqual(dwx.coalesced_commands, {'MODIFY_ORDER': 3})
+        self.assertEqual([pending['command'] for pending in dwx.order_overlay.pending()],
+                         ['CLOSE_ORDER', 'CLOSE_ORDER', 'CLOSE_ALL_ORDERS'])
+
+        dwx.add_symbols(['EURUSD'])
+        dwx.remove_symbols(['EURUSD'])
+        dwx.subscribe_symbols(['GBPUSD'])
+        self.assertEqual(dwx.coalesced_commands, {'MODIFY_ORDER': 3, 'ADD_SYMBOLS': 1, 'REMOVE_SYMBOLS': 1})
+
+        dwx.max_commands_in_flight = 4
+        sleep(0.1)
+        self.assertEqual([command[1:] for command in self.commands],
+                         [['CLOSE_ORDER', '12,0.05'], ['CLOSE_ORDER', '12,0'], ['CLOSE_ALL_ORDERS', ''],
+                          ['SUBSCRIBE_SYMBOLS', 'GBPUSD']])
+
+    """Processes the chunks of historic data responses out of order.
+    """
+
+    def test_historic_chunks_out_of_order(self):
+
+        dwx = self.start_client()
+
+        def chunk(index, request_id=''):
+            return json.dumps({'request_id': request_id, 'symbol_tf': 'EURUSD_M1', 'chunk': index,
+                               'num_chunks': 3, 'data': {str(index): {'close': index}}})
+
+        dwx._process_historic_chunk(chunk(2))
+        dwx._process_historic_chunk(chunk(0))
+        self.assertEqual(self.historic_data, [])
+        dwx._process_historic_chunk(chunk(1))
+        self.assertEqual(self.historic_data, [('EURUSD', 'M1', {'0': {'close': 0}, '1': {'close': 1},
+                                                                '2': {'close': 2}})])
+        # a chunk that was already received starts the next response.
+        dwx._process_historic_chunk(chunk(1))
+        self.assertEqual(dwx.historic_data['EURUSD_M1'], {'1': {'close': 1}})
+
+        future = dwx.request_historic_data('EURUSD', 'M1', chunk_bars=10)
+        for index in [1, 2]:
+            dwx._process_historic_chunk(chunk(index, future.request_id))
+        self.assertFalse(future.done())
+        dwx._process_historic_chunk(chunk(0, future.request_id))
+        self.assertEqual(sorted(future.result(timeout=1)), ['0', '1', '2'])
+
+    """Checks that a chunk that can not be processed does not stop the
+    parser thread.
+    """
+
+    def test_historic_chunk_error(self):
+
+        dwx = self.start_client()
+        # without symbol_tf.
+        dwx._historic_chunk_queue.put(json.dumps({'request_id': '', 'chunk': 0, 'num_chunks': 1}))
+        dwx._historic_chunk_queue.put(json.dumps({'request_id': '', 'symbol_tf': 'EURUSD_M1', 'chunk': 0,
+                                                  'num_chunks': 1, 'data': {'0': {'close': 1}}}))
+        self.assertIsNotNone(dwx.wait_for('historic_data', lambda: len(self.historic_data) == 1, timeout=1))
+        self.assertEqual(self.historic_data, [('EURUSD', 'M1', {'0': {'close': 1}})])
+
+    """Completes requests while they are cancelled (by a timeout or by
+    the caller), a future must only be completed once.
+    """
+
+    def test_request_cancel_race(self):
+
+        dwx = self.start_client()
+
+        def response(future):
+            return json.dumps({'request_id': future.request_id, 'symbol_tf': 'EURUSD_M1', 'chunk': 0,
+                               'num_chunks': 1, 'data': {'0': {'close': 1}}})
+
+        future = dwx.request_historic_data('EURUSD', 'M1', chunk_bars=10)
+        self.assertTrue(future.cancel())
+        dwx._process_historic_chunk(response(future))
+        self.assertEqual(self.historic_data, [])
+
+        for i in range(50):
+            future = dwx.request_historic_data('EURUSD', 'M1', chunk_bars=10)
+            thread = Thread(target=dwx._cancel_request, args=(future.request_id,))
+            thread.start()
+            dwx._process_historic_chunk(response(future))
+            thread.join()
+            self.assertTrue(future.done())
+            self.assertNotIn(future.request_id, dwx._historic_requests)
+
+    """Checks that requests that could not be sent are returned as
+    CancelledError, or raise it.
+    """
+
+    def test_historic_data_many_cancelled(self):
+
+        dwx = self.start_client()
+        dwx.send_command = lambda *args, **kwargs: False
+
+        results = dwx.get_historic_data_many([['EURUSD', 'D1']], timeout=1, return_exceptions=True)
+        self.assertIsInstance(results['EURUSD_D1'], CancelledError)
+        with self.assertRaises(CancelledError):
+            dwx.get_historic_data_many([['EURUSD', 'D1']], timeout=1)
+
+    """Checks that the reference counts are restored if an ADD_SYMBOLS or
+    REMOVE_SYMBOLS command could not be sent.
+    """
+
+    def test_symbol_refs_rollback(self):
+
+        dwx = self.start_client()
+        dwx.add_symbols(['EURUSD'])
+        dwx.send_command = lambda *args, **kwargs: False
+
+        self.assertFalse(dwx.remove_symbols(['EURUSD', 'GBPUSD']))
+        self.assertEqual(dwx._symbol_refs, {'EURUSD': 1})
+        self.assertFalse(dwx.add_symbols(['EURUSD', 'USDJPY']))
+        self.assertEqual(dwx._symbol_refs, {'EURUSD': 1})
+        self.assertFalse(dwx.add_symbols_bar_data([['EURUSD', 'M1']]))
+        self.assertEqual(dwx.get_subscribed_bar_data(), [])
+
+    """Checks that the close commands are not rate limited, but
+    MODIFY_ORDER is, although it has a high priority.
+    """
+
+    def test_rate_limiter_exempt_commands(self):
+
+        limiter = dwx_rate_limiter(command_limits={'*': (0.1, 1), 'CLOSE_ORDER': (0.1, 1)}, mode='reject')
+        dwx = self.start_client(rate_limiter=limiter)
+        self.assertTrue(dwx.send_command('OPEN_ORDER', 'EURUSD,buy,0.1,0,0,0,0,,0'))
+        self.assertFalse(dwx.send_command('OPEN_ORDER', 'EURUSD,buy,0.1,0,0,0,0,,0'))
+        self.assertFalse(dwx.send_command('MODIFY_ORDER', '11,0,1.1,1.2,0'))
+        self.assertTrue(dwx.send_command('CLOSE_ORDER', '11,0.1'))
+        self.assertTrue(dwx.send_command('CLOSE_ORDER', '12,0.1'))
+        self.assertTrue(dwx.send_command('CLOSE_ALL_ORDERS', ''))
+        self.assertEqual(limiter.get_metrics()['rejected'], {'OPEN_ORDER': 1, 'MODIFY_ORDER': 1})
+
+    """Pushes ticks with server timestamps (time_msc) and checks the
+    clock offset, the tick ages and the stale_seconds watchdog.
+    """
+
+    def test_tick_age_and_stale(self):
+
+        dwx = self.start_client(stale_seconds={'EURUSD': 0.3})
+        transport = self.transport
+
+        # server clock two hours ahead (broker time zone).
+        server_offset = 7200
+        for i in range(2):
+            transport.push('Market_Data', json.dumps(
+                {'EURUSD': {'bid': 1.1 + i, 'ask': 1.2, 'time_msc': (time() + server_offset) * 1000},
+                 'GBPUSD': {'bid': 1.3, 'ask': 1.4, 'time_msc': (time() + server_offset) * 1000}}))
+            self.assertIsNotNone(dwx.wait_for_tick('EURUSD', after_version=i, timeout=1))
+        self.assertAlmostEqual(dwx.get_clock_offset(), -server_offset, delta=0.1)
+        self.assertLess(dwx.tick_ages['EURUSD'], 0.1)
+        self.assertEqual(self.stale, [])
+
+        sleep(0.6)
+        self.assertEqual(self.stale, ['EURUSD'])
+        self.assertEqual(dwx.get_stale_symbols(), ['EURUSD'])
+        self.assertGreater(dwx.get_tick_age('EURUSD'), 0.3)
+
+    """Checks that order commands are visible in effective_orders at
+    once, and that they are confirmed by the orders file or rolled back
+    by an error message with their command_id.
+    """
+
+    def test_pending_orders(self):
+
+        dwx = self.start_client(load_orders_from_file=False)
+        transport = self.transport
+
+        account_info = {'balance': 1000}
+        dwx.open_order('EURUSD', 'buy', 0.1, magic=7)
+        orders = dwx.effective_orders
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders['pending_1']['pending'], 'OPEN_ORDER')
+        self.assertEqual(dwx.open_orders, {})
+
+        order = {'magic': 7, 'symbol': 'EURUSD', 'lots': 0.1, 'type': 'buy', 'SL': 0, 'TP': 0}
+        transport.push('Orders', json.dumps({'account_info': account_info, 'orders': {'11': order}}))
+        self.assertIsNotNone(dwx.wait_for_orders(lambda s: '11' in s.open_orders, timeout=1))
+        self.assertEqual(dwx.effective_orders, {'11': order})
+
+        dwx.close_order(11)
+        self.assertEqual(dwx.effective_orders, {})
+        sleep(0.05)
+        command_id = int(self.commands[-1][0])
+        transport.push('Messages', json.dumps({str(int(time() * 1000)): {
+            'type': 'ERROR', 'error_type': 'CLOSE_ORDER_FAILED', 'command_id': command_id}}))
+        sleep(0.1)
+        self.assertEqual(dwx.effective_orders, {'11': order})
+        self.assertEqual(dwx.order_overlay.rolled_back, 1)
+
+        # invalid values are still sent (the server answers with an error), but not shown.
+        self.assertTrue(dwx.send_command('OPEN_ORDER', 'EURUSD,buy,abc,0,0,0,7,,0'))
+        self.assertTrue(dwx.send_command('MODIFY_ORDER', '11'))
+        self.assertEqual(dwx.effective_orders, {'11': order})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+
+from api.dwx_clock import dwx_clock
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the clock offset estimate. They do not need MetaTrader, the
+local times are given with the samples.
+
+"""
+
+
+class TestDWXClock(unittest.TestCase):
+
+    def setUp(self):
+
+        self.clock = dwx_clock(window_seconds=10)
+
+    def test_no_samples(self):
+
+        self.assertIsNone(self.clock.offset)
+        self.assertIsNone(self.clock.to_local(1000))
+        self.assertIsNone(self.clock.age(1000000))
+
+    def test_minimum_sample(self):
+
+        # server clock one hour ahead, the updates took 30, 10 and 50 ms.
+        for local_time, delay in [(1000, 0.03), (1001, 0.01), (1002, 0.05)]:
+            self.clock.add_sample((local_time - delay + 3600) * 1000, local_time)
+        self.assertAlmostEqual(self.clock.offset, -3600 + 0.01)
+        self.assertAlmostEqual(self.clock.to_local(4600), 1000.01)
+        # 40 ms slower than the fastest update.
+        self.assertAlmostEqual(self.clock.age((1002 - 0.05 + 3600) * 1000, now=1002), 0.04)
+        self.assertEqual(self.clock.age((1003 + 3600) * 1000, now=1002), 0.0)
+
+    def test_window(self):
+
+        self.clock.add_sample(1000 * 1000, 1000.01)
+        self.clock.add_sample(1005 * 1000, 1005.05)
+        self.assertAlmostEqual(self.clock.offset, 0.01)
+        # the fastest sample left the window, e.g. after a restart of the terminal.
+        self.clock.add_sample(1012 * 1000, 1012.03)
+        self.assertAlmostEqual(self.clock.offset, 0.03)
+
+    def test_parse_server_time(self):
+
+        self.assertEqual(self.clock.parse_server_time('2024.01.31 12:00'), 1706702400)
+        self.assertEqual(self.clock.parse_server_time('2024.01.31 12:00:30'), 1706702430)
+
+
+if __name__ == '__main__':
+    unittest.main()
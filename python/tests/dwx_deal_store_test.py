@@ -0,0 +1,70 @@
+
+from api.dwx_deal_store import dwx_deal_store
+import os
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the deal store. They do not need MetaTrader, the deals are
+given in the format of GET_HISTORIC_TRADES.
+
+"""
+
+
+class TestDWXDealStore(unittest.TestCase):
+
+    def setUp(self):
+
+        self.deals = {'12': {'magic': 1, 'symbol': 'EURUSD', 'lots': 0.1, 'pnl': 5.0,
+                             'deal_time': '2024.01.02 10:00:00'},
+                      '10': {'magic': 2, 'symbol': 'USDJPY', 'lots': 0.2, 'pnl': -3.0,
+                             'deal_time': '2024.01.01 10:00:00'},
+                      '15': {'magic': 1, 'symbol': 'USDJPY', 'lots': 0.1, 'pnl': 1.0,
+                             'deal_time': '2024.01.03 10:00:00'}}
+
+    def test_merge(self):
+
+        store = dwx_deal_store()
+        self.assertEqual(sorted(store.merge(self.deals)), ['10', '12', '15'])
+        # deals that are already stored are not returned again.
+        new_deals = store.merge({12: self.deals['12'], 16: dict(self.deals['12'], pnl=2.0)})
+        self.assertEqual(list(new_deals), ['16'])
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.last_ticket, 16)
+        self.assertEqual(store.last_time, 1704276000)
+
+    def test_queries(self):
+
+        store = dwx_deal_store()
+        store.merge(self.deals)
+        self.assertEqual(list(store.since(10)), ['12', '15'])
+        self.assertEqual(list(store.since(15)), [])
+        self.assertEqual(sorted(store.by_magic(1)), ['12', '15'])
+        self.assertEqual(sorted(store.by_symbol('USDJPY')), ['10', '15'])
+        self.assertEqual(store.by_symbol('GBPUSD'), {})
+
+    def test_load_after_restart(self):
+
+        with TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'deals.txt')
+            store = dwx_deal_store(file_path)
+            store.merge(self.deals)
+            store.merge({'16': dict(self.deals['12'], pnl=2.0)})
+            # incomplete last line after a crash.
+            with open(file_path, 'a') as f:
+                f.write('["17", {"magic"')
+
+            store = dwx_deal_store(file_path)
+            self.assertEqual(list(store.since(0)), ['10', '12', '15', '16'])
+            self.assertEqual(store.last_ticket, 16)
+            self.assertEqual(sorted(store.by_magic(1)), ['12', '15', '16'])
+            self.assertEqual(store.merge(self.deals), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
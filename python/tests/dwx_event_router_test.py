@@ -0,0 +1,127 @@
+
+from api.dwx_event_router import dwx_event_router
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the event router. They do not need MetaTrader, the events are
+called directly.
+
+"""
+
+
+class strategy():
+
+    def __init__(self):
+
+        self.events = []
+
+    def on_tick(self, symbol, bid, ask):
+        self.events.append(('tick', symbol))
+
+    def on_bar_close(self, symbol, time_frame, bar):
+        self.events.append(('bar_close', symbol, time_frame))
+
+    def on_order_event(self):
+        self.events.append(('order_event',))
+
+    def on_message(self, message):
+        self.events.append(('message', message.get('magic')))
+
+    def on_historic_trades(self):
+        self.events.append(('historic_trades',))
+
+    def on_stale(self, symbol, age):
+        self.events.append(('stale', symbol))
+
+    def on_sequence_gap(self, channel, gap):
+        self.events.append(('sequence_gap', channel))
+
+
+class client():
+
+    def __init__(self):
+
+        self.open_orders = {}
+
+
+class TestDWXEventRouter(unittest.TestCase):
+
+    def setUp(self):
+
+        self.dwx = client()
+        self.router = dwx_event_router(self.dwx)
+        self.trend = strategy()
+        self.scalper = strategy()
+        self.router.register(self.trend, symbols=['EURUSD'], time_frames=['H1'], magics=[1])
+        self.router.register(self.scalper, symbols=['GBPUSD', 'USDJPY'], magics=[2, 3])
+
+    def test_symbol_and_time_frame(self):
+
+        self.router.on_tick('EURUSD', 1.1, 1.2)
+        self.router.on_tick('USDJPY', 150, 150.1)
+        self.router.on_tick('AUDUSD', 0.6, 0.7)
+        self.router.on_bar_close('EURUSD', 'M1', {})
+        self.router.on_bar_close('EURUSD', 'H1', {})
+        self.router.on_bar_close('GBPUSD', 'M5', {})
+        self.assertEqual(self.trend.events, [('tick', 'EURUSD'), ('bar_close', 'EURUSD', 'H1')])
+        self.assertEqual(self.scalper.events, [('tick', 'USDJPY'), ('bar_close', 'GBPUSD', 'M5')])
+
+    def test_order_events_and_messages(self):
+
+        self.dwx.open_orders = {'1': {'magic': 2, 'type': 'buy', 'lots': 0.1},
+                                '2': {'magic': 3, 'type': 'sell', 'lots': 0.1}}
+        self.router.on_order_event()
+        # a handler with several magic numbers is only called once.
+        self.assertEqual(self.scalper.events, [('order_event',)])
+        self.assertEqual(self.trend.events, [])
+
+        # an order of magic 2 is closed, one of magic 1 opened.
+        self.dwx.open_orders = {'2': {'magic': 3, 'type': 'sell', 'lots': 0.1},
+                                '3': {'magic': 1, 'type': 'buy', 'lots': 0.2}}
+        self.router.on_order_event()
+        self.assertEqual(self.trend.events, [('order_event',)])
+        self.assertEqual(len(self.scalper.events), 2)
+
+        self.router.on_message({'type': 'INFO', 'magic': 1})
+        self.router.on_message({'type': 'INFO'})
+        self.assertEqual(self.trend.events[1:], [('message', 1), ('message', None)])
+        self.assertEqual(self.scalper.events[2:], [('message', None)])
+
+    def test_stale_and_sequence_gap(self):
+
+        monitor = strategy()
+        self.router.register(monitor, channels=['orders'])
+        self.router.on_stale('EURUSD', 10)
+        self.router.on_stale('AUDUSD', 10)
+        self.router.on_sequence_gap('market_data', 1)
+        self.router.on_sequence_gap('orders', 2)
+        self.assertEqual(self.trend.events, [('stale', 'EURUSD'), ('sequence_gap', 'market_data'),
+                                             ('sequence_gap', 'orders')])
+        self.assertEqual(self.scalper.events, [('sequence_gap', 'market_data'), ('sequence_gap', 'orders')])
+        self.assertEqual(monitor.events, [('stale', 'EURUSD'), ('stale', 'AUDUSD'), ('sequence_gap', 'orders')])
+
+    def test_broadcast_and_cache(self):
+
+        self.router.on_historic_trades()
+        self.assertEqual(self.trend.events, [('historic_trades',)])
+        self.assertEqual(self.scalper.events, [('historic_trades',)])
+        with self.assertRaises(AttributeError):
+            self.router.on_unknown_event()
+
+        self.router.on_tick('EURUSD', 1.1, 1.2)
+        # the cached routes are rebuilt after register() and unregister().
+        other = strategy()
+        self.router.register(other)
+        self.router.unregister(self.trend)
+        self.router.on_tick('EURUSD', 1.1, 1.2)
+        self.assertEqual(self.trend.events, [('historic_trades',), ('tick', 'EURUSD')])
+        self.assertEqual(other.events, [('tick', 'EURUSD')])
+
+
+if __name__ == '__main__':
+    unittest.main()
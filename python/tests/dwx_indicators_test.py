@@ -0,0 +1,112 @@
+
+from api.dwx_indicators import dwx_indicators, sma, ema, atr, rsi, np
+import sys
+import math
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the streaming indicators. They do not need MetaTrader. The
+streaming values are compared with seed() and batch() on the same bars.
+
+"""
+
+
+class TestDWXIndicators(unittest.TestCase):
+
+    def setUp(self):
+
+        self.bars = []
+        close = 1.1
+        for i in range(200):
+            open_price = close
+            close = open_price + 0.001 * math.sin(i * 0.7) + 0.0003 * math.cos(i * 1.3)
+            self.bars.append({'open': open_price, 'high': max(open_price, close) + 0.0004,
+                              'low': min(open_price, close) - 0.0002, 'close': close})
+        self.times = [1000 + 60 * i for i in range(len(self.bars))]
+
+    def streaming(self, indicator, bars=None):
+
+        for time, bar in zip(self.times, bars or self.bars):
+            indicator.update(bar, time)
+        return indicator.value
+
+    def test_streaming_and_seeded_agree(self):
+
+        for cls in [sma, ema, atr, rsi]:
+            seeded = cls(14)
+            seeded.seed(self.bars, self.times)
+            self.assertAlmostEqual(self.streaming(cls(14)), seeded.value, places=9, msg=cls.__name__)
+            self.assertEqual(seeded.count, len(self.bars))
+
+            # seeded with the first bars and streamed afterwards.
+            seeded = cls(14)
+            seeded.seed(self.bars[:100], self.times[:100])
+            for time, bar in zip(self.times[100:], self.bars[100:]):
+                seeded.update(bar, time)
+            self.assertAlmostEqual(self.streaming(cls(14)), seeded.value, places=9, msg=cls.__name__)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_batch(self):
+
+        historic_data = {f'{symbol}_M1': {time: bar for time, bar in zip(self.times, bars)}
+                         for symbol, bars in [('EURUSD', self.bars), ('GBPUSD', self.bars[50:])]}
+        indicators = dwx_indicators()
+        for cls in [sma, ema, atr, rsi]:
+            values = indicators.batch(cls.__name__, 14, 'M1', historic_data)
+            # only the bars that all symbols have in common are used.
+            expected = self.streaming(cls(14), self.bars[50:])
+            self.assertAlmostEqual(values['EURUSD'], expected, places=9, msg=cls.__name__)
+            self.assertAlmostEqual(values['GBPUSD'], expected, places=9, msg=cls.__name__)
+        self.assertEqual(indicators.batch('ema', 14, 'H1', historic_data), {})
+
+        # warm-up: None like update(), for every number of bars.
+        for num_bars in [1, 14, 15]:
+            for cls in [sma, ema, atr, rsi]:
+                expected = self.streaming(cls(14), self.bars[-num_bars:])
+                value = indicators.batch(cls.__name__, 14, 'M1', historic_data, num_bars=num_bars)['EURUSD']
+                if expected is None:
+                    self.assertIsNone(value, msg=f'{cls.__name__} {num_bars}')
+                else:
+                    self.assertAlmostEqual(value, expected, places=9, msg=f'{cls.__name__} {num_bars}')
+
+    def test_forming_bar_is_replaced(self):
+
+        for cls in [sma, ema, atr, rsi]:
+            indicator = cls(5)
+            for i, (time, bar) in enumerate(zip(self.times[:50], self.bars[:50])):
+                # every bar is first sent as forming bar with other values.
+                indicator.update(dict(bar, close=bar['close'] + 0.01, high=bar['high'] + 0.01), time)
+                indicator.update(bar, time)
+            self.assertAlmostEqual(indicator.value, self.streaming(cls(5), self.bars[:50]),
+                                   places=12, msg=cls.__name__)
+            self.assertEqual(indicator.count, 50)
+            # older bars are ignored.
+            value = indicator.value
+            self.assertEqual(indicator.update(self.bars[0], self.times[0]), value)
+
+    def test_registry(self):
+
+        indicators = dwx_indicators()
+        history = {time: bar for time, bar in zip(self.times[:100], self.bars[:100])}
+        self.assertEqual(indicators.add('EURUSD', 'M1', ema(20), history=history), 'ema_20')
+        indicators.add('EURUSD', 'M1', sma(20), name='slow')
+        for time, bar in zip(self.times[100:], self.bars[100:]):
+            indicators.update('EURUSD_M1', dict(bar, time=time))
+        self.assertAlmostEqual(indicators.get('EURUSD', 'M1', 'ema_20'), self.streaming(ema(20)))
+        self.assertAlmostEqual(indicators.values('EURUSD', 'M1')['slow'], self.streaming(sma(20)))
+
+        # historic data that ends before the last bar is ignored.
+        value = indicators.get('EURUSD', 'M1', 'ema_20')
+        indicators.seed('EURUSD_M1', history)
+        self.assertEqual(indicators.get('EURUSD', 'M1', 'ema_20'), value)
+
+        indicators.remove('EURUSD', 'M1', 'slow')
+        self.assertIsNone(indicators.get('EURUSD', 'M1', 'slow'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+
+from api.dwx_market_snapshot import dwx_market_snapshot
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the market data snapshot. They do not need MetaTrader.
+
+"""
+
+
+class TestDWXMarketSnapshot(unittest.TestCase):
+
+    def setUp(self):
+
+        self.snapshot = dwx_market_snapshot(capacity=2)
+
+    def test_update_and_views(self):
+
+        self.assertTrue(self.snapshot.update('EURUSD', {'bid': 1.1, 'ask': 1.2}))
+        self.assertFalse(self.snapshot.update('EURUSD', {'bid': 1.1, 'ask': 1.2}))
+        view = self.snapshot['EURUSD']
+        # the view shows the new values without a new lookup.
+        self.assertTrue(self.snapshot.update('EURUSD', {'bid': 1.15, 'ask': 1.2}))
+        self.assertEqual(view['bid'], 1.15)
+        self.assertEqual(view.keys(), ['bid', 'ask'])
+        self.assertNotIn('last', view)
+        self.assertIsNone(view.get('last'))
+        with self.assertRaises(KeyError):
+            view['last']
+        # fields that are not in FIELDS are added on first use.
+        self.snapshot.update('EURUSD', {'spread': 2.0})
+        self.assertEqual(view['spread'], 2.0)
+        self.assertEqual(view, {'bid': 1.15, 'ask': 1.2, 'spread': 2.0})
+
+    def test_grow_and_to_dict(self):
+
+        for i, symbol in enumerate(['EURUSD', 'GBPUSD', 'USDJPY']):
+            self.snapshot.update(symbol, {'bid': i, 'ask': i + 1})
+        self.assertEqual(len(self.snapshot), 3)
+        self.assertEqual(self.snapshot.to_dict(), {'EURUSD': {'bid': 0, 'ask': 1},
+                                                   'GBPUSD': {'bid': 1, 'ask': 2},
+                                                   'USDJPY': {'bid': 2, 'ask': 3}})
+        self.assertEqual(self.snapshot.keys(), ['EURUSD', 'GBPUSD', 'USDJPY'])
+
+    def test_retain(self):
+
+        self.snapshot.update('EURUSD', {'bid': 1.1, 'ask': 1.2, 'last': 1.15})
+        self.snapshot.update('GBPUSD', {'bid': 1.3, 'ask': 1.4})
+        self.snapshot.retain(['GBPUSD'])
+        self.assertNotIn('EURUSD', self.snapshot)
+        self.assertIsNone(self.snapshot.get('EURUSD'))
+        self.assertEqual(self.snapshot.keys(), ['GBPUSD'])
+        self.assertEqual(self.snapshot, {'GBPUSD': {'bid': 1.3, 'ask': 1.4}})
+
+        # added again without 'last': the old value is gone.
+        self.assertTrue(self.snapshot.update('EURUSD', {'bid': 1.1, 'ask': 1.2}))
+        self.assertEqual(self.snapshot['EURUSD'].to_dict(), {'bid': 1.1, 'ask': 1.2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,8 +30,10 @@ class TickProcessor():
         self.last_modification_time = datetime.now(timezone.utc)
 
         self.dwx = dwx_client(self, MT4_directory_path, sleep_delay, 
-                              max_retry_command_seconds, verbose=verbose)
-        sleep(1)
+                              max_retry_command_seconds, verbose=verbose, 
+                              auto_connect=False)
+        # returns as soon as the mql server responded. 
+        self.dwx.connect()
 
         self.dwx.start()
 
@@ -0,0 +1,87 @@
+
+from api.dwx_order_overlay import dwx_order_overlay
+import sys
+import unittest
+from time import sleep
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the orders overlay. They do not need MetaTrader, the open
+orders and messages are given as dictionaries.
+
+"""
+
+
+class TestDWXOrderOverlay(unittest.TestCase):
+
+    def setUp(self):
+
+        self.overlay = dwx_order_overlay(timeout=5)
+        self.order = {'magic': 7, 'symbol': 'EURUSD', 'lots': 0.3, 'type': 'buy', 'open_price': 1.1,
+                      'SL': 0, 'TP': 0}
+        self.open_orders = {'11': self.order}
+
+    def test_open_order_confirmed(self):
+
+        self.overlay.add('OPEN_ORDER', 'EURUSD,sell,0.1,0,0,0,7,,0', self.open_orders)
+        orders = self.overlay.apply(self.open_orders)
+        self.assertEqual(sorted(orders), ['11', 'pending_1'])
+        self.assertEqual(orders['pending_1']['pending'], 'OPEN_ORDER')
+
+        # a new ticket of another symbol does not confirm it.
+        self.open_orders['12'] = dict(self.order, symbol='GBPUSD', type='sell')
+        self.overlay.on_orders(self.open_orders)
+        self.assertEqual(self.overlay.confirmed, 0)
+        self.open_orders['13'] = dict(self.order, type='sell', lots=0.1)
+        self.overlay.on_orders(self.open_orders)
+        self.assertEqual(self.overlay.confirmed, 1)
+        self.assertEqual(self.overlay.apply(self.open_orders), self.open_orders)
+
+    def test_rollback_by_error(self):
+
+        pending = self.overlay.add('CLOSE_ORDER', '11,0', self.open_orders)
+        self.overlay.set_command_id(pending, 42)
+        self.assertEqual(self.overlay.apply(self.open_orders), {})
+
+        self.assertIsNone(self.overlay.on_message({'type': 'INFO', 'command_id': 42}))
+        self.assertIsNone(self.overlay.on_message({'type': 'ERROR', 'command_id': 41}))
+        self.assertEqual(self.overlay.on_message({'type': 'ERROR', 'error_type': 'CLOSE_ORDER_FAILED',
+                                               'command_id': 42})['command'], 'CLOSE_ORDER')
+        self.assertEqual(self.overlay.rolled_back, 1)
+        self.assertEqual(self.overlay.apply(self.open_orders), self.open_orders)
+
+    def test_expiry(self):
+
+        self.overlay.timeout = 0.01
+        self.overlay.add('MODIFY_ORDER', '11,0,1.05,1.2,0', self.open_orders)
+        self.assertEqual(self.overlay.apply(self.open_orders)['11']['SL'], 1.05)
+        # e.g. the broker changed the stop loss, so that it is never confirmed.
+        sleep(0.02)
+        self.assertEqual(self.overlay.apply(self.open_orders), self.open_orders)
+        self.assertEqual(self.overlay.expired, 1)
+
+    def test_partial_close(self):
+
+        self.overlay.add('CLOSE_ORDER', '11,0.1', self.open_orders)
+        order = self.overlay.apply(self.open_orders)['11']
+        self.assertAlmostEqual(order['lots'], 0.2)
+        self.assertEqual(order['pending'], 'CLOSE_ORDER')
+
+        self.overlay.on_orders(self.open_orders)
+        self.assertEqual(self.overlay.confirmed, 0)
+        self.overlay.on_orders({'11': dict(self.order, lots=0.2)})
+        self.assertEqual(self.overlay.confirmed, 1)
+
+    def test_invalid_commands(self):
+
+        self.assertIsNone(self.overlay.add('OPEN_ORDER', 'EURUSD,buy,abc,0,0,0,7,,0', self.open_orders))
+        self.assertIsNone(self.overlay.add('MODIFY_ORDER', '11', self.open_orders))
+        self.assertIsNone(self.overlay.add('SUBSCRIBE_SYMBOLS', 'EURUSD', self.open_orders))
+        self.assertEqual(self.overlay.pending(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+
+from api.dwx_paper_trader import dwx_paper_trader
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the paper trader. They do not need MetaTrader, the ticks are
+replayed with on_tick().
+
+"""
+
+
+class TestDWXPaperTrader(unittest.TestCase):
+
+    def setUp(self):
+
+        self.paper = dwx_paper_trader(balance=10000, contract_size=100000, verbose=False)
+        self.time = 1000
+
+    def tick(self, bid, ask, symbol='EURUSD'):
+
+        self.time += 1
+        self.paper.on_tick(symbol, bid, ask, self.time)
+
+    def only_order(self):
+
+        orders = self.paper.open_orders
+        self.assertEqual(len(orders), 1)
+        return list(orders.values())[0]
+
+    def test_market_fill_with_slippage(self):
+
+        self.paper.slippage = 0.0001
+        self.tick(1.1, 1.1002)
+        self.paper.open_order('EURUSD', 'buy', 0.1)
+        self.assertAlmostEqual(self.only_order()['open_price'], 1.1003)
+        self.paper.close_order(1)
+        # closed at the bid minus slippage.
+        self.assertAlmostEqual(self.paper.balance, 10000 + (1.0999 - 1.1003) * 0.1 * 100000)
+        self.assertEqual(self.paper.open_orders, {})
+
+    def test_limit_fill_without_slippage(self):
+
+        self.paper.slippage = 0.0001
+        self.tick(1.1, 1.1002)
+        self.paper.open_order('EURUSD', 'buylimit', 0.1, price=1.099)
+        self.tick(1.0992, 1.0994)
+        self.assertEqual(self.only_order()['type'], 'buylimit')
+        # gap below the limit: filled at the better ask.
+        self.tick(1.0985, 1.0987)
+        order = self.only_order()
+        self.assertEqual(order['type'], 'buy')
+        self.assertAlmostEqual(order['open_price'], 1.0987)
+
+        self.paper.open_order('EURUSD', 'selllimit', 0.1, price=1.1)
+        self.tick(1.1, 1.1002)
+        sell = [o for o in self.paper.open_orders.values() if o['type'] == 'sell'][0]
+        self.assertAlmostEqual(sell['open_price'], 1.1)
+
+    def test_stop_fill(self):
+
+        self.paper.slippage = 0.0001
+        self.tick(1.1, 1.1002)
+        self.paper.open_order('EURUSD', 'sellstop', 0.1, price=1.095)
+        self.tick(1.0951, 1.0953)
+        self.assertEqual(self.only_order()['type'], 'sellstop')
+        self.tick(1.0949, 1.0951)
+        order = self.only_order()
+        self.assertEqual(order['type'], 'sell')
+        self.assertAlmostEqual(order['open_price'], 1.0948)
+
+    def test_stop_loss_and_take_profit(self):
+
+        self.tick(1.1, 1.1002)
+        # buy: SL and TP on the bid.
+        self.paper.open_order('EURUSD', 'buy', 0.1, stop_loss=1.099, take_profit=1.102)
+        self.tick(1.1019, 1.1021)
+        self.assertEqual(len(self.paper.open_orders), 1)
+        self.tick(1.102, 1.1022)
+        self.assertEqual(self.paper.open_orders, {})
+        self.assertAlmostEqual(self.paper.balance, 10000 + (1.102 - 1.1022) * 0.1 * 100000 + 0.1 * 0.002 * 100000)
+
+        # sell: SL and TP on the ask.
+        balance = self.paper.balance
+        self.paper.open_order('EURUSD', 'sell', 0.1, stop_loss=1.104, take_profit=1.1)
+        self.tick(1.1039, 1.1041)
+        self.assertEqual(self.paper.open_orders, {})
+        self.assertAlmostEqual(self.paper.balance, balance + (1.102 - 1.1041) * 0.1 * 100000)
+
+    def test_partial_close(self):
+
+        self.tick(1.1, 1.1002)
+        self.paper.open_order('EURUSD', 'buy', 0.3)
+        self.paper.close_order(1, 0.1)
+        self.assertAlmostEqual(self.only_order()['lots'], 0.2)
+        deals = list(self.paper.historic_trades.values())
+        self.assertEqual([d['entry'] for d in deals], ['entry_in', 'entry_out'])
+        self.assertAlmostEqual(deals[1]['lots'], 0.1)
+
+    def test_expiration(self):
+
+        self.tick(1.1, 1.1002)
+        self.paper.open_order('EURUSD', 'buystop', 0.1, price=1.11, expiration=self.time + 5)
+        self.tick(1.1, 1.1002)
+        self.assertEqual(len(self.paper.open_orders), 1)
+        self.time += 5
+        self.tick(1.1, 1.1002)
+        self.assertEqual(self.paper.open_orders, {})
+
+    def test_modify_then_trigger(self):
+
+        self.tick(1.1, 1.1002)
+        self.paper.open_order('EURUSD', 'buy', 0.1, stop_loss=1.09)
+        # trailing stop.
+        for i in range(1000):
+            self.paper.modify_order(1, stop_loss=1.09 + i * 0.000009)
+        self.tick(1.0995, 1.0997)
+        self.assertEqual(len(self.paper.open_orders), 1)
+        self.tick(1.0989, 1.0991)
+        self.assertEqual(self.paper.open_orders, {})
+        # the entries of the old versions are not kept.
+        for heap in self.paper._triggers.values():
+            self.assertLess(len(heap), 10)
+
+        self.paper.open_order('EURUSD', 'buylimit', 0.1, price=1.09, expiration=self.time + 100)
+        for i in range(1000):
+            self.paper.modify_order(2, price=1.09 + i * 0.00001, expiration=self.time + 100)
+        self.assertLess(len(self.paper._expirations), 10)
+        self.tick(1.0998, 1.09995)
+        order = self.only_order()
+        self.assertEqual(order['type'], 'buy')
+        self.assertAlmostEqual(order['open_price'], 1.09995)
+
+
+    def test_profit_in_account_currency(self):
+
+        # converted to the account currency with the tick values.
+        self.paper.tick_values = {'USDJPY': (0.67, 0.001)}
+        self.tick(150.0, 150.02, 'USDJPY')
+        self.paper.open_order('USDJPY', 'buy', 0.1)
+        self.tick(151.02, 151.04, 'USDJPY')
+        self.assertAlmostEqual(self.only_order()['pnl'], 1.0 * 0.1 * 670)
+        self.assertAlmostEqual(self.paper.account_info['equity'], 10000 + 67)
+
+    def test_optional_events(self):
+
+        class handler():
+            def on_stale(self, symbol, age):
+                pass
+
+        class client():
+            market_data = {}
+
+            def on_sequence_gap(self, channel, gap):
+                pass
+
+        # optional events are looked up at the event handler, not at the client.
+        self.paper.event_handler = handler()
+        self.paper.dwx = client()
+        self.assertTrue(hasattr(self.paper, 'on_stale'))
+        self.assertFalse(hasattr(self.paper, 'on_sequence_gap'))
+        self.assertFalse(hasattr(self.paper, 'on_bar_close'))
+        self.paper.event_handler = None
+        self.assertFalse(hasattr(self.paper, 'on_stale'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -38,8 +38,10 @@ class TickProcessor():
         self.last_modification_time = datetime.now(timezone.utc)
 
         self.dwx = dwx_client(self, MT4_directory_path, sleep_delay, 
-                              max_retry_command_seconds, verbose=verbose)
-        sleep(1)
+                              max_retry_command_seconds, verbose=verbose, 
+                              auto_connect=False)
+        # returns as soon as the mql server responded. 
+        self.dwx.connect()
 
         self.dwx.start()
         
@@ -50,9 +52,7 @@ class TickProcessor():
         self.test_started = False
         self.n_modified = 0
         self.dwx.close_all_orders()
-        while(len(self.dwx.open_orders) != 0):
-            # print(self.dwx.open_orders)
-            sleep(1)
+        self.dwx.wait_for_orders(lambda s: len(s.open_orders) == 0)
 
         self.test_started = True
         self.before_open = datetime.now(timezone.utc)
@@ -61,15 +61,15 @@ class TickProcessor():
             self.dwx.open_order(symbol=symbol, order_type='buylimit', lots=0.01, price=entry_price)
         
         
-        while(len(self.dwx.open_orders) < self.n):
-            sleep(1)
+        self.dwx.wait_for_orders(lambda s: len(s.open_orders) >= self.n)
         
         self.modify_duration = -100
         self.before_modification = datetime.now(timezone.utc)
         for ticket in self.dwx.open_orders.keys():
             self.dwx.modify_order(ticket, stop_loss=entry_price-0.01)
         
-        sleep(1)
+        self.dwx.wait_for_orders(lambda s: all(order['SL'] > 0 for order in s.open_orders.values()),
+                                 timeout=10)
 
         self.before_close = datetime.now(timezone.utc)
         for ticket in self.dwx.open_orders.keys():
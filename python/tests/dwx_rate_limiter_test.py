@@ -0,0 +1,95 @@
+
+from api.dwx_rate_limiter import dwx_rate_limiter
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the command rate limiter. The clock is replaced, sleeping only
+advances it, so that the tests are deterministic.
+
+"""
+
+
+class TestDWXRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+
+        self.now = 100.0
+        self.sleeps = []
+
+    def time_function(self):
+        return self.now
+
+    def sleep_function(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def limiter(self, **kwargs):
+
+        return dwx_rate_limiter(time_function=self.time_function,
+                                sleep_function=self.sleep_function, **kwargs)
+
+    def test_block(self):
+
+        limiter = self.limiter(command_limits={'OPEN_ORDER': (2, 2)})
+        for i in range(4):
+            self.assertTrue(limiter.acquire('OPEN_ORDER', 'EURUSD'))
+        # the burst of two passes, then one command every 0.5 seconds.
+        self.assertEqual(self.sleeps, [0.5, 0.5])
+        # other commands are not limited.
+        self.assertTrue(limiter.acquire('MODIFY_ORDER'))
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertEqual(limiter.get_metrics(), {'throttled': {'OPEN_ORDER': 2}, 'rejected': {},
+                                                 'wait_seconds': 1.0})
+
+    def test_reject(self):
+
+        limiter = self.limiter(command_limits={'*': (1, 1)}, mode='reject')
+        self.assertTrue(limiter.acquire('OPEN_ORDER'))
+        self.assertFalse(limiter.acquire('MODIFY_ORDER'))
+        self.assertFalse(limiter.acquire('MODIFY_ORDER'))
+        # rejected commands do not use tokens.
+        self.now += 1
+        self.assertTrue(limiter.acquire('MODIFY_ORDER'))
+        self.assertEqual(self.sleeps, [])
+        self.assertEqual(limiter.get_metrics()['rejected'], {'MODIFY_ORDER': 2})
+
+    def test_queue(self):
+
+        limiter = self.limiter(command_limits={'OPEN_ORDER': (1, 1)}, mode='queue', max_wait=0.5)
+        self.assertTrue(limiter.acquire('OPEN_ORDER'))
+        # the next token is one second away, longer than max_wait.
+        self.assertFalse(limiter.acquire('OPEN_ORDER'))
+        self.now += 0.6
+        self.assertTrue(limiter.acquire('OPEN_ORDER'))
+        self.assertAlmostEqual(self.sleeps[0], 0.4)
+        metrics = limiter.get_metrics()
+        self.assertEqual(metrics['throttled'], {'OPEN_ORDER': 1})
+        self.assertEqual(metrics['rejected'], {'OPEN_ORDER': 1})
+        self.assertAlmostEqual(metrics['wait_seconds'], 0.4)
+
+    def test_symbol_limits(self):
+
+        limiter = self.limiter(symbol_limits={'*': (1, 1), 'GBPUSD': (1, 2)}, mode='reject')
+        self.assertTrue(limiter.acquire('OPEN_ORDER', 'EURUSD'))
+        # every symbol has its own bucket.
+        self.assertTrue(limiter.acquire('OPEN_ORDER', 'USDJPY'))
+        self.assertFalse(limiter.acquire('OPEN_ORDER', 'EURUSD'))
+        self.assertTrue(limiter.acquire('OPEN_ORDER', 'GBPUSD'))
+        self.assertTrue(limiter.acquire('OPEN_ORDER', 'GBPUSD'))
+        self.assertFalse(limiter.acquire('OPEN_ORDER', 'GBPUSD'))
+        # commands without symbol are not limited.
+        self.assertTrue(limiter.acquire('CLOSE_ALL_ORDERS'))
+
+    def test_unknown_mode(self):
+
+        with self.assertRaises(ValueError):
+            dwx_rate_limiter(mode='drop')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+
+from api.dwx_risk_aggregator import dwx_risk_aggregator
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the risk aggregator. They do not need MetaTrader, the orders
+and the market data are given as dictionaries.
+
+"""
+
+
+class TestDWXRiskAggregator(unittest.TestCase):
+
+    def setUp(self):
+
+        self.risk = dwx_risk_aggregator(sample_seconds=0)
+        self.account_info = {'balance': 1000, 'equity': 1010, 'free_margin': 900, 'leverage': 100}
+        self.orders = {'1': {'magic': 1, 'symbol': 'EURUSD', 'lots': 0.5, 'type': 'buy', 'open_price': 1.1,
+                             'pnl': 5.0, 'swap': -1.0},
+                       '2': {'magic': 2, 'symbol': 'USDJPY', 'lots': 0.2, 'type': 'sell', 'open_price': 150,
+                             'pnl': 3.0, 'swap': 0}}
+
+    """Checks the exposure and floating pnl after an orders update and
+    a tick. Pending orders are not counted.
+    """
+
+    def test_exposure_and_pnl(self):
+
+        tick = {'bid': 1.1, 'ask': 1.1002, 'tick_value': 1.0, 'tick_size': 0.00001}
+        orders = {'1': {'magic': 1, 'symbol': 'EURUSD', 'lots': 0.5, 'type': 'buy', 'open_price': 1.1,
+                        'pnl': 0, 'swap': -1.0},
+                  '2': {'magic': 2, 'symbol': 'EURUSD', 'lots': 0.2, 'type': 'sell', 'open_price': 1.1,
+                        'pnl': 0, 'swap': 0},
+                  '3': {'magic': 2, 'symbol': 'GBPUSD', 'lots': 0.1, 'type': 'buylimit', 'open_price': 1.2,
+                        'pnl': 0, 'swap': 0}}
+        self.risk.on_orders(orders, {'balance': 1000}, {'EURUSD': tick})
+        self.assertAlmostEqual(self.risk.get_symbol('EURUSD')['net_lots'], 0.3)
+        self.assertEqual(self.risk.get_symbol('GBPUSD')['net_lots'], 0)
+        self.assertAlmostEqual(self.risk.get_magic(2)['pnl'], -4.0)
+        self.assertAlmostEqual(self.risk.get_currency('USD'), -0.3 * 1.1001 * 100000)
+
+        self.risk.on_tick('EURUSD', dict(tick, bid=1.101, ask=1.1012))
+        self.assertAlmostEqual(self.risk.get_magic(1)['pnl'], 0.5 * 100 - 1.0)
+        self.assertAlmostEqual(self.risk.get_magic(2)['pnl'], -0.2 * 120)
+        self.assertAlmostEqual(self.risk.equity, 1000 + 49 - 24)
+        self.assertAlmostEqual(self.risk.get_equity_series()[-1][1], 1025)
+
+    def test_margin(self):
+
+        market_data = {'EURUSD': {'bid': 1.1, 'ask': 1.1002, 'tick_value': 1.0, 'tick_size': 0.00001,
+                                  'margin_per_lot': 1100.0},
+                       'USDJPY': {'bid': 150, 'ask': 150.02, 'tick_value': 0.67, 'tick_size': 0.001}}
+        self.risk.on_orders(self.orders, self.account_info, market_data)
+        self.assertAlmostEqual(self.risk.get_symbol('EURUSD')['margin'], 550)
+        # without margin_per_lot, notional / leverage.
+        notional = 0.2 * 150.01 * 670
+        self.assertAlmostEqual(self.risk.get_magic(2)['margin'], notional / 100)
+        self.assertAlmostEqual(self.risk.margin, 550 + notional / 100)
+        self.assertAlmostEqual(self.risk.account_margin, 110)
+
+    def test_unpriced_positions(self):
+
+        # USDJPY has tick values, but no tick yet, EURUSD is not subscribed.
+        market_data = {'USDJPY': {'tick_value': 0.67, 'tick_size': 0.001}}
+        self.risk.on_orders(self.orders, self.account_info, market_data)
+        self.assertEqual(self.risk.get_unpriced_symbols(), ['EURUSD'])
+        eurusd = self.risk.get_symbol('EURUSD')
+        self.assertEqual(eurusd['unpriced'], 1)
+        self.assertEqual(eurusd['notional'], 0)
+        self.assertAlmostEqual(eurusd['pnl'], 4.0)
+        # valued at the open price until the first tick.
+        usdjpy = self.risk.get_symbol('USDJPY')
+        self.assertEqual(usdjpy['unpriced'], 0)
+        self.assertAlmostEqual(usdjpy['notional'], -0.2 * 150 * 670)
+        self.assertAlmostEqual(usdjpy['pnl'], 3.0)
+
+        self.risk.on_tick('EURUSD', {'bid': 1.101, 'ask': 1.1012, 'tick_value': 1.0, 'tick_size': 0.00001})
+        self.assertEqual(self.risk.get_unpriced_symbols(), [])
+        self.assertEqual(self.risk.get_magic(1)['unpriced'], 0)
+        self.assertAlmostEqual(self.risk.get_magic(1)['pnl'], 0.5 * 100 - 1.0)
+        self.assertAlmostEqual(self.risk.get_currency('EUR'), 0.5 * 1.1011 * 100000)
+        self.assertAlmostEqual(self.risk.equity, 1000 + 49 + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+
+from api.dwx_terminal_manager import dwx_terminal_manager
+from api.dwx_transport import dwx_memory_transport
+import sys
+import json
+import unittest
+from time import sleep, monotonic
+from threading import Thread
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the terminal manager with two simulated terminals on memory
+transports. They do not need MetaTrader.
+
+"""
+
+
+class TestDWXTerminalManager(unittest.TestCase):
+
+    def setUp(self):
+
+        self.ticks = []
+        self.transports = {'a': dwx_memory_transport(), 'b': dwx_memory_transport()}
+        for transport in self.transports.values():
+            Thread(target=self.answer_reset, args=(transport,), daemon=True).start()
+        self.manager = dwx_terminal_manager(self, self.transports, verbose=False,
+                                            load_orders_from_file=False)
+        self.addCleanup(self.manager.stop)
+        self.manager.connect(timeout=1)
+
+    def on_tick(self, tag, symbol, bid, ask):
+        self.ticks.append((tag, symbol))
+
+    def on_message(self, tag, message):
+        pass
+
+    def on_order_event(self, tag):
+        pass
+
+    """Answers the RESET_COMMAND_IDS command of the connect. The other
+    commands are left in transport.commands.
+    """
+
+    def answer_reset(self, transport):
+
+        while True:
+            command = transport.pop_command()
+            if command is None:
+                sleep(0.001)
+                continue
+            fields = command[2:-2].split('|')
+            transport.push('Messages', json.dumps(
+                {'1': {'type': 'ACK', 'command': fields[1], 'token': fields[2]}}))
+            return
+
+    """Returns and removes the commands sent to a terminal as
+    (command, content) tuples.
+    """
+
+    def commands(self, tag):
+
+        commands = []
+        while True:
+            command = self.transports[tag].pop_command()
+            if command is None:
+                return commands
+            commands.append(tuple(command[2:-2].split('|')[1:]))
+
+    def wait(self, predicate, timeout=1):
+
+        end_time = monotonic() + timeout
+        while not predicate():
+            if monotonic() > end_time:
+                self.fail('Timeout')
+            sleep(0.001)
+
+    def test_sticky_partitioning(self):
+
+        self.manager.subscribe_symbols(['EURUSD', 'GBPUSD', 'USDJPY'])
+        self.assertEqual(self.commands('a'), [('SUBSCRIBE_SYMBOLS', 'EURUSD,USDJPY')])
+        self.assertEqual(self.commands('b'), [('SUBSCRIBE_SYMBOLS', 'GBPUSD')])
+
+        # known symbols stay with their terminal, new ones go to the one with the fewest.
+        self.manager.subscribe_symbols(['USDJPY', 'AUDUSD'])
+        self.assertEqual(self.commands('a'), [('SUBSCRIBE_SYMBOLS', 'USDJPY')])
+        self.assertEqual(self.commands('b'), [('SUBSCRIBE_SYMBOLS', 'AUDUSD')])
+
+        self.manager.assign_symbol('NZDUSD', 'a')
+        self.manager.subscribe_symbols_bar_data([['NZDUSD', 'M1'], ['GBPUSD', 'H1']])
+        self.assertEqual(self.commands('a'), [('SUBSCRIBE_SYMBOLS_BAR_DATA', 'NZDUSD,M1')])
+        self.assertEqual(self.commands('b'), [('SUBSCRIBE_SYMBOLS_BAR_DATA', 'GBPUSD,H1')])
+        with self.assertRaises(ValueError):
+            self.manager.assign_symbol('EURUSD', 'c')
+
+    def test_order_routing(self):
+
+        self.manager.subscribe_symbols(['EURUSD', 'GBPUSD'])
+        self.commands('a'), self.commands('b')
+
+        # by symbol.
+        self.manager.open_order('GBPUSD', 'buy', 0.1)
+        self.assertEqual(self.commands('a'), [])
+        self.assertEqual(self.commands('b')[0][0], 'OPEN_ORDER')
+
+        # by ticket.
+        order = {'magic': 0, 'symbol': 'EURUSD', 'lots': 0.1, 'type': 'buy', 'SL': 0, 'TP': 0}
+        self.transports['a'].push('Orders', json.dumps({'account_info': {'number': 111}, 'orders': {'11': order}}))
+        self.transports['b'].push('Orders', json.dumps({'account_info': {'number': 222}, 'orders': {}}))
+        self.wait(lambda: '11' in self.manager.open_orders['a'] and len(self.manager.account_info['b']) > 0)
+        self.manager.close_order(11)
+        self.assertEqual(self.commands('a'), [('CLOSE_ORDER', '11,0')])
+        with self.assertRaises(ValueError):
+            self.manager.close_order(12)
+
+        # by tag or account number.
+        self.manager.open_order('EURUSD', 'buy', 0.1, terminal=222)
+        self.assertEqual(self.commands('b')[0][0], 'OPEN_ORDER')
+        self.manager.close_all_orders(terminal='a')
+        self.assertEqual(self.commands('a'), [('CLOSE_ALL_ORDERS', '')])
+        self.assertEqual(self.commands('b'), [])
+        self.manager.close_all_orders()
+        self.assertEqual(len(self.commands('a')) + len(self.commands('b')), 2)
+
+    def test_move_symbol(self):
+
+        self.manager.subscribe_symbols(['EURUSD'])
+        self.manager.add_symbols(['EURUSD'])
+        self.manager.add_symbols_bar_data([['EURUSD', 'M1']])
+        self.commands('a'), self.commands('b')
+
+        self.assertTrue(self.manager.move_symbol('EURUSD', 'b'))
+        self.assertEqual(self.manager.symbol_terminals['EURUSD'], 'b')
+        # the reference counts are moved to the new terminal.
+        self.assertEqual(self.manager.clients['a']._symbol_refs, {})
+        self.assertEqual(self.manager.clients['b']._symbol_refs, {'EURUSD': 2})
+        self.assertEqual(self.manager.clients['b'].get_subscribed_bar_data(), [['EURUSD', 'M1']])
+        self.assertEqual(self.commands('a'), [('REMOVE_SYMBOLS', 'EURUSD'),
+                                              ('REMOVE_SYMBOLS_BAR_DATA', 'EURUSD,M1')])
+        self.assertEqual(self.commands('b'), [('ADD_SYMBOLS', 'EURUSD'),
+                                              ('ADD_SYMBOLS_BAR_DATA', 'EURUSD,M1')])
+
+        # both references have to be removed on the new terminal.
+        self.manager.remove_symbols(['EURUSD'])
+        self.assertEqual(self.commands('b'), [])
+        self.manager.remove_symbols(['EURUSD'])
+        self.assertEqual(self.commands('b'), [('REMOVE_SYMBOLS', 'EURUSD')])
+
+    def test_shared_watcher(self):
+
+        self.transports['a'].push('Market_Data', json.dumps({'EURUSD': {'bid': 1.1, 'ask': 1.2}}))
+        self.transports['b'].push('Market_Data', json.dumps({'GBPUSD': {'bid': 1.3, 'ask': 1.4}}))
+        self.wait(lambda: len(self.ticks) == 2)
+        self.assertEqual(sorted(self.ticks), [('a', 'EURUSD'), ('b', 'GBPUSD')])
+        self.assertEqual(sorted(self.manager.market_data), ['EURUSD', 'GBPUSD'])
+        # no watcher threads per client.
+        for client in self.manager.clients.values():
+            self.assertFalse(client._threads_started)
+
+    def test_shared_transport(self):
+
+        with self.assertRaises(ValueError):
+            dwx_terminal_manager(self, ['', ''], transport=dwx_memory_transport())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+
+from api.dwx_trade_analytics import dwx_trade_analytics, np
+import sys
+import unittest
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the trade analytics. They do not need MetaTrader, the deals
+are given as in dwx_client.historic_trades.
+
+"""
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestDWXTradeAnalytics(unittest.TestCase):
+
+    def deal(self, time, deal_type, entry, lots, price, pnl=0.0, magic=1, symbol='EURUSD',
+             position=0, commission=0.0):
+
+        return {'magic': magic, 'symbol': symbol, 'lots': lots, 'type': deal_type, 'entry': entry,
+                'position': position, 'deal_time': time, 'deal_price': price, 'pnl': pnl,
+                'commission': commission, 'swap': 0.0, 'comment': ''}
+
+    def trips(self, deals):
+
+        # the round trips are grouped by position, not sorted by time.
+        trips = dwx_trade_analytics(deals).round_trips()
+        return sorted((int(trips['open_ticket'][i]), int(trips['close_ticket'][i]),
+                 round(float(trips['lots'][i]), 8), round(float(trips['pnl'][i]), 8))
+                for i in range(len(trips['lots'])))
+
+    def test_fifo_round_trips(self):
+
+        deals = {'1': {'type': 'balance', 'deal_time': '2024.01.01 00:00:00'},
+                 '2': self.deal('2024.01.02 10:00:00', 'buy', 'entry_in', 0.3, 1.10, commission=-3.0),
+                 '3': self.deal('2024.01.02 11:00:00', 'sell', 'entry_out', 0.1, 1.11, pnl=10.0),
+                 '4': self.deal('2024.01.02 12:00:00', 'buy', 'entry_in', 0.2, 1.12),
+                 '5': self.deal('2024.01.02 13:00:00', 'sell', 'entry_out', 0.4, 1.13, pnl=30.0),
+                 # another magic number is matched separately.
+                 '6': self.deal('2024.01.02 14:00:00', 'sell', 'entry_in', 0.1, 1.13, magic=2),
+                 '7': self.deal('2024.01.02 15:00:00', 'buy', 'entry_out', 0.1, 1.12, pnl=10.0, magic=2)}
+        self.assertEqual(self.trips(deals), [(2, 3, 0.1, 10.0), (2, 5, 0.2, 15.0), (4, 5, 0.2, 15.0),
+                                             (6, 7, 0.1, 10.0)])
+        trips = dwx_trade_analytics(deals).round_trips()
+        order = np.lexsort((trips['close_ticket'], trips['open_ticket']))
+        self.assertEqual(list(trips['type'][order]), ['buy', 'buy', 'buy', 'sell'])
+        # the commission of the entry is split by the lots.
+        self.assertEqual(list(np.round(trips['commission'][order], 8)), [-1.0, -2.0, 0.0, 0.0])
+
+    def test_positions(self):
+
+        # the exit deals have the magic number of the last opened order, not of their position.
+        deals = {'1': self.deal('2024.01.02 10:00:00', 'buy', 'entry_in', 0.1, 1.10, magic=1, position=1),
+                 '2': self.deal('2024.01.02 10:30:00', 'buy', 'entry_in', 0.1, 1.11, magic=2, position=2),
+                 '3': self.deal('2024.01.02 11:00:00', 'sell', 'entry_out', 0.1, 1.12, pnl=5.0, magic=2,
+                                position=2),
+                 '4': self.deal('2024.01.02 12:00:00', 'sell', 'entry_out', 0.1, 1.12, pnl=20.0, magic=2,
+                                position=1)}
+        self.assertEqual(self.trips(deals), [(1, 4, 0.1, 20.0), (2, 3, 0.1, 5.0)])
+        summary = dwx_trade_analytics(deals).summary('magic')
+        self.assertEqual(summary[1]['pnl'], 20.0)
+        self.assertEqual(summary[2]['pnl'], 5.0)
+        self.assertEqual(summary[1]['deals'], 2)
+
+    def test_summary_and_drawdown(self):
+
+        deals = {'1': self.deal('2024.01.01 10:00:00', 'buy', 'entry_out', 0.1, 1.1, pnl=10.0),
+                 '2': self.deal('2024.01.02 10:00:00', 'buy', 'entry_out', 0.1, 1.1, pnl=-30.0,
+                                symbol='GBPUSD'),
+                 '3': self.deal('2024.01.02 11:00:00', 'buy', 'entry_out', 0.1, 1.1, pnl=5.0, magic=2),
+                 '4': self.deal('2024.02.01 11:00:00', 'buy', 'entry_out', 0.1, 1.1, pnl=30.0)}
+        analytics = dwx_trade_analytics(deals)
+        summary = analytics.summary(('symbol', 'day'))
+        self.assertEqual(summary[('EURUSD', '2024.01.02')]['net'], 5.0)
+        self.assertEqual(summary[('GBPUSD', '2024.01.02')]['net'], -30.0)
+        self.assertEqual(analytics.summary('month')['2024.01']['pnl'], -15.0)
+        self.assertEqual(analytics.summary('week')['2024.01.01']['deals'], 3)
+
+        result = analytics.drawdown(initial=100)
+        self.assertEqual(list(result['equity']), [110, 80, 85, 115])
+        self.assertEqual(list(result['drawdown']), [0, -30, -25, 0])
+        self.assertEqual(result['max_drawdown'], -30)
+        self.assertEqual(analytics.drawdown(magic=1, symbol='EURUSD')['max_drawdown'], 0)
+
+    def test_closed_orders(self):
+
+        # MT4 sends closed orders, which are round trips already.
+        orders = {'1': {'magic': 1, 'symbol': 'EURUSD', 'lots': 0.1, 'type': 'sell',
+                        'open_time': '2024.01.02 10:00:00', 'close_time': '2024.01.02 11:00:00',
+                        'open_price': 1.1, 'close_price': 1.09, 'pnl': 10.0, 'commission': 0.0, 'swap': 0.0}}
+        analytics = dwx_trade_analytics(orders)
+        self.assertFalse(analytics.is_deals)
+        trips = analytics.round_trips()
+        self.assertEqual(list(trips['type']), ['sell'])
+        self.assertEqual(trips['open_time'][0] + 3600, trips['close_time'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+
+from api.dwx_client import dwx_client
+from api.dwx_transport import dwx_transport, dwx_memory_transport, dwx_socket_transport
+import sys
+import json
+import socket
+import unittest
+from time import sleep, monotonic
+from threading import Thread
+
+sys.path.append('../')
+
+
+"""
+
+Tests of the transports. They do not need MetaTrader, the mql server is
+simulated on the other side of the transport.
+
+"""
+
+
+class TestDWXTransport(unittest.TestCase):
+
+    def setUp(self):
+
+        self.ticks = []
+        self.stale = []
+        self.gaps = []
+        self.historic_data = []
+        self.messages = []
+
+    def on_tick(self, symbol, bid, ask):
+        self.ticks.append([symbol, bid, ask])
+
+    def on_message(self, message):
+        self.messages.append(message)
+
+    def on_stale(self, symbol, age):
+        self.stale.append(symbol)
+
+    def on_order_event(self):
+        pass
+
+    def on_sequence_gap(self, channel, gap):
+        self.gaps.append((channel, gap))
+
+    def on_historic_data(self, symbol, time_frame, data):
+        self.historic_data.append((symbol, time_frame, data))
+
+    """Returns the acknowledgement of a RESET_COMMAND_IDS command.
+    """
+
+    def ack(self, command):
+
+        fields = command[2:-2].split('|')
+        return json.dumps({'1': {'type': 'ACK', 'command': fields[1], 'token': fields[2]}})
+
+    """Starts a client on a memory transport with a simulated mql server,
+    that answers the reset and records the other commands as list of
+    fields (command ID, command, content) in self.commands.
+    """
+
+    def start_client(self, **kwargs):
+
+        self.transport = transport = dwx_memory_transport()
+        self.commands = []
+        running = [True]
+
+        def server():
+            while running[0]:
+                command = transport.pop_command()
+                if command is None:
+                    sleep(0.001)
+                elif 'RESET_COMMAND_IDS' in command:
+                    transport.push('Messages', self.ack(command))
+                else:
+                    self.commands.append(command[2:-2].split('|'))
+
+        Thread(target=server, daemon=True).start()
+        dwx = dwx_client(self, '', verbose=False, auto_connect=False, transport=transport, **kwargs)
+
+        def stop():
+            dwx.ACTIVE = False
+            running[0] = False
+
+        self.addCleanup(stop)
+        dwx.connect(timeout=1)
+        dwx.start()
+        return dwx
+
+    """Answers the reset and checks that pushed ticks are received,
+    although the poll interval is much longer than the test.
+    """
+
+    def test_memory_transport(self):
+
+        dwx = self.start_client(poll_policies={'market_data': (10, 10)})
+        transport = self.transport
+
+        start_time = monotonic()
+        transport.push('Market_Data', json.dumps({'EURUSD': {'bid': 1.1, 'ask': 1.2}}))
+        self.assertIsNotNone(dwx.wait_for_tick('EURUSD', after_version=0, timeout=1))
+        self.assertLess(monotonic() - start_time, 1)
+        self.assertEqual(self.ticks, [['EURUSD', 1.1, 1.2]])
+
+        dwx.subscribe_symbols(['EURUSD'])
+        sleep(0.1)
+        self.assertEqual(self.commands[-1][1:], ['SUBSCRIBE_SYMBOLS', 'EURUSD'])
+
+    """Connects a simulated mql server to the socket transport.
+    """
+
+    def test_socket_transport(self):
+
+        transport = dwx_socket_transport(port=0)
+        commands = []
+
+        def server():
+            connection = socket.create_connection(('127.0.0.1', transport.port))
+            buffer = b''
+            while True:
+                data = connection.recv(4096)
+                if len(data) == 0:
+                    return
+                buffer += data
+                while b'\n' in buffer:
+                    end = buffer.index(b'\n')
+                    name, size = buffer[:end].decode().split('|')
+                    if len(buffer) < end + 1 + int(size):
+                        break
+                    command = buffer[end + 1:end + 1 + int(size)].decode()
+                    buffer = buffer[end + 1 + int(size):]
+                    commands.append(command)
+                    text = self.ack(command) if 'RESET_COMMAND_IDS' in command else \
+                        json.dumps({'GBPUSD': {'bid': 1.3, 'ask': 1.4}})
+                    name = 'Messages' if 'RESET_COMMAND_IDS' in command else 'Market_Data'
+                    payload = text.encode()
+                    connection.sendall(f'{name}|{len(payload)}\n'.encode() + payload)
+
+        Thread(target=server, daemon=True).start()
+        dwx = dwx_client(self, '', verbose=False, auto_connect=False, transport=transport,
+                         poll_policies={'market_data': (10, 10)})
+        dwx.connect(timeout=2)
+        dwx.start()
+
+        start_time = monotonic()
+        dwx.subscribe_symbols(['GBPUSD'])
+        self.assertIsNotNone(dwx.wait_for_tick('GBPUSD', after_version=0, timeout=1))
+        self.assertLess(monotonic() - start_time, 1)
+        self.assertEqual(self.ticks, [['GBPUSD', 1.3, 1.4]])
+        self.assertEqual(commands[-1].split('|')[1], 'SUBSCRIBE_SYMBOLS')
+        dwx.ACTIVE = False
+        transport.close()
+
+    def test_socket_transport_timeout(self):
+
+        transport = dwx_socket_transport(port=0)
+        dwx = dwx_client(self, '', verbose=False, auto_connect=False, transport=transport)
+        with self.assertRaises(TimeoutError):
+            dwx.connect(timeout=0.1)
+        transport.close()
+
+
+    """Drops a connection that sends an invalid frame, a new connection
+    is accepted.
+    """
+
+    def test_socket_transport_invalid_frame(self):
+
+        transport = dwx_socket_transport(port=0)
+        self.addCleanup(transport.close)
+        connection = socket.create_connection(('127.0.0.1', transport.port))
+        transport.open(timeout=1)
+        connection.sendall(b'Market_Data|abc\n{}')
+        self.assertEqual(connection.recv(4096), b'')
+        connection.close()
+
+        connection = socket.create_connection(('127.0.0.1', transport.port))
+        self.addCleanup(connection.close)
+        payload = json.dumps({'EURUSD': {'bid': 1.1, 'ask': 1.2}}).encode()
+        connection.sendall(f'Market_Data|{len(payload)}\n'.encode() + payload)
+        transport.wait(1, 0)
+        self.assertEqual(transport.read('Market_Data'), payload.decode())
+
+    """Stores data in memory if a transport has no store_path().
+    """
+
+    def test_store_in_memory(self):
+
+        transport = dwx_transport()
+        self.assertEqual(transport.load('Orders_Stored'), '')
+        transport.store('Orders_Stored', '{}')
+        self.assertEqual(transport.load('Orders_Stored'), '{}')
+
+if __name__ == '__main__':
+    unittest.main()
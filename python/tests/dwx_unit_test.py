@@ -3,7 +3,6 @@ from api.dwx_client import dwx_client
 import sys
 import json
 import unittest
-from time import sleep
 from threading import Thread
 from os.path import join, exists
 from traceback import print_exc
@@ -49,8 +48,9 @@ class TestDWXConnect(unittest.TestCase):
                       'selllimit', 'buystop', 'sellstop']
 
         self.dwx = dwx_client(None, self.MT4_directory_path, sleep_delay=0.005,
-                              max_retry_command_seconds=10, verbose=False)
-        sleep(1)
+                              max_retry_command_seconds=10, verbose=False,
+                              auto_connect=False)
+        self.dwx.connect()
 
         # make sure there are no open orders when starting the test.
         if not self.close_all_orders():
@@ -72,10 +72,10 @@ class TestDWXConnect(unittest.TestCase):
         start_time = datetime.now(timezone.utc)
         now = datetime.now(timezone.utc)
         while now < start_time + timedelta(seconds=10):
-            sleep(1)
-            now = datetime.now(timezone.utc)
-            if len(self.dwx.open_orders) >= self.num_open_orders:
+            if self.dwx.wait_for_orders(lambda s: len(s.open_orders) >= self.num_open_orders,
+                                        timeout=1) is not None:
                 return True
+            now = datetime.now(timezone.utc)
             # in case there was a requote, try again:
             self.dwx.open_order(symbol=self.symbol, order_type='buy',
                                 lots=self.lots, price=0, stop_loss=0, take_profit=0,
@@ -97,11 +97,9 @@ class TestDWXConnect(unittest.TestCase):
         while now < start_time + timedelta(seconds=10):
             # sometimes it could fail if for example there is a requote. so just try again.
             self.dwx.close_all_orders()
-            sleep(1)
-            now = datetime.now(timezone.utc)
-            # print(self.dwx.open_orders)
-            if len(self.dwx.open_orders) == 0:
+            if self.dwx.wait_for_orders(lambda s: len(s.open_orders) == 0, timeout=1) is not None:
                 return True
+            now = datetime.now(timezone.utc)
 
         return False
 
@@ -111,25 +109,19 @@ class TestDWXConnect(unittest.TestCase):
     def subscribe_symbols(self):
 
         self.dwx.subscribe_symbols([self.symbol])
-        start_time = datetime.now(timezone.utc)
-        now = datetime.now(timezone.utc)
-        while now < start_time + timedelta(seconds=5):
-            now = datetime.now(timezone.utc)
-            try:
-                bid = self.dwx.market_data[self.symbol]['bid']
-                break
-            except:
-                bid = None
-            sleep(0.1)
-
-        self.assertIsInstance(bid, float)
+        # after_version=0 also returns market data from an earlier subscription.
+        tick = self.dwx.wait_for_tick(self.symbol, after_version=0, timeout=5)
+        self.assertIsNotNone(tick)
+        self.assertIsInstance(tick.values['bid'], float)
 
     """Checks if there are open orders for each order type. 
     """
 
-    def all_types_open(self):
+    def all_types_open(self, open_orders=None):
+        if open_orders is None:
+            open_orders = self.dwx.open_orders
         types_open = []
-        for ticket, order in self.dwx.open_orders.items():
+        for ticket, order in open_orders.items():
             types_open.append(order['type'])
 
         # print(types_open)
@@ -165,10 +157,9 @@ class TestDWXConnect(unittest.TestCase):
         now = datetime.now(timezone.utc)
         while now < start_time + timedelta(seconds=5):
             self.open_missing_types()
-            sleep(1)
+            ato = self.dwx.wait_for_orders(lambda s: self.all_types_open(s.open_orders),
+                                           timeout=1) is not None
             now = datetime.now(timezone.utc)
-            # print(self.dwx.open_orders)
-            ato = self.all_types_open()
             if ato:
                 break
 
@@ -194,17 +185,11 @@ class TestDWXConnect(unittest.TestCase):
                                   take_profit=tp,
                                   expiration=0)
 
-        start_time = datetime.now(timezone.utc)
-        now = datetime.now(timezone.utc)
-        while now < start_time + timedelta(seconds=5):
-            now = datetime.now(timezone.utc)
-            all_set = True
-            for ticket, order in self.dwx.open_orders.items():
-                if order['TP'] <= 0 or order['SL'] <= 0:
-                    all_set = False
-            if all_set:
-                break
-            sleep(0.1)
+        def all_set(snapshot):
+            return all(order['TP'] > 0 and order['SL'] > 0
+                       for order in snapshot.open_orders.values())
+
+        all_set = self.dwx.wait_for_orders(all_set, timeout=5) is not None
         self.assertTrue(all_set)
         return all_set
 
@@ -227,14 +212,12 @@ class TestDWXConnect(unittest.TestCase):
         now = datetime.now(timezone.utc)
         while now < start_time + timedelta(seconds=5):
             self.dwx.close_order(ticket, lots=0)
-            sleep(1)
+            snapshot = self.dwx.wait_for_orders(
+                lambda s: len(s.open_orders) == num_orders_before-1, timeout=1)
             now = datetime.now(timezone.utc)
-            try:
-                num_orders = len(self.dwx.open_orders)
-                if num_orders == num_orders_before-1:
-                    break
-            except:
-                num_orders = None
+            num_orders = len(self.dwx.open_orders)
+            if snapshot is not None:
+                break
 
         self.assertEqual(num_orders, num_orders_before-1)
 
@@ -261,23 +244,22 @@ class TestDWXConnect(unittest.TestCase):
 
         start_time = datetime.now(timezone.utc)
         now = datetime.now(timezone.utc)
+        # need to loop because the ticket will change after modification.
+        def partially_closed(snapshot):
+            return any(abs(lots_before - close_lots - order['lots']) < 0.001
+                       for order in snapshot.open_orders.values())
+
+        lots = None
         while now < start_time + timedelta(seconds=5):
             self.dwx.close_order(ticket, lots=close_lots)
-            sleep(2)
+            snapshot = self.dwx.wait_for_orders(partially_closed, timeout=2)
             now = datetime.now(timezone.utc)
-            try:
-                # need to loop because the ticket will change after modification.
-                found = False
-                for ticket, order in self.dwx.open_orders.items():
-                    lots = order['lots']
-                    if abs(lots_before - close_lots - lots) < 0.001:
-                        found = True
-                        break
-                if found:
-                    break
-            except:
-                lots = None
+            if snapshot is not None:
+                lots = [order['lots'] for order in snapshot.open_orders.values()
+                        if abs(lots_before - close_lots - order['lots']) < 0.001][0]
+                break
 
+        self.assertIsNotNone(lots)
         self.assertTrue(lots > 0)
         self.assertTrue(abs(lots_before - close_lots - lots) < 0.001)
 
@@ -291,6 +273,12 @@ class TestDWXConnect(unittest.TestCase):
         result = json.loads(result)
         self.assertIsInstance(result, dict)
 
+    """Tests that the mql server acknowledges reset_command_ids(). 
+    """
+
+    def test_reset_command_ids(self):
+        self.assertTrue(self.dwx.reset_command_ids(timeout=5))
+
     """Tests the test_load_orders(). 
     """
 
@@ -373,10 +361,9 @@ class TestDWXConnect(unittest.TestCase):
         start_time = datetime.now(timezone.utc)
         now = datetime.now(timezone.utc)
         while now < start_time + timedelta(seconds=10):
-            sleep(1)
-            now = datetime.now(timezone.utc)
-            if len(self.dwx.open_orders) == 0:
+            if self.dwx.wait_for_orders(lambda s: len(s.open_orders) == 0, timeout=1) is not None:
                 break
+            now = datetime.now(timezone.utc)
             self.dwx.close_orders_by_symbol(self.symbol)
         self.assertEqual(len(self.dwx.open_orders), 0)
 
@@ -396,32 +383,39 @@ class TestDWXConnect(unittest.TestCase):
         start_time = datetime.now(timezone.utc)
         now = datetime.now(timezone.utc)
         while now < start_time + timedelta(seconds=10):
-            sleep(1)
-            now = datetime.now(timezone.utc)
-            if len(self.dwx.open_orders) == 0:
+            if self.dwx.wait_for_orders(lambda s: len(s.open_orders) == 0, timeout=1) is not None:
                 break
+            now = datetime.now(timezone.utc)
             self.dwx.close_orders_by_magic(self.magic_number)
         self.assertEqual(len(self.dwx.open_orders), 0)
 
+    """Tests add_symbols() and remove_symbols() with reference counting. 
+    """
+
+    def test_add_remove_symbols(self):
+        self.dwx.subscribe_symbols([])
+        self.dwx.add_symbols([self.symbol])
+        self.dwx.add_symbols([self.symbol])
+        self.assertIsNotNone(self.dwx.wait_for_tick(self.symbol, after_version=0, timeout=5))
+
+        # still subscribed after the first remove_symbols().
+        self.dwx.remove_symbols([self.symbol])
+        self.assertEqual(self.dwx.get_subscribed_symbols(), [self.symbol])
+        self.dwx.remove_symbols([self.symbol])
+        self.assertEqual(self.dwx.get_subscribed_symbols(), [])
+        # a market data file written before the removal can still contain the symbol.
+        self.assertIsNotNone(self.dwx.wait_for(
+            'market_data', lambda: self.symbol not in self.dwx.market_data, timeout=5))
+
     """Tests the subscribe_symbols_bar_data() function. 
     """
 
     def test_subscribe_symbols_bar_data(self):
         time_frame = 'M1'
         self.dwx.subscribe_symbols_bar_data([[self.symbol, time_frame]])
-        start_time = datetime.now(timezone.utc)
-        now = datetime.now(timezone.utc)
-        while now < start_time + timedelta(seconds=5):
-            sleep(0.1)
-            now = datetime.now(timezone.utc)
-            try:
-                # no need to check the length since it would trigger an exception if not found.
-                bar_data = self.dwx.bar_data[self.symbol + '_' + time_frame]
-                # print(bar_data)
-                break
-            except:
-                bar_data = None
-        self.assertIsInstance(bar_data, dict)
+        bar = self.dwx.wait_for_bar(self.symbol, time_frame, after_version=0, timeout=5)
+        self.assertIsNotNone(bar)
+        self.assertIsInstance(bar.bar, dict)
 
     """Tests the get_historic_data() function. 
     """
@@ -429,24 +423,42 @@ class TestDWXConnect(unittest.TestCase):
     def test_get_historic_data(self):
 
         time_frame = 'D1'
+        version = self.dwx.get_version('historic_data', self.symbol + '_' + time_frame)
         self.dwx.get_historic_data(self.symbol, time_frame=time_frame,
                                    start=(datetime.now(timezone.utc) -
                                           timedelta(days=30)).timestamp(),
                                    end=datetime.now(timezone.utc).timestamp())
-        start_time = datetime.now(timezone.utc)
-        now = datetime.now(timezone.utc)
-        while now < start_time + timedelta(seconds=5):
-            sleep(0.1)
-            now = datetime.now(timezone.utc)
-            try:
-                historic_data = self.dwx.historic_data[self.symbol +
-                                                       '_' + time_frame]
-                # print(historic_data)
-                break
-            except:
-                historic_data = None
+        historic_data = self.dwx.wait_for_historic_data(self.symbol, time_frame,
+                                                        after_version=version, timeout=5)
         self.assertIsInstance(historic_data, dict)
 
 
+    """Tests the get_historic_data_many() function. 
+    """
+
+    def test_get_historic_data_many(self):
+
+        time_frames = ['D1', 'H1']
+        results = self.dwx.get_historic_data_many(
+            [[self.symbol, time_frame] for time_frame in time_frames], timeout=10)
+        for time_frame in time_frames:
+            self.assertIsInstance(results[self.symbol + '_' + time_frame], dict)
+            self.assertGreater(len(results[self.symbol + '_' + time_frame]), 0)
+
+    """Tests the sync_historic_trades() function. A second sync only 
+    returns the deals after the last ticket in the deal store. 
+    """
+
+    def test_sync_historic_trades(self):
+
+        self.dwx.sync_historic_trades(30).result(timeout=10)
+        last_ticket = self.dwx.deal_store.last_ticket
+
+        # a second sync should only return newer deals.
+        new_deals = self.dwx.sync_historic_trades(30).result(timeout=10)
+        for ticket in new_deals:
+            self.assertGreater(int(ticket), last_ticket)
+
+
 if __name__ == '__main__':
     unittest.main()